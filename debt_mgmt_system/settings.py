@@ -56,6 +56,9 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'debtapp.middleware.ShardMiddleware',
+    'debtapp.middleware.ReplicaPinningMiddleware',
+    'debtapp.middleware.AuditMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     #Social Media Login 
@@ -64,7 +67,7 @@ MIDDLEWARE = [
 ]
 
 AUTHENTICATION_BACKENDS = [
-    'social_core.backends.google.GoogleOAuth2',
+    'debtapp.backends.GoogleOAuth2',  # social_core's GoogleOAuth2 + async user lookup
     'django.contrib.auth.backends.ModelBackend',
  ]
 
@@ -105,11 +108,83 @@ DATABASES = {
         'NAME': config('DB_NAME'),
         'USER': config('DB_USER'),
         'PASSWORD': config('DB_PASSWORD'),
-        'HOST': 'localhost',
-        'PORT': config('DB_PORT')
+        'HOST': config('DB_HOST', default='localhost'),
+        'PORT': config('DB_PORT'),
+        # Persistent connections: seconds a connection is reused across requests (0 = close after each request)
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', cast=int, default=0),
+        # Ping a reused connection before the first query of a request and reconnect if it died
+        'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', cast=bool, default=False),
+        'OPTIONS': {},
     }
 }
 
+# Connection pooling (needs psycopg 3 + psycopg-pool).
+# The pool replaces persistent connections, so CONN_MAX_AGE must stay 0.
+if config('DB_POOL', cast=bool, default=False):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': config('DB_POOL_MIN_SIZE', cast=int, default=2),
+        'max_size': config('DB_POOL_MAX_SIZE', cast=int, default=10),
+        'timeout': config('DB_POOL_TIMEOUT', cast=int, default=10),
+    }
+
+# Read replica for reports and exports (optional).
+# Without DB_REPLICA_NAME every query goes to 'default'.
+if config('DB_REPLICA_NAME', default=''):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': config('DB_REPLICA_NAME'),
+        'USER': config('DB_REPLICA_USER', default=DATABASES['default']['USER']),
+        'PASSWORD': config('DB_REPLICA_PASSWORD', default=DATABASES['default']['PASSWORD']),
+        'HOST': config('DB_REPLICA_HOST', default=DATABASES['default']['HOST']),
+        'PORT': config('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Creditor sharding (optional): DB_SHARD_NAMES lists more databases, on the
+# primary's server unless DB_SHARD<n>_HOST/_PORT say otherwise. Each creditor's
+# debtors and transactions live on one of 'default' and these; see debtapp.sharding.
+SHARD_DATABASES = ['default']
+_shard_names = [name.strip() for name in config('DB_SHARD_NAMES', default='').split(',') if name.strip()]
+for index, name in enumerate(_shard_names, 1):
+    DATABASES[f'shard{index}'] = {
+        **DATABASES['default'],
+        'NAME': name,
+        'HOST': config(f'DB_SHARD{index}_HOST', default=DATABASES['default']['HOST']),
+        'PORT': config(f'DB_SHARD{index}_PORT', default=DATABASES['default']['PORT']),
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+    }
+    SHARD_DATABASES.append(f'shard{index}')
+
+DATABASE_ROUTERS = ['debtapp.routers.ShardRouter', 'debtapp.routers.ReplicaRouter']
+REPLICA_DATABASE = 'replica'
+# Seconds a user keeps reading from the primary after a write (read-your-writes)
+REPLICA_PIN_SECONDS = config('DB_REPLICA_PIN_SECONDS', cast=int, default=5)
+
+# Live dashboard (Server-Sent Events, ASGI only)
+DASHBOARD_EVENTS_POLL_SECONDS = config('DASHBOARD_EVENTS_POLL_SECONDS', cast=float, default=2)
+DASHBOARD_EVENTS_STREAM_SECONDS = config('DASHBOARD_EVENTS_STREAM_SECONDS', cast=int, default=300)
+
+# Dashboard tables are cached per creditor and ledger version
+DASHBOARD_FRAGMENT_CACHE_SECONDS = config('DASHBOARD_FRAGMENT_CACHE_SECONDS', cast=int, default=600)
+
+# Audit events older than this are deleted by prune_audit_log
+AUDIT_RETENTION_DAYS = config('AUDIT_RETENTION_DAYS', cast=int, default=730)
+
+# A repeated form POST with the same idempotency key is replayed for this long
+IDEMPOTENCY_KEY_TTL_HOURS = config('IDEMPOTENCY_KEY_TTL_HOURS', cast=int, default=24)
+
+# archive_transactions moves the transactions of debtors recovered longer ago than this
+ARCHIVE_AFTER_DAYS = config('ARCHIVE_AFTER_DAYS', cast=int, default=365)
+
+# partition_transactions keeps this many future monthly transaction partitions (PostgreSQL, once converted)
+PARTITION_MONTHS_AHEAD = config('PARTITION_MONTHS_AHEAD', cast=int, default=3)
+
+# Generated exports are kept on disk per ledger version; least recently used files go beyond this size
+EXPORT_CACHE_DIR = config('EXPORT_CACHE_DIR', default=str(BASE_DIR / 'export_cache'))
+EXPORT_CACHE_MAX_MB = config('EXPORT_CACHE_MAX_MB', cast=int, default=512)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, Debtor, Transaction 
+from .models import AuditEvent, CustomUser, Debtor, InterestAccrual, InterestTerms, Transaction
 
 class CustomUserAdmin(UserAdmin):
     # Add new fields to the admin form
@@ -26,9 +26,38 @@ class TransactionAdmin(admin.ModelAdmin):
     search_fields = ('debtor__name', 'tran_desc')
     readonly_fields = ('tran_date',)
 
+# Interest admin
+class InterestTermsAdmin(admin.ModelAdmin):
+    list_display = ('debtor', 'annual_rate', 'compounding', 'grace_days', 'is_active')
+    list_filter = ('compounding', 'is_active')
+    search_fields = ('debtor__name', 'debtor__debtor_id')
+
+class InterestAccrualAdmin(admin.ModelAdmin):
+    list_display = ('debtor', 'accrual_date', 'amount', 'transaction')
+    list_filter = ('accrual_date',)
+    search_fields = ('debtor__name', 'debtor__debtor_id')
+    raw_id_fields = ('debtor', 'transaction')
+
+# Audit admin (read-only: events are append-only)
+class AuditEventAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'actor_name', 'action', 'debtor_code')
+    list_filter = ('action',)
+    search_fields = ('=debtor_code', '=actor_name')
+    date_hierarchy = 'created_at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 # Register models
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(Debtor, DebtorAdmin)
 admin.site.register(Transaction, TransactionAdmin)
-
-
+admin.site.register(InterestTerms, InterestTermsAdmin)
+admin.site.register(InterestAccrual, InterestAccrualAdmin)
+admin.site.register(AuditEvent, AuditEventAdmin)
@@ -0,0 +1,151 @@
+"""
+Receivables aging.
+
+Credits are allocated to a debtor's debits first-in, first-out: with D the
+running total of debits in date order and C the debtor's credits to date, a
+debit of amount A is still open for min(A, max(D - C, 0)). Every open part is
+aged from the day of its debit (the debtor's debt_date for the opening debit)
+and summed into 0-30, 31-60, 61-90 and 90+ day buckets.
+
+The whole computation is one SQL query with window functions, so it runs on
+the database however many transactions a creditor has; Python only sees one
+row per debtor with an outstanding balance.
+"""
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connections, router
+from django.utils import timezone
+
+from .models import Transaction
+
+BUCKETS = (
+    ('days_0_30', '0-30 days'),
+    ('days_31_60', '31-60 days'),
+    ('days_61_90', '61-90 days'),
+    ('days_90_plus', '90+ days'),
+)
+CENTS = Decimal('0.01')
+
+# {tran_day}: a transaction's local date, {age}: whole days between %(as_of)s and aged_on.
+_VENDOR_SQL = {
+    'postgresql': {
+        'tran_day': 'CAST(t.tran_date AT TIME ZONE %(tz)s AS date)',
+        'age': 'CAST(%(as_of)s AS date) - o.aged_on',
+    },
+    'sqlite': {
+        # Django's own function, as used for __date lookups; date() would give the UTC day
+        'tran_day': 'django_datetime_cast_date(t.tran_date, %(tz)s, %(conn_tz)s)',
+        'age': 'CAST(julianday(%(as_of)s) - julianday(o.aged_on) AS integer)',
+    },
+    'mysql': {
+        'tran_day': "DATE(CONVERT_TZ(t.tran_date, 'UTC', %(tz)s))",
+        'age': 'DATEDIFF(%(as_of)s, o.aged_on)',
+    },
+}
+
+# Only what was on the books on as_of counts: transactions before %(until)s
+# (the start of the next local day), and the opening debit, which is dated by
+# its debtor's debt_date, when that is not after as_of. The opening debit is
+# the debtor's first row, numbered before zero debits (the opening row of a
+# debtor created without debt) are dropped.
+AGING_SQL = """
+WITH ledger_rows AS (
+    SELECT t.debtor_id, t.id, t.tran_date, t.debit_amount, d.debt_date,
+           ROW_NUMBER() OVER (PARTITION BY t.debtor_id ORDER BY t.tran_date, t.id) AS n
+      FROM debtapp_transaction t
+      JOIN debtapp_debtor d ON d.id = t.debtor_id
+     WHERE d.created_by_id = %(creditor)s AND d.is_delete = %(false)s
+),
+debits AS (
+    SELECT t.debtor_id,
+           t.debit_amount AS amount,
+           CASE WHEN t.n = 1 THEN t.debt_date ELSE {tran_day} END AS aged_on,
+           SUM(t.debit_amount) OVER (
+               PARTITION BY t.debtor_id ORDER BY t.tran_date, t.id ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+           ) AS running_debit
+      FROM ledger_rows t
+     WHERE t.debit_amount > 0
+       AND ((t.n = 1 AND t.debt_date <= %(as_of)s) OR (t.n > 1 AND t.tran_date < %(until)s))
+),
+credits AS (
+    SELECT t.debtor_id, SUM(t.credit_amount) AS paid
+      FROM debtapp_transaction t
+      JOIN debtapp_debtor d ON d.id = t.debtor_id
+     WHERE d.created_by_id = %(creditor)s AND d.is_delete = %(false)s AND t.credit_amount > 0
+       AND t.tran_date < %(until)s
+     GROUP BY t.debtor_id
+),
+open_debits AS (
+    SELECT db.debtor_id,
+           db.aged_on,
+           CASE WHEN db.running_debit - COALESCE(c.paid, 0) <= 0 THEN 0
+                WHEN db.running_debit - COALESCE(c.paid, 0) < db.amount THEN db.running_debit - COALESCE(c.paid, 0)
+                ELSE db.amount END AS open_amount
+      FROM debits db
+      LEFT JOIN credits c ON c.debtor_id = db.debtor_id
+),
+aged AS (
+    SELECT o.debtor_id, o.aged_on, o.open_amount, {age} AS age
+      FROM open_debits o
+     WHERE o.open_amount > 0
+)
+SELECT d.id, d.debtor_id, d.name, d.mobile,
+       MIN(a.aged_on) AS oldest_unpaid,
+       SUM(CASE WHEN a.age <= 30 THEN a.open_amount ELSE 0 END) AS days_0_30,
+       SUM(CASE WHEN a.age > 30 AND a.age <= 60 THEN a.open_amount ELSE 0 END) AS days_31_60,
+       SUM(CASE WHEN a.age > 60 AND a.age <= 90 THEN a.open_amount ELSE 0 END) AS days_61_90,
+       SUM(CASE WHEN a.age > 90 THEN a.open_amount ELSE 0 END) AS days_90_plus,
+       SUM(a.open_amount) AS outstanding
+  FROM aged a
+  JOIN debtapp_debtor d ON d.id = a.debtor_id
+ GROUP BY d.id, d.debtor_id, d.name, d.mobile
+ ORDER BY MIN(a.aged_on), d.name
+"""
+
+
+def _money(value):
+    return Decimal(str(value or 0)).quantize(CENTS)
+
+
+def aging_report(creditor, as_of=None):
+    """
+    Aging of `creditor`'s non-deleted debtors on `as_of` (default today).
+
+    Returns (rows, totals): one dict per debtor with an outstanding balance,
+    oldest unpaid debit first, and a dict with the bucket sums.
+    """
+    as_of = as_of or timezone.localdate()
+    connection = connections[router.db_for_read(Transaction)]
+    try:
+        vendor_sql = _VENDOR_SQL[connection.vendor]
+    except KeyError:
+        raise NotImplementedError(f"Aging report is not implemented for {connection.vendor}.")
+
+    sql = AGING_SQL.format(**vendor_sql)
+    until = timezone.make_aware(datetime.combine(as_of + timedelta(days=1), time.min))
+    params = {
+        'creditor': creditor.pk,
+        'false': False,
+        'as_of': as_of,
+        'until': connection.ops.adapt_datetimefield_value(until),
+        'tz': timezone.get_current_timezone_name(),
+        'conn_tz': connection.timezone_name,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [col[0] for col in cursor.description]
+        rows = [dict(zip(columns, values)) for values in cursor.fetchall()]
+
+    totals = {key: Decimal(0) for key, _ in BUCKETS}
+    totals['outstanding'] = Decimal(0)
+    for row in rows:
+        if isinstance(row['oldest_unpaid'], str):
+            # SQLite returns dates as text
+            row['oldest_unpaid'] = date.fromisoformat(row['oldest_unpaid'][:10])
+        row['days_outstanding'] = (as_of - row['oldest_unpaid']).days
+        for key in totals:
+            row[key] = _money(row[key])
+            totals[key] += row[key]
+    return rows, totals
+
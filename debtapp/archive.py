@@ -0,0 +1,260 @@
+"""
+Cold storage for the ledgers of long-recovered debtors.
+
+A debtor that is `recovered`, owes nothing and has had no transaction for
+ARCHIVE_AFTER_DAYS only keeps its ledger for reference. `manage.py
+archive_transactions` moves such ledgers out of the Transaction table into
+one TransactionArchive row per debtor: the rows as zlib-compressed JSON
+lines, plus the figures the app reads without decoding them (balance, total
+debits and credits, sums per month).
+
+Reads go through transactions_for() (aarchived_transactions() from async
+views), which returns the archived rows as unsaved Transaction instances, so
+the debtor pages and exports show the same ledger either way. restore() puts
+the rows back with their original ids and tran_ids; add_transaction does it
+before a new transaction is posted, `manage.py restore_archived` on demand.
+
+Moving rows is not a change to the ledger, so both directions skip the
+transaction signals: the balance snapshots keep their values (and
+debtapp.balances adds archived rows wherever it scans the table), and
+rollups.compute_month() adds the archived months back in. Full-text search
+and the aging and forecast reports only see hot rows; an archived debtor
+owes nothing, so its balance is unaffected.
+"""
+import json
+import zlib
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db.models import Exists, F, Max, OuterRef, Sum
+from django.utils import timezone
+
+from . import ledger, rollups, sharding, signals
+from .interest import TRAN_ID_PREFIX
+from .models import Debtor, InterestAccrual, Transaction, TransactionArchive
+
+BATCH_DEBTORS = 200
+
+FIELDS = (
+    'id', 'tran_id', 'tran_type', 'debit_amount', 'credit_amount', 'tran_amount', 'current_debt',
+    'tran_desc', 'tran_medium', 'tran_voucher', 'tran_date', 'updated_at', 'recorded_by_id',
+)
+DECIMAL_FIELDS = ('debit_amount', 'credit_amount', 'tran_amount', 'current_debt')
+DATE_FIELDS = ('tran_date', 'updated_at')
+
+
+def archive_after_days():
+    return getattr(settings, 'ARCHIVE_AFTER_DAYS', 365)
+
+
+def _number_holders():
+    # New tran_ids are numbered from the newest 'Txn' row and the highest
+    # interest row, so those must stay in the table.
+    newest = Transaction.objects.filter(tran_id__startswith='Txn').order_by('-id')
+    highest_interest = Transaction.objects.filter(tran_id__startswith=TRAN_ID_PREFIX).order_by('-tran_id')
+    return [
+        debtor_id
+        for queryset in (newest, highest_interest)
+        for debtor_id in queryset.values_list('debtor_id', flat=True)[:1]
+    ]
+
+
+def candidates(days=None):
+    """Recovered debtors owing nothing with no transaction in the last `days` days, not archived yet."""
+    cutoff = timezone.now() - timedelta(days=archive_after_days() if days is None else days)
+    return (
+        Debtor.objects.filter(debtor_status='recovered')
+        .exclude(Exists(TransactionArchive.objects.filter(debtor=OuterRef('pk'))))
+        .exclude(pk__in=_number_holders())
+        .annotate(
+            last_date=Max('transactions__tran_date'),
+            owed=Sum(F('transactions__debit_amount') - F('transactions__credit_amount')),
+        )
+        .filter(last_date__lt=cutoff, owed=0)
+        .order_by('pk')
+    )
+
+
+def _plain(row):
+    row = dict(row)
+    for name in DECIMAL_FIELDS:
+        row[name] = str(row[name])
+    for name in DATE_FIELDS:
+        # isoformat() keeps the microseconds, DjangoJSONEncoder would not
+        row[name] = row[name].isoformat()
+    return row
+
+
+def _rows(data):
+    """Decode an archive's data into row dicts of FIELDS (plus 'accrual'), in ledger order."""
+    for line in zlib.decompress(bytes(data)).decode().splitlines():
+        row = json.loads(line)
+        for name in DECIMAL_FIELDS:
+            row[name] = Decimal(row[name])
+        for name in DATE_FIELDS:
+            row[name] = datetime.fromisoformat(row[name])
+        yield row
+
+
+def _pack(debtor_id, rows, accruals):
+    months = {}
+    for row in rows:
+        if row['id'] in accruals:
+            row['accrual'] = accruals[row['id']]
+        month = rollups.month_of(row['tran_date']).isoformat()
+        debit, credit, recoveries = months.get(month, (0, 0, 0))
+        months[month] = [
+            debit + row['debit_amount'],
+            credit + row['credit_amount'],
+            recoveries + (1 if row['credit_amount'] > 0 and row['current_debt'] <= 0 else 0),
+        ]
+    data = "\n".join(json.dumps(_plain(row), separators=(',', ':')) for row in rows)
+    return TransactionArchive(
+        debtor_id=debtor_id,
+        row_count=len(rows),
+        total_debit=sum(row['debit_amount'] for row in rows),
+        total_credit=sum(row['credit_amount'] for row in rows),
+        balance=rows[-1]['current_debt'],
+        first_date=rows[0]['tran_date'],
+        last_date=rows[-1]['tran_date'],
+        months=months,
+        data=zlib.compress(data.encode(), 9),
+    )
+
+
+def archive_batch(debtor_ids, days=None):
+    """Archive those of `debtor_ids` that are still candidates. Returns (debtors, transactions) archived."""
+    with sharding.atomic():
+        # Same lock add_transaction takes, so no transaction is added while we move the ledger
+        list(Debtor.objects.select_for_update().filter(pk__in=debtor_ids).values_list('pk', flat=True))
+        ids = list(candidates(days).filter(pk__in=debtor_ids).values_list('pk', flat=True))
+        if not ids:
+            return 0, 0
+        accruals = dict(
+            InterestAccrual.objects.filter(transaction__debtor_id__in=ids).values_list('transaction_id', 'pk')
+        )
+        rows = Transaction.objects.filter(debtor_id__in=ids).order_by('debtor_id', 'tran_date', 'id').values(
+            'debtor_id', *FIELDS,
+        )
+        archives = [
+            _pack(debtor_id, [{name: row[name] for name in FIELDS} for row in group], accruals)
+            for debtor_id, group in groupby(rows, key=itemgetter('debtor_id'))
+        ]
+        TransactionArchive.objects.bulk_create(archives)
+        with signals.suspended():
+            # Nothing reads the deleted instances, so don't load their columns
+            Transaction.objects.filter(debtor_id__in=ids).only('pk').delete()
+        for creditor_id in set(Debtor.objects.filter(pk__in=ids).values_list('created_by_id', flat=True)):
+            ledger.bump_version(creditor_id)
+    return len(archives), sum(item.row_count for item in archives)
+
+
+def archive(days=None, batch_size=BATCH_DEBTORS):
+    """Archive every candidate, `batch_size` debtors per transaction. Returns (debtors, transactions) archived."""
+    ids = list(candidates(days).values_list('pk', flat=True))
+    debtors = rows = 0
+    for start in range(0, len(ids), batch_size):
+        archived = archive_batch(ids[start:start + batch_size], days)
+        debtors += archived[0]
+        rows += archived[1]
+    return debtors, rows
+
+
+def is_archived(debtor_pk):
+    return TransactionArchive.objects.filter(debtor_id=debtor_pk).exists()
+
+
+def _instances(debtor_pk, data):
+    if data is None:
+        return []
+    transactions = []
+    for row in _rows(data):
+        row.pop('accrual', None)
+        transactions.append(Transaction(debtor_id=debtor_pk, **row))
+    return transactions
+
+
+def archived_transactions(debtor_pk):
+    """A debtor's archived transactions as unsaved instances in ledger order; [] when not archived."""
+    data = TransactionArchive.objects.filter(debtor_id=debtor_pk).values_list('data', flat=True).first()
+    return _instances(debtor_pk, data)
+
+
+async def aarchived_transactions(debtor_pk):
+    """archived_transactions() for async views; recorded_by is not loaded."""
+    data = await TransactionArchive.objects.filter(debtor_id=debtor_pk).values_list('data', flat=True).afirst()
+    return _instances(debtor_pk, data)
+
+
+def transactions_for(debtor):
+    """A debtor's transactions in ledger order with recorded_by loaded, from the archive if it is archived."""
+    transactions = list(
+        Transaction.objects.filter(debtor=debtor).select_related('recorded_by').order_by('tran_date', 'id')
+    )
+    if transactions:
+        return transactions
+    transactions = archived_transactions(debtor.pk)
+    users = get_user_model().objects.in_bulk({t.recorded_by_id for t in transactions} - {None})
+    for t in transactions:
+        t.recorded_by = users.get(t.recorded_by_id)
+    return transactions
+
+
+def all_archived_transactions(chunk_size=100):
+    """Every archived transaction with debtor and recorded_by loaded, newest ledger first, each newest row first."""
+    users = {}
+    archives = TransactionArchive.objects.select_related('debtor').order_by('-last_date', 'pk')
+    for archived in archives.iterator(chunk_size=chunk_size):
+        transactions = _instances(archived.debtor_id, archived.data)
+        missing = {t.recorded_by_id for t in transactions} - users.keys() - {None}
+        if missing:
+            found = get_user_model().objects.in_bulk(missing)
+            users.update({pk: found.get(pk) for pk in missing})
+        for t in reversed(transactions):
+            t.debtor = archived.debtor
+            t.recorded_by = users.get(t.recorded_by_id)
+            yield t
+
+
+def restore(debtor):
+    """Move an archived debtor's transactions back into the table. Returns how many, 0 if it was not archived."""
+    with sharding.atomic():
+        archived = TransactionArchive.objects.select_for_update().filter(debtor=debtor).first()
+        if archived is None:
+            return 0
+        rows = list(_rows(archived.data))
+        taken = list(
+            Transaction.objects.filter(tran_id__in=[row['tran_id'] for row in rows])
+            .values_list('tran_id', flat=True)[:5]
+        )
+        if taken:
+            raise ValidationError(f"Cannot restore {debtor}: transaction ids {', '.join(taken)} are in use.")
+
+        users = set(
+            get_user_model().objects.filter(pk__in={row['recorded_by_id'] for row in rows} - {None})
+            .values_list('pk', flat=True)
+        )
+        accruals, transactions = [], []
+        for row in rows:
+            accrual = row.pop('accrual', None)
+            if accrual is not None:
+                accruals.append(InterestAccrual(pk=accrual, transaction_id=row['id']))
+            if row['recorded_by_id'] not in users:
+                row['recorded_by_id'] = None  # the user was deleted meanwhile
+            transactions.append(Transaction(debtor_id=debtor.pk, **row))
+
+        # bulk_create skips the signals and keeps the ids, but stamps
+        # tran_date and updated_at with the current time
+        Transaction.objects.bulk_create(transactions)
+        for t, row in zip(transactions, rows):
+            t.tran_date, t.updated_at = row['tran_date'], row['updated_at']
+        Transaction.objects.bulk_update(transactions, ['tran_date', 'updated_at'], batch_size=500)
+        InterestAccrual.objects.bulk_update(accruals, ['transaction'], batch_size=500)
+        archived.delete()
+        ledger.bump_version(debtor.created_by_id)
+    return len(transactions)
@@ -0,0 +1,183 @@
+"""
+Audit trail of changes to debtors.
+
+Views call `record()` for edits, opening balance resets, deletes, restores
+and purges. Events are not written where they happen:
+
+- each event waits for the surrounding database transaction to commit
+  (`transaction.on_commit`), so a rolled back change leaves no trace; in
+  autocommit that is immediately
+- committed events are buffered for the request by AuditMiddleware and
+  written with one bulk INSERT after the view has returned, whatever number
+  of events the request produced
+
+Outside a request (shell, management commands) committed events are written
+straight away.
+
+AuditEvent rows are never updated. `manage.py prune_audit_log` deletes events
+past the retention period and compacts older runs of edits.
+"""
+from contextvars import ContextVar
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+
+from . import sharding
+from .routers import active_shard
+from .models import AuditEvent
+
+_buffer = ContextVar('audit_buffer', default=None)
+
+HISTORY_LIMIT = 20
+PRUNE_BATCH = 5000
+
+
+def record(action, *, actor=None, debtor=None, **details):
+    """Log `action` on `debtor` by `actor` (None: the system) once the current transaction commits."""
+    event = AuditEvent(
+        action=action,
+        actor=actor if actor is not None and actor.is_authenticated else None,
+        actor_name=actor.get_username() if actor is not None and actor.is_authenticated else '',
+        debtor_ref=getattr(debtor, 'pk', None),
+        debtor_code=getattr(debtor, 'debtor_id', '') or '',
+        details=details,
+    )
+    buffer = _buffer.get()
+
+    def committed():
+        if buffer is None:
+            AuditEvent.objects.bulk_create([event])
+        else:
+            buffer.append(event)
+
+    transaction.on_commit(committed, using=active_shard())
+
+
+def changes(form, prefix=''):
+    """{field: [old, new]} for the fields a bound model form changed."""
+    return {
+        f"{prefix}{name}": [_plain(form.initial.get(name)), _plain(form.cleaned_data.get(name))]
+        for name in form.changed_data
+    }
+
+
+def _plain(value):
+    # Files are logged by name; other values are serialized by DjangoJSONEncoder.
+    if isinstance(value, FieldFile) or hasattr(value, 'read'):
+        return getattr(value, 'name', None) or None
+    return value
+
+
+def start():
+    """Start buffering this request's events; pass the token to flush()."""
+    return _buffer.set([])
+
+
+def _take(token):
+    events = _buffer.get()
+    _buffer.reset(token)
+    return events
+
+
+def flush(token):
+    events = _take(token)
+    if events:
+        AuditEvent.objects.bulk_create(events)
+
+
+async def aflush(token):
+    events = _take(token)
+    if events:
+        await AuditEvent.objects.abulk_create(events)
+
+
+def for_debtor(debtor_pk):
+    """A debtor's events, newest first (served by the (debtor_ref, created_at) index)."""
+    return AuditEvent.objects.filter(debtor_ref=debtor_pk).order_by('-created_at', '-id')
+
+
+def by_actor(user):
+    """A user's events, newest first (served by the (actor, created_at) index)."""
+    return AuditEvent.objects.filter(actor=user).order_by('-created_at', '-id')
+
+
+def retention_days():
+    return getattr(settings, 'AUDIT_RETENTION_DAYS', 730)
+
+
+def prune(older_than_days, batch_size=PRUNE_BATCH):
+    """Delete the events older than `older_than_days`, a batch at a time. Returns how many."""
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    deleted = 0
+    while True:
+        batch = list(
+            AuditEvent.objects.filter(created_at__lt=cutoff).order_by('created_at')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            return deleted
+        deleted += AuditEvent.objects.filter(pk__in=batch).delete()[0]
+
+
+def compact(older_than_days, batch_size=PRUNE_BATCH):
+    """
+    Merge the edits of a debtor by one actor on one day, older than
+    `older_than_days`, into a single event that keeps each field's first old
+    and last new value. Returns how many events were removed.
+    """
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    edits = AuditEvent.objects.filter(
+        action='debtor_edited', created_at__lt=cutoff, debtor_ref__isnull=False,
+    ).order_by('debtor_ref', 'actor_name', 'created_at', 'id')
+    removed, last_ref = 0, -1
+    # Keyset pages of whole debtors, each read to the end before it is
+    # rewritten, so no cursor is open on the table while it changes
+    while True:
+        page = list(edits.filter(debtor_ref__gt=last_ref)[:batch_size])
+        if not page:
+            return removed
+        if len(page) == batch_size:
+            # The page's last debtor may go on past it: leave it for the next
+            # page, or when it fills the page alone, read all of it
+            tail = page[-1].debtor_ref
+            if page[0].debtor_ref == tail:
+                page = list(edits.filter(debtor_ref=tail))
+            else:
+                page = [event for event in page if event.debtor_ref != tail]
+        last_ref = page[-1].debtor_ref
+        removed += _compact_page(page)
+
+
+def _compact_page(events):
+    """Merge the runs among `events` (whole debtors, in compact()'s order). Returns how many were removed."""
+    def run_key(event):
+        return event.debtor_ref, event.actor_name, timezone.localdate(event.created_at)
+
+    merged, superseded = [], []
+    for _, run in groupby(events, key=run_key):
+        run = list(run)
+        if len(run) < 2:
+            continue
+        fields = {}
+        for event in run:
+            for name, (old, new) in event.details.get('changes', {}).items():
+                fields[name] = [fields[name][0] if name in fields else old, new]
+        last = run[-1]
+        merged.append(AuditEvent(
+            created_at=last.created_at, actor_id=last.actor_id, actor_name=last.actor_name,
+            debtor_ref=last.debtor_ref, debtor_code=last.debtor_code, action=last.action,
+            details={
+                'changes': fields,
+                'compacted': sum(event.details.get('compacted', 1) for event in run),
+            },
+        ))
+        superseded += [event.pk for event in run]
+    if not merged:
+        return 0
+    with sharding.atomic():
+        AuditEvent.objects.bulk_create(merged)
+        return AuditEvent.objects.filter(pk__in=superseded).delete()[0] - len(merged)
@@ -0,0 +1,9 @@
+from asgiref.sync import sync_to_async
+from social_core.backends.google import GoogleOAuth2 as BaseGoogleOAuth2
+
+
+class GoogleOAuth2(BaseGoogleOAuth2):
+    """Google login backend that can also load the session user from async views."""
+
+    async def aget_user(self, user_id):
+        return await sync_to_async(self.get_user)(user_id)
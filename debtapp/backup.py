@@ -0,0 +1,79 @@
+"""
+Full backup: every dump of debtapp.dumps (users, debtors, transactions and
+the per-creditor and per-debtor summaries) in one ZIP file.
+
+The dumps are built at the same time, one per worker process (see
+debtapp.parallel), each into a gzipped CSV in a temporary directory. The ZIP
+stores those files as they are, in the order they finish, so the download
+starts with the first finished dump and the whole takes about as long as the
+slowest one. A ZIP of CSVs rather than one workbook, because an XLSX sheet
+holds at most 1,048,576 rows, fewer than a large transaction table.
+"""
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+
+from . import dumps, parallel
+
+SHEETS = ('users', 'debtors', 'transactions', 'creditor_summary', 'debtor_summary')
+READ_CHUNK = 1024 * 1024
+
+
+def default_workers():
+    return min(len(SHEETS), parallel.default_workers())
+
+
+def build(task):
+    """Write one dump to `directory`/<name>.csv.gz; returns (name, path, seconds). Runs in a worker."""
+    name, directory = task
+    started = time.perf_counter()
+    path = os.path.join(directory, f"{name}.csv.gz")
+    with open(path, 'wb') as handle:
+        for chunk in dumps.dump(name, compress=True):
+            handle.write(chunk)
+    return name, path, time.perf_counter() - started
+
+
+class _Sink:
+    """Write-only file for ZipFile that hands out what was written so far."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def zip_chunks(workers=None, on_built=None):
+    """
+    Iterate the backup ZIP as chunks of bytes. `on_built(name, seconds)` is
+    called as each dump finishes.
+    """
+    directory = tempfile.mkdtemp(prefix='debt-backup-')
+    try:
+        sink = _Sink()
+        # No compression: the members are gzipped already
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+            tasks = [(name, directory) for name in SHEETS]
+            for name, path, seconds in parallel.run(build, tasks, workers or default_workers()):
+                if on_built is not None:
+                    on_built(name, seconds)
+                info = zipfile.ZipInfo.from_file(path, os.path.basename(path))
+                with open(path, 'rb') as source, archive.open(info, 'w') as member:
+                    while block := source.read(READ_CHUNK):
+                        member.write(block)
+                        yield from sink.drain()
+                os.unlink(path)
+        yield from sink.drain()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
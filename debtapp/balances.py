@@ -0,0 +1,293 @@
+"""
+Daily balance snapshots and point-in-time balances.
+
+DebtorDailyBalance and CreditorDailyBalance hold the running debit and credit
+totals at the end of each day that had transactions. A point-in-time question
+is answered from the latest row on or before the date plus a scan of the
+transactions after it (and of rows on the snapshot day above its
+`last_tran_id` watermark, e.g. from bulk inserts), instead of aggregating the
+whole history.
+
+A new transaction is added to its day's rows as it is saved; transactions are
+stamped with the current time, so that is always the latest day. Code that
+inserts transactions in bulk calls absorb_bulk() instead (invalidate_bulk()
+when they are dated on a past day). Editing or
+deleting a transaction drops the rows from its day onwards; reads then fall
+back to the previous snapshot until new transactions or
+`manage.py rebuild_balance_snapshots` fill the gap again.
+
+Archived ledgers (debtapp.archive) count as if their rows were still in the
+table: the scans after a snapshot and rebuild() add them in. An archive lying
+wholly inside a scanned range adds its stored totals; one that straddles the
+range's ends, which archived ledgers, being old, rarely do, is decoded.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from heapq import merge
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import IntegrityError
+from django.db.models import DecimalField, F, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.utils import timezone
+
+from . import archive, ledger, sharding
+from .models import CreditorDailyBalance, DebtorDailyBalance, Transaction, TransactionArchive
+
+ZERO = Value(0, output_field=DecimalField(max_digits=14, decimal_places=2))
+REBUILD_BATCH = 5000
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _scopes(creditor_id=None, debtor_id=None):
+    """(snapshot queryset, owner fields, transactions queryset, archives queryset) for each given owner."""
+    scopes = []
+    if debtor_id is not None:
+        scopes.append((
+            DebtorDailyBalance.objects.filter(debtor_id=debtor_id),
+            {'debtor_id': debtor_id},
+            Transaction.objects.filter(debtor_id=debtor_id),
+            TransactionArchive.objects.filter(debtor_id=debtor_id),
+        ))
+    if creditor_id is not None:
+        scopes.append((
+            CreditorDailyBalance.objects.filter(creditor_id=creditor_id),
+            {'creditor_id': creditor_id},
+            Transaction.objects.filter(debtor__created_by_id=creditor_id),
+            TransactionArchive.objects.filter(debtor__created_by_id=creditor_id),
+        ))
+    return scopes
+
+
+def _totals(snapshots, transactions, archives, day):
+    """Totals at the end of `day`: nearest snapshot plus the transactions after it."""
+    snapshot = snapshots.filter(day__lte=day).order_by('-day').first()
+    end = _day_start(day + timedelta(days=1))
+    rows = transactions.filter(tran_date__lt=end)
+    archives = archives.filter(first_date__lt=end)
+    totals = {'total_debit': Decimal(0), 'total_credit': Decimal(0), 'last_tran_id': 0}
+    # Archives before `day` with no row on the snapshot's day can be added whole
+    whole = Q(last_date__lt=_day_start(day))
+    after = None
+    if snapshot is not None:
+        totals = {
+            'total_debit': snapshot.total_debit,
+            'total_credit': snapshot.total_credit,
+            'last_tran_id': snapshot.last_tran_id,
+        }
+        after = _day_start(snapshot.day + timedelta(days=1))
+        rows = rows.filter(tran_date__gte=_day_start(snapshot.day)).filter(
+            Q(tran_date__gte=after) | Q(id__gt=snapshot.last_tran_id)
+        )
+        archives = archives.filter(last_date__gte=_day_start(snapshot.day))
+        whole &= Q(first_date__gte=after)
+
+    delta = rows.aggregate(
+        debit=Coalesce(Sum('debit_amount'), ZERO),
+        credit=Coalesce(Sum('credit_amount'), ZERO),
+        last_id=Max('id'),
+    )
+    archived = archives.filter(whole).aggregate(
+        debit=Coalesce(Sum('total_debit'), ZERO),
+        credit=Coalesce(Sum('total_credit'), ZERO),
+    )
+    totals['total_debit'] += delta['debit'] + archived['debit']
+    totals['total_credit'] += delta['credit'] + archived['credit']
+    totals['last_tran_id'] = max(totals['last_tran_id'], delta['last_id'] or 0)
+    for data in archives.exclude(whole).values_list('data', flat=True):
+        for row in archive._rows(data):
+            # The same test the query above applies to the table's rows
+            if row['tran_date'] >= end or (
+                snapshot is not None and row['tran_date'] < after
+                and (row['tran_date'] < _day_start(snapshot.day) or row['id'] <= snapshot.last_tran_id)
+            ):
+                continue
+            totals['total_debit'] += row['debit_amount']
+            totals['total_credit'] += row['credit_amount']
+            totals['last_tran_id'] = max(totals['last_tran_id'], row['id'])
+    totals['balance'] = totals['total_debit'] - totals['total_credit']
+    return totals
+
+
+def totals_as_of(day, *, creditor=None, debtor=None):
+    """
+    Total debit, total credit and balance of a creditor's book or of one debtor
+    at the end of `day`, as a dict.
+    """
+    if (creditor is None) == (debtor is None):
+        raise ValueError("Pass exactly one of creditor or debtor.")
+    [(snapshots, _, transactions, archives)] = _scopes(
+        creditor_id=getattr(creditor, 'pk', None), debtor_id=getattr(debtor, 'pk', None),
+    )
+    return _totals(snapshots, transactions, archives, day)
+
+
+def balance_as_of(day, *, creditor=None, debtor=None):
+    """Outstanding balance of a creditor's book or of one debtor at the end of `day`."""
+    return totals_as_of(day, creditor=creditor, debtor=debtor)['balance']
+
+
+def record_transaction(tran):
+    """Add a newly saved transaction to its day's debtor and creditor snapshots."""
+    day = timezone.localdate(tran.tran_date)
+    for snapshots, owner, transactions, archives in _scopes(ledger.creditor_id_for(tran), tran.debtor_id):
+        if _add_to_day(snapshots, day, tran):
+            continue
+        # First transaction of the day for this owner: start the row from the
+        # previous snapshot plus everything since (this transaction included).
+        totals = _totals(snapshots, transactions, archives, day)
+        try:
+            with sharding.atomic():
+                snapshots.model.objects.create(
+                    day=day,
+                    total_debit=totals['total_debit'],
+                    total_credit=totals['total_credit'],
+                    last_tran_id=totals['last_tran_id'],
+                    **owner,
+                )
+        except IntegrityError:
+            # A concurrent transaction created the row first; it cannot have
+            # seen this uncommitted transaction, so add it on top.
+            _add_to_day(snapshots, day, tran)
+
+
+def _add_to_day(snapshots, day, tran):
+    return snapshots.filter(day=day).update(
+        total_debit=F('total_debit') + tran.debit_amount,
+        total_credit=F('total_credit') + tran.credit_amount,
+        last_tran_id=Greatest('last_tran_id', Value(tran.pk)),
+    )
+
+
+def invalidate_from(tran):
+    """Drop snapshots a changed or deleted transaction makes stale."""
+    day = timezone.localdate(tran.tran_date)
+    for snapshots, _, _, _ in _scopes(ledger.creditor_id_for(tran), tran.debtor_id):
+        snapshots.filter(day__gte=day).delete()
+
+
+def absorb_bulk(day, *, debtor_ids=(), creditor_ids=()):
+    """
+    Fold transactions bulk-inserted on `day`, which skip the signals, into that
+    day's existing snapshot rows of the given owners, with one UPDATE per
+    snapshot table. Owners without a row for `day` need nothing: reads and
+    the next record_transaction() pick the rows up from the older snapshot.
+    """
+    start, end = _day_start(day), _day_start(day + timedelta(days=1))
+    for model, owner_field, ids, tran_owner in (
+        (DebtorDailyBalance, 'debtor_id', debtor_ids, 'debtor_id'),
+        (CreditorDailyBalance, 'creditor_id', creditor_ids, 'debtor__created_by_id'),
+    ):
+        if not ids:
+            continue
+        new_rows = (
+            Transaction.objects.filter(
+                tran_date__gte=start, tran_date__lt=end, id__gt=OuterRef('last_tran_id'),
+                **{tran_owner: OuterRef(owner_field)},
+            )
+            .order_by()
+            .values(tran_owner)
+        )
+
+        def new_total(aggregate):
+            return Subquery(new_rows.annotate(total=aggregate).values('total'))
+
+        model.objects.filter(day=day, **{f'{owner_field}__in': ids}).update(
+            total_debit=F('total_debit') + Coalesce(new_total(Sum('debit_amount')), ZERO),
+            total_credit=F('total_credit') + Coalesce(new_total(Sum('credit_amount')), ZERO),
+            last_tran_id=Coalesce(new_total(Max('id')), F('last_tran_id')),
+        )
+
+
+def invalidate_bulk(day, *, debtor_ids=(), creditor_ids=()):
+    """invalidate_from() for transactions bulk-inserted on a past `day`."""
+    DebtorDailyBalance.objects.filter(debtor_id__in=debtor_ids, day__gte=day).delete()
+    CreditorDailyBalance.objects.filter(creditor_id__in=creditor_ids, day__gte=day).delete()
+
+
+def rebuild(creditor=None):
+    """Recompute the snapshots of one creditor (or everyone) from the transactions, archived ones included."""
+    transactions = Transaction.objects.all()
+    archives = TransactionArchive.objects.all()
+    debtor_snapshots = DebtorDailyBalance.objects.all()
+    creditor_snapshots = CreditorDailyBalance.objects.all()
+    if creditor is not None:
+        transactions = transactions.filter(debtor__created_by=creditor)
+        archives = archives.filter(debtor__created_by=creditor)
+        debtor_snapshots = debtor_snapshots.filter(debtor__created_by=creditor)
+        creditor_snapshots = creditor_snapshots.filter(creditor=creditor)
+
+    daily = transactions.annotate(day=TruncDate('tran_date'))
+    with sharding.atomic():
+        debtor_snapshots.delete()
+        creditor_snapshots.delete()
+        created = _bulk_running_totals(
+            DebtorDailyBalance, 'debtor_id', daily.values('debtor_id', 'day'),
+            _archived_days(archives, 'debtor_id', 'debtor_id'),
+        )
+        created += _bulk_running_totals(
+            CreditorDailyBalance, 'creditor_id',
+            daily.filter(debtor__created_by__isnull=False).values('day', creditor_id=F('debtor__created_by_id')),
+            _archived_days(archives.filter(debtor__created_by__isnull=False), 'creditor_id', 'debtor__created_by_id'),
+        )
+    return created
+
+
+def _archived_days(archives, owner_field, owner_lookup):
+    """Per-day sums of the archived rows, in the shape and order of _bulk_running_totals()'s rows."""
+    days = {}
+    for owner, data in archives.values_list(owner_lookup, 'data').iterator(chunk_size=100):
+        for row in archive._rows(data):
+            key = (owner, timezone.localdate(row['tran_date']))
+            debit, credit, last_id = days.get(key, (0, 0, 0))
+            days[key] = (debit + row['debit_amount'], credit + row['credit_amount'], max(last_id, row['id']))
+    return [
+        {owner_field: owner, 'day': day, 'debit': debit, 'credit': credit, 'last_id': last_id}
+        for (owner, day), (debit, credit, last_id) in sorted(days.items())
+    ]
+
+
+def _bulk_running_totals(model, owner_field, grouped, archived=()):
+    """Turn per-day sums (one row per owner and day) into running-total snapshot rows."""
+    rows = (
+        grouped.annotate(debit=Sum('debit_amount'), credit=Sum('credit_amount'), last_id=Max('id'))
+        .order_by(owner_field, 'day')
+    )
+    batch, created = [], 0
+    owner, total_debit, total_credit = None, Decimal(0), Decimal(0)
+    by_day = itemgetter(owner_field, 'day')
+    for _, same_day in groupby(merge(rows.iterator(chunk_size=REBUILD_BATCH), archived, key=by_day), key=by_day):
+        row = _sum_days(list(same_day))
+        if row[owner_field] != owner:
+            owner, total_debit, total_credit = row[owner_field], Decimal(0), Decimal(0)
+        total_debit += row['debit']
+        total_credit += row['credit']
+        batch.append(model(**{
+            owner_field: owner,
+            'day': row['day'],
+            'total_debit': total_debit,
+            'total_credit': total_credit,
+            'last_tran_id': row['last_id'],
+        }))
+        if len(batch) == REBUILD_BATCH:
+            model.objects.bulk_create(batch)
+            created += len(batch)
+            batch = []
+    model.objects.bulk_create(batch)
+    return created + len(batch)
+
+
+def _sum_days(rows):
+    """One row from a day's table and archive rows of the same owner."""
+    if len(rows) == 1:
+        return rows[0]
+    return {
+        **rows[0],
+        'debit': sum(row['debit'] for row in rows),
+        'credit': sum(row['credit'] for row in rows),
+        'last_id': max(row['last_id'] for row in rows),
+    }
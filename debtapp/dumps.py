@@ -0,0 +1,274 @@
+"""
+CSV dumps of all users, debtors and transactions, and summaries per creditor
+and per debtor, for the admin exports and the full backup (debtapp.backup).
+
+The XLSX exports turn every row into model instances and cells; these dumps
+stream CSV instead. On PostgreSQL the rows come from
+`COPY (SELECT ...) TO STDOUT WITH (FORMAT csv)` and the server's bytes go
+into the response as they are, without becoming Python objects. Other
+backends read the same SELECT with values_list() in chunks and write it with
+the csv module, in the same format: timestamps in local time with their UTC
+offset, booleans as t/f, NULL as an empty field. (COPY also quotes empty
+strings, "", to tell them from NULL; the csv module cannot.) Either way the
+SELECT is built by the ORM from COLUMNS.
+
+Transactions include the archived ledgers (debtapp.archive), which are
+decoded in Python after the live rows. With sharding every shard is dumped,
+one after the other; see sharding.merged().
+"""
+import csv
+import io
+import zlib
+from collections import Counter
+from contextvars import copy_context
+from datetime import datetime
+from functools import reduce
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+from django.db.models import BooleanField, Count, DecimalField, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import archive, sharding
+from .models import Debtor, Transaction
+
+# (header, lookup) per dump; the headers are those of the XLSX exports
+COLUMNS = {
+    'users': (
+        ("User ID", 'id'), ("Username", 'username'), ("First Name", 'first_name'), ("Last Name", 'last_name'),
+        ("Email", 'email'), ("Mobile", 'mobile'), ("Address", 'address'), ("Date Joined", 'date_joined'),
+        ("Last Login", 'last_login'), ("Is Active", 'is_active'), ("Is Staff", 'is_staff'),
+        ("Is Superuser", 'is_superuser'), ("Total Debtors", 'debtor_count'),
+    ),
+    'debtors': (
+        ("Debtor ID", 'debtor_id'), ("Name", 'name'), ("Mobile", 'mobile'), ("Address", 'address'),
+        ("Status", 'debtor_status'), ("Initial Debt", 'initial_debt'), ("Total Debt", 'total_debt'),
+        ("Debt Date", 'debt_date'), ("Purpose", 'debt_purpose'), ("Payment Method", 'payment_method'),
+        ("Voucher/Cheque No", 'voucher_cheque_no'), ("Created By", 'created_by__username'),
+        ("Created At", 'created_at'), ("Updated At", 'updated_at'), ("Is Active", 'is_active'),
+    ),
+    'transactions': (
+        ("Transaction ID", 'tran_id'), ("Debtor ID", 'debtor__debtor_id'), ("Debtor Name", 'debtor__name'),
+        ("Transaction Type", 'tran_type'), ("Debit Amount", 'debit_amount'), ("Credit Amount", 'credit_amount'),
+        ("Transaction Amount", 'tran_amount'), ("Current Debt", 'current_debt'), ("Description", 'tran_desc'),
+        ("Payment Method", 'tran_medium'), ("Transaction Date", 'tran_date'),
+        ("Recorded By", 'recorded_by__username'), ("Updated At", 'updated_at'),
+    ),
+    'creditor_summary': (
+        ("Creditor ID", 'created_by'), ("Username", 'created_by__username'), ("Debtors", 'debtors'),
+        ("Active Debtors", 'active_debtors'), ("Recovered Debtors", 'recovered_debtors'),
+        ("Deleted Debtors", 'deleted_debtors'), ("Outstanding Debt", 'outstanding_debt'),
+    ),
+    'debtor_summary': (
+        ("Debtor ID", 'debtor_id'), ("Debtor Name", 'name'), ("Mobile", 'mobile'), ("Status", 'debtor_status'),
+        ("Created By", 'created_by__username'), ("Debt Date", 'debt_date'), ("Total Debt", 'total_debt'),
+        ("Transactions", 'transaction_count'), ("Total Debit", 'total_debit'), ("Total Credit", 'total_credit'),
+        ("Last Transaction", 'last_transaction'),
+    ),
+}
+ZERO = Value(0, output_field=DecimalField(max_digits=14, decimal_places=2))
+CHUNK_ROWS = 5000
+CHUNK_BYTES = 64 * 1024
+GZIP_LEVEL = 5
+
+_END = object()
+
+
+def _users():
+    debtors = (
+        Debtor.objects.filter(created_by=OuterRef('pk')).order_by()
+        .values('created_by').annotate(count=Count('pk')).values('count')
+    )
+    return get_user_model().objects.annotate(
+        debtor_count=Coalesce(Subquery(debtors, output_field=IntegerField()), 0),
+    ).order_by('id')
+
+
+def _debtors():
+    # Deleted debtors are left out, so all of them are active
+    return Debtor.objects.filter(is_delete=False).annotate(
+        is_active=Value(True, output_field=BooleanField()),
+    ).order_by('id')
+
+
+def _transactions():
+    return Transaction.objects.order_by('id')
+
+
+def _creditor_summary():
+    # Grouped by the creditor; every creditor's debtors are on one shard
+    live = Q(is_delete=False)
+    return Debtor.objects.values('created_by', 'created_by__username').annotate(
+        debtors=Count('id'),
+        active_debtors=Count('id', filter=live & Q(debtor_status='active')),
+        recovered_debtors=Count('id', filter=live & Q(debtor_status='recovered')),
+        deleted_debtors=Count('id', filter=Q(is_delete=True)),
+        outstanding_debt=Coalesce(Sum('total_debt', filter=live), ZERO),
+    ).order_by('created_by')
+
+
+def _debtor_summary():
+    # Archived debtors have no transactions left, only their archive's totals
+    return Debtor.objects.filter(is_delete=False).annotate(
+        transaction_count=Count('transactions') + Coalesce('transaction_archive__row_count', 0),
+        total_debit=Coalesce(Sum('transactions__debit_amount'), 'transaction_archive__total_debit', ZERO),
+        total_credit=Coalesce(Sum('transactions__credit_amount'), 'transaction_archive__total_credit', ZERO),
+        last_transaction=Coalesce(Max('transactions__tran_date'), 'transaction_archive__last_date'),
+    ).order_by('-total_debt', 'name')
+
+
+QUERYSETS = {
+    'users': _users,
+    'debtors': _debtors,
+    'transactions': _transactions,
+    'creditor_summary': _creditor_summary,
+    'debtor_summary': _debtor_summary,
+}
+
+
+def rows_queryset(name):
+    """values_list() queryset of dump `name`, one tuple per CSV row."""
+    return QUERYSETS[name]().values_list(*(lookup for _, lookup in COLUMNS[name]))
+
+
+def can_copy(alias):
+    return connections[alias].vendor == 'postgresql' and is_psycopg3
+
+
+def _text(value, tz):
+    """A value as COPY writes it in CSV; None stays None (an empty field)."""
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        text = value.astimezone(tz).isoformat(' ')
+        stamp, offset = text[:-6], text[-6:]
+        if '.' in stamp:
+            stamp = stamp.rstrip('0')
+        return stamp + (offset[:3] if offset.endswith(':00') else offset)
+    return value
+
+
+def _write(rows):
+    """CSV bytes of `rows` (tuples), in chunks of about CHUNK_BYTES."""
+    tz = timezone.get_current_timezone()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    for row in rows:
+        writer.writerow([_text(value, tz) for value in row])
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def copy(queryset):
+    """CSV bytes of `queryset` straight from COPY ... TO STDOUT, in chunks of about CHUNK_BYTES."""
+    alias = queryset.db
+    connection = connections[alias]
+    sql, params = queryset.query.get_compiler(using=alias).as_sql()
+    # SET LOCAL needs a transaction; it makes COPY write timestamps in local time
+    with transaction.atomic(using=alias), connection.cursor() as cursor:
+        cursor.execute("SELECT set_config('TimeZone', %s, true)", [timezone.get_current_timezone_name()])
+        with cursor.cursor.copy(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv)", params) as stream:
+            buffer = bytearray()
+            for data in stream:
+                buffer += data
+                if len(buffer) >= CHUNK_BYTES:
+                    yield bytes(buffer)
+                    buffer.clear()
+            if buffer:
+                yield bytes(buffer)
+        # SET LOCAL lasts to the end of an enclosing transaction, whose later
+        # queries Django would read as UTC
+        cursor.execute("SELECT set_config('TimeZone', %s, true)", [connection.timezone_name])
+
+
+def fetch(queryset):
+    """CSV bytes of `queryset` read with values_list() in chunks, the fallback for copy()."""
+    return _write(queryset.iterator(chunk_size=CHUNK_ROWS))
+
+
+def _archived_rows():
+    lookups = [lookup.split('__') for _, lookup in COLUMNS['transactions']]
+    for t in archive.all_archived_transactions():
+        yield tuple(reduce(lambda obj, attr: getattr(obj, attr, None), path, t) for path in lookups)
+
+
+def _shard_dump(name):
+    """The rows of dump `name` on the active shard."""
+    queryset = rows_queryset(name)
+    yield from (copy(queryset) if can_copy(queryset.db) else fetch(queryset))
+    if name == 'transactions':
+        yield from _write(_archived_rows())
+
+
+def _debtor_counts():
+    return dict(Debtor.objects.order_by().values_list('created_by').annotate(count=Count('id')))
+
+
+def _users_dump():
+    if not sharding.enabled():
+        yield from _shard_dump('users')
+        return
+    # The debtors are on the shards, the users on the directory
+    counts = Counter()
+    for _, shard_counts in sharding.fan_out(_debtor_counts):
+        counts.update(shard_counts)
+    users = get_user_model().objects.order_by('id').values_list(*(lookup for _, lookup in COLUMNS['users'][:-1]))
+    yield from _write(row + (counts[row[0]],) for row in users.iterator(chunk_size=CHUNK_ROWS))
+
+
+def gzipped(chunks):
+    """`chunks` of bytes compressed to a gzip stream."""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def dump(name, compress=False):
+    """
+    Iterate the CSV of dump `name` (a key of COLUMNS) as chunks of bytes,
+    header first; gzip-compressed when `compress`.
+    """
+    def chunks():
+        yield from _write([[header for header, _ in COLUMNS[name]]])
+        if name == 'users':
+            yield from _users_dump()
+        else:
+            # The shards' rows arrive as chunks of CHUNK_BYTES already
+            yield from sharding.merged(lambda: _shard_dump(name), chunk_size=1)
+
+    return gzipped(chunks()) if compress else chunks()
+
+
+def streamed(chunks, asynchronous=False):
+    """
+    `chunks` for a StreamingHttpResponse. The response is iterated after the
+    view has returned, so the routing it set up (@use_replica, the active
+    shard) is captured here and put back for every chunk. Under ASGI this
+    returns an async iterator, which Django would otherwise read to the end
+    before sending anything.
+    """
+    context = copy_context()
+
+    def step():
+        return context.run(next, chunks, _END)
+
+    if not asynchronous:
+        return iter(step, _END)
+
+    async def achunks():
+        # thread_sensitive: every chunk on the same thread, which holds the connection
+        step_in_thread = sync_to_async(step, thread_sensitive=True)
+        while (chunk := await step_in_thread()) is not _END:
+            yield chunk
+
+    return achunks()
@@ -0,0 +1,160 @@
+"""
+Disk cache for generated export files.
+
+A cached export is keyed by its kind, its scope (one creditor, or global for
+the admin exports), its parameters and a version stamp of the data behind it:
+the creditor's LedgerVersion, or for global exports a stamp over every
+creditor's. Writes bump those versions (see debtapp.ledger), so a repeat
+download after no change is served from the file, and after a change the key
+is new and the export is built again. Nothing is ever invalidated; stale
+files are simply not asked for again and age out. Since a file is served
+for as long as the ledger stays the same, a cached export must not show
+the time it was built, neither in its body nor in its filename.
+
+The key also serves as the ETag, so a browser revalidating its copy gets a
+304 without the file even being opened.
+
+Files live in EXPORT_CACHE_DIR, one per export: a JSON line with the
+response headers, then the body. Hits refresh the file's mtime, and after
+each write the least recently used files are deleted until the directory
+holds at most EXPORT_CACHE_MAX_MB.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+from django.http import FileResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from . import ledger, sharding
+from .models import LedgerVersion
+
+CREDITOR = 'creditor'
+GLOBAL = 'global'
+SUFFIX = '.export'
+HEADERS = ('Content-Type', 'Content-Disposition')
+
+
+def cache_dir():
+    return Path(getattr(settings, 'EXPORT_CACHE_DIR', Path(settings.BASE_DIR) / 'export_cache'))
+
+
+def _max_bytes():
+    return getattr(settings, 'EXPORT_CACHE_MAX_MB', 512) * 1024 * 1024
+
+
+def _shard_stamp():
+    # Versions only grow, and a deleted creditor's row takes its version
+    # along; with the highest id the three change on every bump, add or delete.
+    return LedgerVersion.objects.aggregate(rows=Count('id'), total=Sum('version'), last=Max('id'))
+
+
+def global_stamp():
+    """Stamp of every creditor's ledger version, on all shards."""
+    return [stamp for _, stamp in sharding.fan_out(_shard_stamp)]
+
+
+def key_for(kind, scope, owner, params, stamp):
+    payload = json.dumps([kind, scope, owner, params, stamp], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def _path(key):
+    return cache_dir() / f"{key}{SUFFIX}"
+
+
+def load(key):
+    """FileResponse for a cached export, or None if it is not (or no longer) on disk."""
+    path = _path(key)
+    try:
+        handle = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    try:
+        headers = json.loads(handle.readline())
+        os.utime(path)
+    except (ValueError, OSError):
+        handle.close()
+        return None
+    # FileResponse sends the rest of the file, from after the header line
+    response = FileResponse(handle)
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+def store(key, response):
+    """Save a built export's body and headers, then evict down to EXPORT_CACHE_MAX_MB."""
+    directory = cache_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    headers = {name: response[name] for name in HEADERS if response.has_header(name)}
+    # Written aside and renamed, so a concurrent reader never sees half a file
+    descriptor, temp_name = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as handle:
+            handle.write(json.dumps(headers).encode() + b'\n')
+            handle.write(response.content)
+        os.replace(temp_name, _path(key))
+    except BaseException:
+        os.unlink(temp_name)
+        raise
+    evict()
+
+
+def evict(max_bytes=None):
+    """Delete the least recently used exports until the rest fit in `max_bytes`. Returns how many were deleted."""
+    max_bytes = _max_bytes() if max_bytes is None else max_bytes
+    entries = []
+    for path in cache_dir().glob(f'*{SUFFIX}'):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    deleted = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        deleted += 1
+    return deleted
+
+
+def cached(kind, scope=GLOBAL, params=None):
+    """
+    Serve a sync export view from the cache. `params(request)` returns the
+    request's parameters that change the output (None when they are invalid,
+    to leave the request to the view); creditor-scoped exports are per user.
+    Only successful, non-streamed responses are stored.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapper(request, *args, **kwargs):
+            values = params(request) if params is not None else ()
+            if values is None or (scope == CREDITOR and not request.user.is_authenticated):
+                return view_func(request, *args, **kwargs)
+            if scope == CREDITOR:
+                owner, stamp = request.user.pk, ledger.get_version(request.user.pk)
+            else:
+                owner, stamp = None, global_stamp()
+            key = key_for(kind, scope, owner, values, stamp)
+            etag = f'"{key}"'
+
+            response = get_conditional_response(request, etag=etag) or load(key)
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming:
+                    return response
+                store(key, response)
+            response['ETag'] = etag
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return _wrapper
+    return decorator
@@ -0,0 +1,167 @@
+"""
+Recovery forecasting.
+
+Projects, for every active debtor of a creditor, when the balance will be
+paid off and how much cash to expect per week, from the debtor's own credit
+history: the average payment and the average interval between payments.
+
+The engine loads the creditor's ledger in one values_list pass into NumPy
+arrays (no model instances) and computes every debtor at once with grouped
+array operations, so the cost is a single query plus a handful of vector
+passes whether the book has a hundred or a hundred thousand debtors. Only the
+weekly cash expands debtors into one element per expected payment, so it
+goes through the book in chunks of debtors to bound that array's size.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast, TruncDate
+from django.utils import timezone
+
+from .models import Debtor, Transaction
+
+HORIZON_WEEKS = 26
+MAX_HORIZON_WEEKS = 104
+
+# Payment events expanded at once when bucketing the expected cash by week
+EVENTS_PER_CHUNK = 1_000_000
+
+STATUS_FORECAST = 'forecast'
+STATUS_ONE_PAYMENT = 'one payment only'
+STATUS_NO_PAYMENTS = 'no payments yet'
+
+
+def _active_debtors(creditor):
+    return Debtor.objects.filter(created_by=creditor, is_delete=False, debtor_status='active')
+
+
+def _load_ledger(creditor):
+    """
+    Debtor ids, transaction days (proleptic ordinals) and signed amounts
+    (credit - debit) as arrays sorted by debtor.
+    """
+    rows = list(
+        Transaction.objects.filter(debtor__in=_active_debtors(creditor))
+        .order_by('debtor_id')
+        .values_list('debtor_id', TruncDate('tran_date'), Cast(F('credit_amount') - F('debit_amount'), FloatField()))
+    )
+    count = len(rows)
+    return (
+        np.fromiter((row[0] for row in rows), dtype=np.int64, count=count),
+        np.fromiter((row[1].toordinal() for row in rows), dtype=np.int64, count=count),
+        np.fromiter((row[2] for row in rows), dtype=float, count=count),
+    )
+
+
+def _event_chunks(events):
+    """
+    Indices of the debtors with events, split into runs of about
+    EVENTS_PER_CHUNK events (a debtor has at most one a day of the horizon).
+    """
+    with_events = np.flatnonzero(events)
+    ends = np.cumsum(events[with_events])
+    total = int(ends[-1]) if len(ends) else 0
+    splits = np.searchsorted(ends, np.arange(EVENTS_PER_CHUNK, total, EVENTS_PER_CHUNK), side='right')
+    return np.split(with_events, np.unique(splits))
+
+
+def forecast_book(creditor, as_of=None, horizon_weeks=HORIZON_WEEKS):
+    """
+    Forecast every active debtor of `creditor`.
+
+    Returns a dict with:
+      debtors: one dict per debtor with a positive balance, soonest payoff first
+               (debtors without a usable payment history last)
+      weeks:   [(week_start, expected_cash)] for `horizon_weeks` weeks from `as_of`
+      totals:  balance, debtors, forecastable debtors and cash within the horizon
+    """
+    as_of = as_of or timezone.localdate()
+    debtor_ids, day_numbers, amounts = _load_ledger(creditor)
+
+    # Group boundaries: rows are sorted by debtor, one group per debtor.
+    owners, starts = np.unique(debtor_ids, return_index=True)
+    balance = -np.add.reduceat(amounts, starts) if len(owners) else np.zeros(0)
+
+    # Credit cadence: count, total, first and last payment day per debtor.
+    is_credit = amounts > 0
+    group = np.searchsorted(owners, debtor_ids)
+    n_credits = np.bincount(group[is_credit], minlength=len(owners))
+    paid = np.bincount(group[is_credit], weights=amounts[is_credit], minlength=len(owners))
+    never = np.iinfo(np.int64).max
+    first_paid = np.full(len(owners), never)
+    last_paid = np.full(len(owners), -never)
+    np.minimum.at(first_paid, group[is_credit], day_numbers[is_credit])
+    np.maximum.at(last_paid, group[is_credit], day_numbers[is_credit])
+
+    owing = balance > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_payment = np.where(n_credits > 0, paid / np.maximum(n_credits, 1), 0.0)
+        interval = np.where(
+            n_credits > 1, np.maximum((last_paid - first_paid) / np.maximum(n_credits - 1, 1), 1.0), 0.0,
+        )
+    forecastable = owing & (n_credits > 1) & (avg_payment > 0)
+
+    # Next payment: one interval after the last one, or today if overdue.
+    today_number = as_of.toordinal()
+    next_day = np.where(forecastable, np.maximum(last_paid + np.rint(interval), today_number), 0).astype(np.int64)
+    payments_left = np.where(forecastable, np.ceil(balance / np.where(avg_payment > 0, avg_payment, 1)), 0)
+    payoff_day = np.where(forecastable, next_day + np.rint((payments_left - 1) * interval), 0).astype(np.int64)
+
+    # Expected cash per week: expand each debtor's remaining payments inside
+    # the horizon into individual events and bucket them by week.
+    horizon_days = horizon_weeks * 7
+    in_horizon = forecastable & (next_day < today_number + horizon_days)
+    events = np.zeros(len(owners), dtype=np.int64)
+    events[in_horizon] = np.minimum(
+        payments_left[in_horizon],
+        np.floor((today_number + horizon_days - 1 - next_day[in_horizon]) / interval[in_horizon]) + 1,
+    ).astype(np.int64)
+    weekly = np.zeros(horizon_weeks)
+    for chunk in _event_chunks(events):
+        counts = events[chunk]
+        owner_of_event = np.repeat(chunk, counts)
+        k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        event_day = next_day[owner_of_event] + np.rint(k * interval[owner_of_event])
+        event_amount = np.minimum(avg_payment[owner_of_event], balance[owner_of_event] - k * avg_payment[owner_of_event])
+        weekly += np.bincount(
+            ((event_day - today_number) // 7).astype(np.int64), weights=event_amount, minlength=horizon_weeks,
+        )[:horizon_weeks]
+
+    names = {row[0]: row[1:] for row in _active_debtors(creditor).values_list('pk', 'debtor_id', 'name', 'mobile')}
+
+    debtors = []
+    for i in np.flatnonzero(owing):
+        debtor_id, name, mobile = names.get(int(owners[i]), ('', '', ''))
+        ok = bool(forecastable[i])
+        if ok:
+            status = STATUS_FORECAST
+        elif n_credits[i] == 1:
+            status = STATUS_ONE_PAYMENT
+        else:
+            status = STATUS_NO_PAYMENTS
+        debtors.append({
+            'id': int(owners[i]),
+            'debtor_id': debtor_id,
+            'name': name,
+            'mobile': mobile,
+            'balance': round(float(balance[i]), 2),
+            'payments': int(n_credits[i]),
+            'avg_payment': round(float(avg_payment[i]), 2),
+            'interval_days': round(float(interval[i]), 1) if ok else None,
+            'last_payment': date.fromordinal(int(last_paid[i])) if n_credits[i] else None,
+            'next_payment': date.fromordinal(int(next_day[i])) if ok else None,
+            'payments_left': int(payments_left[i]) if ok else None,
+            'payoff_date': date.fromordinal(int(payoff_day[i])) if ok else None,
+            'status': status,
+        })
+    debtors.sort(key=lambda d: (d['payoff_date'] is None, d['payoff_date'] or as_of, d['name']))
+
+    weeks = [(as_of + timedelta(weeks=w), round(float(weekly[w]), 2)) for w in range(horizon_weeks)]
+    totals = {
+        'balance': round(float(balance[owing].sum()), 2),
+        'debtors': int(owing.sum()),
+        'forecastable': int(forecastable.sum()),
+        'expected_cash': round(float(weekly.sum()), 2),
+    }
+    return {'debtors': debtors, 'weeks': weeks, 'totals': totals, 'as_of': as_of}
@@ -1,6 +1,6 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
-from .models import CustomUser, Debtor, Transaction
+from .models import CustomUser, Debtor, InterestTerms, PaymentPlan, Transaction
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
 from django.utils import timezone 
@@ -64,6 +64,30 @@ class TransactionForm(forms.ModelForm):
         model = Transaction
         exclude = ['recorded_by', 'debtor', 'current_debt','debit_amount','credit_amount','tran_type','tran_id']
 
+class InterestTermsForm(forms.ModelForm):
+    class Meta:
+        model = InterestTerms
+        fields = ['annual_rate', 'compounding', 'grace_days', 'is_active']
+        labels = {
+            'annual_rate': 'Interest rate (% per year)',
+            'grace_days': 'Grace period (days)',
+            'is_active': 'Charge interest',
+        }
+
+class PaymentPlanForm(forms.ModelForm):
+    class Meta:
+        model = PaymentPlan
+        fields = ['total_amount', 'installment_count', 'frequency', 'start_date']
+        labels = {
+            'installment_count': 'Number of installments',
+            'start_date': 'First due date',
+        }
+        widgets = {
+            'start_date': forms.DateInput(
+                attrs={'type': 'date', 'class': 'form-control'}
+            ),
+        }
+
 #Transacton Search Form 
 class TransactionSearchForm(forms.Form):
     debtor_id = forms.CharField(max_length=7, label="Debtor ID")
@@ -0,0 +1,136 @@
+"""
+Idempotent form posts.
+
+A form wrapped with `@idempotent(scope)` carries a one-time key, either a
+hidden `idempotency_key` field rendered from `form_key()` or a client's
+`Idempotency-Key` header. The first POST with a key claims it, and when the
+view has saved something (it calls `succeeded(request)`) and redirects, the
+redirect target is stored with the key. A
+repeated POST with the same key, e.g. a double click on a slow connection,
+is answered from that row with the original redirect. It never reaches the
+view, so it takes no lock and writes nothing.
+
+The claim is inserted before the view runs and in the same transaction, so a
+duplicate that arrives while the first is still running waits on the key's
+unique index and then replays the committed result. When the view does not
+succeed (the form is shown again with errors, or it redirects without saving
+anything) the claim is dropped and the key can be used again.
+
+Keys expire after IDEMPOTENCY_KEY_TTL_HOURS; `manage.py purge_idempotency_keys`
+deletes expired ones.
+"""
+import re
+import uuid
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.db import IntegrityError
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.shortcuts import redirect
+from django.utils import timezone
+
+from . import sharding
+from .models import IdempotencyKey
+
+FIELD = 'idempotency_key'
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+VALID_KEY = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+SUCCESS_STATUSES = (301, 302, 303)
+SUCCEEDED = '_idempotent_succeeded'
+PURGE_BATCH = 5000
+
+
+def ttl():
+    return timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24))
+
+
+def _key(request):
+    """The request's key, '' without one, or None when it is malformed."""
+    key = request.META.get(HEADER) or request.POST.get(FIELD, '')
+    if key and not VALID_KEY.match(key):
+        return None
+    return key
+
+
+def form_key(request):
+    """Key for the hidden form field: the posted one when the form is shown again, else a new one."""
+    if request.method == 'POST':
+        key = _key(request)
+        if key:
+            return key
+    return uuid.uuid4().hex
+
+
+def succeeded(request):
+    """Tell @idempotent that this request saved something, so its redirect is replayed for repeats."""
+    setattr(request, SUCCEEDED, True)
+
+
+def _done(user, scope, key):
+    row = IdempotencyKey.objects.filter(user=user, scope=scope, key=key).first()
+    if row is not None and row.expires_at <= timezone.now():
+        row.delete()
+        return None
+    return row
+
+
+def _replay(request, row):
+    messages.info(request, "This form was already submitted; nothing was saved twice.")
+    return redirect(row.result_url)
+
+
+def idempotent(scope):
+    """Replay the first successful result of a POST for repeats with the same key."""
+    def decorator(view_func):
+        @wraps(view_func)
+        def _view_wrapper(request, *args, **kwargs):
+            if request.method != 'POST':
+                return view_func(request, *args, **kwargs)
+            key = _key(request)
+            if key is None:
+                return HttpResponseBadRequest("Invalid idempotency key")
+            if not key:
+                return view_func(request, *args, **kwargs)
+
+            row = _done(request.user, scope, key)
+            if row is not None:
+                return _replay(request, row)
+
+            with sharding.atomic():
+                try:
+                    with sharding.atomic():
+                        claim = IdempotencyKey.objects.create(
+                            user=request.user, scope=scope, key=key, result_url='',
+                            expires_at=timezone.now() + ttl(),
+                        )
+                except IntegrityError:
+                    # A concurrent request with this key committed first
+                    claim = None
+                if claim is not None:
+                    response = view_func(request, *args, **kwargs)
+                    if getattr(request, SUCCEEDED, False) and response.status_code in SUCCESS_STATUSES:
+                        claim.result_url = response['Location']
+                        claim.save(update_fields=['result_url'])
+                    else:
+                        claim.delete()
+                    return response
+            row = _done(request.user, scope, key)
+            if row is None:
+                # The other request failed and released the key
+                return HttpResponse("Conflicting request with the same idempotency key, please retry.", status=409)
+            return _replay(request, row)
+        return _view_wrapper
+    return decorator
+
+
+def purge(batch_size=PURGE_BATCH):
+    """Delete expired keys a batch at a time. Returns how many."""
+    now = timezone.now()
+    deleted = 0
+    while True:
+        batch = list(IdempotencyKey.objects.filter(expires_at__lte=now).values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=batch).delete()[0]
@@ -0,0 +1,221 @@
+"""
+Ledger integrity checks.
+
+A debtor's transactions, taken in (tran_date, id) order, must chain:
+
+- balance: each row's stored `current_debt` is the previous row's plus its
+  debit minus its credit (the first row starts from zero)
+- type: a debit row has `debit_amount == tran_amount` and no credit, a credit
+  row the other way round
+- status: the debtor is `recovered` exactly when nothing is owed after the
+  last row (a debtor without transactions owes its archived balance, or its
+  `total_debt` when not archived, as in Debtor.current_debt)
+
+The amounts are taken as the truth: they are what the balance snapshots and
+rollups add up. `plan_tasks()` cuts the debtors of every creditor into
+slices of consecutive ids, and `verify_slice()` streams one slice's
+transactions through a chunked iterator, so `manage.py verify_ledger` can
+run the slices in a process pool (see debtapp.parallel).
+
+With `repair`, wrong balances, fixable types and statuses are written back
+in batches. These writes skip the signals, so the caller passes the
+(creditor, month) pairs the slices report to refresh_repaired() once they
+are all done. Repair in a quiet period: a transaction added to a debtor of
+the slice while it runs can be overwritten.
+"""
+from collections import Counter
+from decimal import Decimal
+from itertools import groupby
+
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+
+from . import ledger, rollups, sharding
+from .models import Debtor, Transaction, TransactionArchive
+
+SLICE_DEBTORS = 5000
+CHUNK_SIZE = 5000
+BATCH_SIZE = 2000
+SAMPLES_PER_SLICE = 20
+KINDS = ('balance', 'type', 'status')
+
+TRANSACTION_FIELDS = (
+    'pk', 'debtor_id', 'tran_id', 'tran_type', 'debit_amount', 'credit_amount', 'tran_amount',
+    'current_debt', 'tran_date',
+)
+
+
+def plan_tasks(creditor_id=None, slice_debtors=SLICE_DEBTORS):
+    """
+    (creditor_id, first debtor pk, last debtor pk) slices of at most
+    `slice_debtors` debtors each, the largest creditors' first.
+    """
+    debtors = Debtor.objects.order_by('created_by_id', 'pk')
+    if creditor_id is not None:
+        debtors = debtors.filter(created_by_id=creditor_id)
+    tasks = []
+    for owner, rows in groupby(debtors.values_list('created_by_id', 'pk').iterator(chunk_size=CHUNK_SIZE),
+                               key=lambda row: row[0]):
+        ids = [pk for _, pk in rows]
+        tasks += [
+            (owner, ids[first], ids[min(first + slice_debtors, len(ids)) - 1], len(ids))
+            for first in range(0, len(ids), slice_debtors)
+        ]
+    tasks.sort(key=lambda task: -task[3])
+    return [task[:3] for task in tasks]
+
+
+def _expected_type(debit, credit):
+    """The tran_type and tran_amount the amounts imply, or None when both are set."""
+    if debit and credit:
+        return None
+    return ('credit', credit) if credit else ('debit', debit)
+
+
+def _running_balance():
+    """Debits minus credits of the debtor's rows up to and including this one, in ledger order."""
+    up_to_here = (
+        Transaction.objects.filter(debtor_id=OuterRef('debtor_id'))
+        .filter(Q(tran_date__lt=OuterRef('tran_date')) | Q(tran_date=OuterRef('tran_date'), id__lte=OuterRef('id')))
+        .order_by()
+        .values('debtor_id')
+        .annotate(balance=Sum(F('debit_amount') - F('credit_amount')))
+        .values('balance')
+    )
+    return Subquery(up_to_here)
+
+
+class _Repairs:
+    """Buffers the fixes of one slice and writes them a batch at a time."""
+
+    def __init__(self, creditor_id, batch_size):
+        self.creditor_id = creditor_id
+        self.batch_size = batch_size
+        self.balances, self.types = [], []
+        self.statuses = {'active': [], 'recovered': []}
+        self.months = {(creditor_id, None)}
+        self.written = 0
+
+    def fix_balance(self, pk, tran_date):
+        self.balances.append(pk)
+        self.months.add((self.creditor_id, rollups.month_of(tran_date)))
+        self._flush_if_full()
+
+    def fix_type(self, pk):
+        self.types.append(pk)
+        self._flush_if_full()
+
+    def fix_status(self, pk, status):
+        self.statuses[status].append(pk)
+        self._flush_if_full()
+
+    def _pending(self):
+        return len(self.balances) + len(self.types) + sum(map(len, self.statuses.values()))
+
+    def _flush_if_full(self):
+        if self._pending() >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        pending = self._pending()
+        if not pending:
+            return
+        # Set-based: the fixed values are derived from the amounts in SQL
+        # rather than sent back row by row.
+        with sharding.atomic():
+            Transaction.objects.filter(pk__in=self.types, credit_amount=0).update(
+                tran_type='debit', tran_amount=F('debit_amount'),
+            )
+            Transaction.objects.filter(pk__in=self.types, debit_amount=0).exclude(credit_amount=0).update(
+                tran_type='credit', tran_amount=F('credit_amount'),
+            )
+            Transaction.objects.filter(pk__in=self.balances).update(current_debt=_running_balance())
+            for status, pks in self.statuses.items():
+                if pks:
+                    Debtor.objects.filter(pk__in=pks).update(debtor_status=status)
+        self.written += pending
+        self.balances, self.types = [], []
+        self.statuses = {'active': [], 'recovered': []}
+
+
+
+def verify_slice(task, repair=False, batch_size=BATCH_SIZE, samples=SAMPLES_PER_SLICE):
+    """
+    Check the debtors of one (creditor_id, first pk, last pk) slice. Returns
+    a dict of debtors and transactions checked, discrepancies per kind, up to
+    `samples` example discrepancies, the number of fixes written and the
+    (creditor, month) pairs they touched (month None: no balance fix).
+    """
+    creditor_id, first, last = task
+    debtors = {
+        pk: (code, status, total_debt)
+        for pk, code, status, total_debt in Debtor.objects.filter(
+            created_by_id=creditor_id, pk__gte=first, pk__lte=last,
+        ).values_list('pk', 'debtor_id', 'debtor_status', 'total_debt')
+    }
+    archived = dict(
+        TransactionArchive.objects.filter(
+            debtor__created_by_id=creditor_id, debtor_id__gte=first, debtor_id__lte=last,
+        ).values_list('debtor_id', 'balance')
+    )
+    rows = (
+        Transaction.objects.filter(debtor__created_by_id=creditor_id, debtor_id__gte=first, debtor_id__lte=last)
+        .order_by('debtor_id', 'tran_date', 'id')
+        .values_list(*TRANSACTION_FIELDS)
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    result = {
+        'debtors': len(debtors), 'transactions': 0, 'found': Counter(), 'samples': [], 'repaired': 0, 'touched': set(),
+    }
+    repairs = _Repairs(creditor_id, batch_size) if repair else None
+
+    def report(kind, debtor_code, tran_id, stored, expected):
+        result['found'][kind] += 1
+        if len(result['samples']) < samples:
+            result['samples'].append((kind, debtor_code, tran_id, str(stored), str(expected)))
+
+    def check_status(debtor_pk, balance):
+        code, status, _ = debtors[debtor_pk]
+        expected = 'recovered' if balance <= 0 else 'active'
+        if status != expected:
+            report('status', code, '', status, expected)
+            if repairs:
+                repairs.fix_status(debtor_pk, expected)
+
+    seen = set()
+    for debtor_pk, ledger_rows in groupby(rows, key=lambda row: row[1]):
+        seen.add(debtor_pk)
+        code = debtors[debtor_pk][0]
+        balance = Decimal(0)
+        for pk, _, tran_id, tran_type, debit, credit, amount, current_debt, tran_date in ledger_rows:
+            result['transactions'] += 1
+            implied = _expected_type(debit, credit)
+            if implied != (tran_type, amount):
+                expected = f"{implied[0]} {implied[1]}" if implied else "debit and credit both set"
+                report('type', code, tran_id, f"{tran_type} {amount}", expected)
+                if repairs and implied:
+                    repairs.fix_type(pk)
+            balance += debit - credit
+            if current_debt != balance:
+                report('balance', code, tran_id, current_debt, balance)
+                if repairs:
+                    repairs.fix_balance(pk, tran_date)
+        check_status(debtor_pk, balance)
+
+    for debtor_pk, (_, _, total_debt) in debtors.items():
+        if debtor_pk not in seen:
+            check_status(debtor_pk, archived.get(debtor_pk, total_debt))
+
+    if repairs:
+        repairs.flush()
+        if repairs.written:
+            result['repaired'], result['touched'] = repairs.written, repairs.months
+    return result
+
+
+def refresh_repaired(touched):
+    """Refresh the rollups and ledger versions of the (creditor, month) pairs that repairs touched."""
+    for creditor_id, month in touched:
+        if month is None:
+            ledger.bump_version(creditor_id)
+        else:
+            rollups.refresh_month(creditor_id, month)
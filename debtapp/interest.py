@@ -0,0 +1,233 @@
+"""
+Interest accrual.
+
+Debtors with active InterestTerms accrue interest every day on their
+outstanding balance once the grace period after their debt date is over.
+`accrue(day)`, run daily by `manage.py accrue_interest`, works through the
+eligible debtors in chunks: it locks a chunk, loads the balances and earlier
+accruals with two grouped queries, computes the interest of the whole chunk
+with NumPy and posts it with one bulk_create of debit transactions. An
+InterestAccrual row per debtor and day makes a second run for the same day
+post nothing.
+
+A past day (a missed run caught up with `--date`) is charged on the balance
+at the end of that day, and its rows are dated at the day's last moment:
+the later rows of those debtors have their running current_debt raised by
+the interest, and the balance snapshots from that day on are dropped, as
+when a transaction is edited.
+
+Amounts are handled in integer cents. Payments reduce principal first, so
+accrued interest stays part of the balance until the principal is paid. The
+base interest is charged on depends on the compounding:
+
+    simple:  balance without any interest accrued so far
+    monthly: balance without the interest accrued this month
+    daily:   the whole balance
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.db import connections, router
+from django.db.models import Case, DecimalField, Exists, F, OuterRef, Q, Sum, Value, When
+from django.utils import timezone
+
+from . import balances, ledger, rollups, sharding
+from .models import Debtor, InterestAccrual, Transaction
+
+DAYS_PER_YEAR = 365
+CHUNK_SIZE = 2000
+TRAN_ID_PREFIX = 'I'
+TRAN_ID_DIGITS = 9
+# Key of the PostgreSQL advisory lock held while numbering interest rows
+NUMBERING_LOCK = 0x494E5452
+
+
+def eligible_debtors(day):
+    """Debtors that may accrue interest for `day` and have not yet (grace is checked later)."""
+    return Debtor.objects.filter(
+        is_delete=False,
+        debtor_status='active',
+        debt_date__lt=day,
+        interest_terms__is_active=True,
+        interest_terms__annual_rate__gt=0,
+    ).exclude(
+        Exists(InterestAccrual.objects.filter(debtor=OuterRef('pk'), accrual_date=day))
+    )
+
+
+def _day_end(day):
+    """Start of the day after `day`: the day's transactions are those before it."""
+    return timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def _cents(values):
+    return np.fromiter((int(value * 100) for value in values), dtype=np.int64, count=len(values))
+
+
+def compute_chunk(debtor_ids, day):
+    """
+    Interest for `day` of the given debtors (sorted ids), as a dict of arrays:
+    ids, creditor ids, balance and interest in cents, rate and compounding.
+    """
+    terms = list(
+        eligible_debtors(day).filter(pk__in=debtor_ids).order_by('pk').values_list(
+            'pk', 'created_by_id', 'debt_date',
+            'interest_terms__annual_rate', 'interest_terms__compounding', 'interest_terms__grace_days',
+        )
+    )
+    if not terms:
+        return None
+    ids, creditor_ids, debt_dates, rates, compounding, grace_days = zip(*terms)
+    ids = np.array(ids, dtype=np.int64)
+
+    totals = {
+        row['debtor_id']: row['debit'] - row['credit']
+        for row in Transaction.objects.filter(debtor_id__in=ids.tolist(), tran_date__lt=_day_end(day))
+        .values('debtor_id')
+        .annotate(debit=Sum('debit_amount'), credit=Sum('credit_amount'))
+    }
+    accrued = {
+        row['debtor_id']: (row['total'], row['this_month'] or 0)
+        for row in InterestAccrual.objects.filter(
+            debtor_id__in=ids.tolist(), transaction__isnull=False, accrual_date__lt=day,
+        )
+        .values('debtor_id')
+        .annotate(total=Sum('amount'), this_month=Sum('amount', filter=Q(accrual_date__gte=day.replace(day=1))))
+    }
+
+    balance = _cents([totals.get(pk, 0) for pk in ids.tolist()])
+    interest_total = _cents([accrued.get(pk, (0, 0))[0] for pk in ids.tolist()])
+    interest_month = _cents([accrued.get(pk, (0, 0))[1] for pk in ids.tolist()])
+    compounding = np.array(compounding)
+
+    base = np.where(
+        compounding == 'simple', balance - interest_total,
+        np.where(compounding == 'monthly', balance - interest_month, balance),
+    )
+    base = np.clip(base, 0, None)
+    rate = np.array([float(r) for r in rates]) / 100 / DAYS_PER_YEAR
+    interest = np.rint(base * rate).astype(np.int64)
+
+    started = np.array([(day - debt_date).days for debt_date in debt_dates]) > np.array(grace_days)
+    due = started & (balance > 0) & (interest > 0)
+    return {
+        'ids': ids[due],
+        'creditor_ids': np.array(creditor_ids, dtype=object)[due],
+        'balance': balance[due],
+        'interest': interest[due],
+        'rates': np.array(rates, dtype=object)[due],
+        'compounding': compounding[due],
+    }
+
+
+def _lock_numbering():
+    """
+    Make concurrent runs (other creditors, an overlapping rerun) take their
+    turn numbering and inserting rows until this transaction ends. SQLite
+    allows one writer at a time anyway.
+    """
+    connection = connections[router.db_for_write(Transaction)]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [NUMBERING_LOCK])
+
+
+def _next_tran_number():
+    last = (
+        Transaction.objects.filter(tran_id__startswith=TRAN_ID_PREFIX)
+        .order_by('-tran_id')
+        .values_list('tran_id', flat=True)
+        .first()
+    )
+    return int(last[len(TRAN_ID_PREFIX):]) + 1 if last else 1
+
+
+def _money(cents):
+    return Decimal(int(cents)) / 100
+
+
+def post_chunk(debtor_ids, day):
+    """Lock, compute and post one chunk. Returns (debtors charged, total interest)."""
+    with sharding.atomic():
+        # Same lock add_transaction takes, so balances cannot move underneath us
+        # and a concurrent run for the same day waits, then finds nothing to do.
+        list(Debtor.objects.select_for_update().filter(pk__in=debtor_ids).values_list('pk', flat=True))
+        result = compute_chunk(debtor_ids, day)
+        if result is None or not len(result['ids']):
+            return 0, Decimal(0)
+
+        _lock_numbering()
+        number = _next_tran_number()
+        rows = [
+            Transaction(
+                debtor_id=int(debtor_id),
+                tran_id=f"{TRAN_ID_PREFIX}{number + i:0{TRAN_ID_DIGITS}d}",
+                tran_type='debit',
+                debit_amount=_money(interest),
+                credit_amount=0,
+                tran_amount=_money(interest),
+                current_debt=_money(balance + interest),
+                tran_desc=f"Interest {rate}% p.a. ({compounding}) for {day}",
+            )
+            for i, (debtor_id, interest, balance, rate, compounding) in enumerate(zip(
+                result['ids'], result['interest'], result['balance'], result['rates'], result['compounding'],
+            ))
+        ]
+        Transaction.objects.bulk_create(rows)
+        if rows[0].pk is None:
+            # backend cannot return ids from a bulk insert
+            by_tran_id = dict(
+                Transaction.objects.filter(tran_id__in=[row.tran_id for row in rows]).values_list('tran_id', 'pk')
+            )
+            for row in rows:
+                row.pk = by_tran_id[row.tran_id]
+        InterestAccrual.objects.bulk_create([
+            InterestAccrual(debtor_id=row.debtor_id, accrual_date=day, amount=row.debit_amount, transaction_id=row.pk)
+            for row in rows
+        ])
+
+        # bulk_create skips the post_save signals
+        per_creditor = {}
+        for creditor_id, interest in zip(result['creditor_ids'], result['interest']):
+            if creditor_id is not None:
+                per_creditor[creditor_id] = per_creditor.get(creditor_id, 0) + int(interest)
+        debtor_ids = [row.debtor_id for row in rows]
+        if day < timezone.localdate(rows[0].tran_date):
+            _backdate(rows, day)
+            balances.invalidate_bulk(day, debtor_ids=debtor_ids, creditor_ids=list(per_creditor))
+        else:
+            balances.absorb_bulk(day, debtor_ids=debtor_ids, creditor_ids=list(per_creditor))
+        for creditor_id, cents in per_creditor.items():
+            rollups.add_bulk(creditor_id, rollups.month_of(day), total_debit=_money(cents))
+            ledger.bump_version(creditor_id)
+
+    return len(rows), _money(result['interest'].sum())
+
+
+def _backdate(rows, day):
+    """Move rows posted for a past `day` to its last moment, below the debtors' later rows."""
+    end = _day_end(day)
+    Transaction.objects.filter(pk__in=[row.pk for row in rows]).update(tran_date=end - timedelta(microseconds=1))
+    raised = Case(
+        *[When(debtor_id=row.debtor_id, then=Value(row.debit_amount)) for row in rows],
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+    Transaction.objects.filter(
+        debtor_id__in=[row.debtor_id for row in rows], tran_date__gte=end,
+    ).update(current_debt=F('current_debt') + raised)
+
+
+def accrue(day=None, chunk_size=CHUNK_SIZE):
+    """
+    Post the interest of every eligible debtor for `day` (default today).
+    Returns (debtors charged, total interest).
+    """
+    day = day or timezone.localdate()
+    debtor_ids = list(eligible_debtors(day).order_by('pk').values_list('pk', flat=True))
+    charged, total = 0, Decimal(0)
+    for start in range(0, len(debtor_ids), chunk_size):
+        count, amount = post_chunk(debtor_ids[start:start + chunk_size], day)
+        charged += count
+        total += amount
+    return charged, total
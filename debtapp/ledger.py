@@ -0,0 +1,33 @@
+"""
+Ledger bookkeeping shared by views, signals and management commands.
+"""
+from django.db.models import F
+
+from .models import Debtor, LedgerVersion, Transaction
+
+
+def creditor_id_for(tran):
+    """Creditor of a transaction, without a query when the debtor is already loaded."""
+    if Transaction.debtor.is_cached(tran):
+        return tran.debtor.created_by_id
+    return Debtor.objects.filter(pk=tran.debtor_id).values_list('created_by_id', flat=True).first()
+
+
+def bump_version(creditor_id):
+    """Invalidate everything cached for this creditor's ledger."""
+    if creditor_id is None:
+        return
+    if LedgerVersion.objects.filter(creditor_id=creditor_id).update(version=F('version') + 1):
+        return
+    _, created = LedgerVersion.objects.get_or_create(creditor_id=creditor_id, defaults={'version': 1})
+    if not created:
+        # Someone else created the row between our update and get_or_create
+        LedgerVersion.objects.filter(creditor_id=creditor_id).update(version=F('version') + 1)
+
+
+def get_version(creditor_id):
+    return LedgerVersion.objects.filter(creditor_id=creditor_id).values_list('version', flat=True).first() or 0
+
+
+async def aget_version(creditor_id):
+    return await LedgerVersion.objects.filter(creditor_id=creditor_id).values_list('version', flat=True).afirst() or 0
@@ -0,0 +1,136 @@
+"""
+Live dashboard updates.
+
+The dashboard opens a Server-Sent Events stream. The stream polls for
+Transaction rows of the creditor committed since the last one the page has
+seen, and turns them into deltas for the stat cards. Polling only sees
+committed rows and works across processes, e.g. writes served by WSGI
+workers and the stream served by an ASGI worker.
+
+Deleting, restoring, purging a debtor and resetting its opening balance
+change the cards without a new transaction. The stream notices them in the
+audit log (see debtapp.audit) and sends the recomputed figures instead.
+"""
+import asyncio
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, Exists, Max, OuterRef, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import AuditEvent, Debtor, Transaction, TransactionArchive
+
+# Rows re-checked below the last seen id, in case a lower id committed late.
+LOOKBACK_IDS = 50
+MAX_ROWS_PER_POLL = 500
+
+# Audited debtor changes that move the stat cards
+RECOUNT_ACTIONS = ('opening_reset', 'debtor_deleted', 'debtor_restored', 'debtor_hard_deleted', 'debtor_purged')
+
+ZERO = Value(0, output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+async def figures(creditor_id, counted=Q()):
+    """The dashboard's stat cards, with the amounts of the transactions matching `counted`."""
+    totals, archived, counts = await asyncio.gather(
+        Transaction.objects.filter(counted, debtor__created_by_id=creditor_id).aaggregate(
+            total_debit_amount=Coalesce(Sum('debit_amount'), ZERO),
+            total_credit_amount=Coalesce(Sum('credit_amount'), ZERO),
+            last_tran_id=Max('id'),
+        ),
+        TransactionArchive.objects.filter(debtor__created_by_id=creditor_id).aaggregate(
+            total_debit_amount=Coalesce(Sum('total_debit'), ZERO),
+            total_credit_amount=Coalesce(Sum('total_credit'), ZERO),
+        ),
+        Debtor.objects.filter(created_by_id=creditor_id).aaggregate(
+            total=Count('id'),
+            active=Count('id', filter=Q(debtor_status='active', is_delete=False)),
+            recovered=Count('id', filter=Q(debtor_status='recovered', is_delete=False)),
+            deleted=Count('id', filter=Q(is_delete=True)),
+        ),
+    )
+    total_debit_amount = totals['total_debit_amount'] + archived['total_debit_amount']
+    total_credit_amount = totals['total_credit_amount'] + archived['total_credit_amount']
+    return {
+        'total_debtors_no': counts['total'],
+        'active_debtors_no': counts['active'],
+        'recovered_debtors_no': counts['recovered'],
+        'deleted_debtors_no': counts['deleted'],
+
+        'total_debt_amount': total_debit_amount,
+        'total_current_debt': total_debit_amount - total_credit_amount,
+        'total_recovered_debt': total_credit_amount,
+
+        'last_tran_id': totals['last_tran_id'] or 0,
+    }
+
+
+def empty_delta():
+    return {
+        'total_debtors_no': 0,
+        'active_debtors_no': 0,
+        'recovered_debtors_no': 0,
+        'total_debt_amount': Decimal(0),
+        'total_recovered_debt': Decimal(0),
+        'total_current_debt': Decimal(0),
+    }
+
+
+def apply_transaction(delta, row):
+    """Add the effect of one transaction row (a dict from `new_transactions`) to `delta`."""
+    debit, credit, balance = row['debit_amount'], row['credit_amount'], row['current_debt']
+    delta['total_debt_amount'] += debit
+    delta['total_recovered_debt'] += credit
+    delta['total_current_debt'] += debit - credit
+
+    if row['is_opening']:
+        # add_debtor: a new active debtor with its opening debit
+        delta['total_debtors_no'] += 1
+        delta['active_debtors_no'] += 1
+    elif credit > 0 and balance == 0:
+        # fully recovered by this payment
+        delta['active_debtors_no'] -= 1
+        delta['recovered_debtors_no'] += 1
+    elif debit > 0 and balance == debit:
+        # new debt on a debtor whose balance was zero, i.e. recovered before
+        delta['active_debtors_no'] += 1
+        delta['recovered_debtors_no'] -= 1
+
+
+async def new_transactions(creditor_id, after_id, seen):
+    """
+    Committed transactions of `creditor_id` with id > after_id (minus a small
+    lookback window), skipping ids already in `seen`. Returns rows ordered by id.
+    """
+    earlier = Transaction.objects.filter(debtor=OuterRef('debtor'), id__lt=OuterRef('id'))
+    qs = (
+        Transaction.objects
+        .filter(debtor__created_by_id=creditor_id, id__gt=max(after_id - LOOKBACK_IDS, 0))
+        .annotate(is_opening=~Exists(earlier))
+        .order_by('id')
+        .values('id', 'debit_amount', 'credit_amount', 'current_debt', 'is_opening')
+    )
+    rows = [row async for row in qs[:MAX_ROWS_PER_POLL]]
+    return [row for row in rows if row['id'] not in seen]
+
+
+async def seen_ids(creditor_id, up_to_id):
+    """Ids inside the lookback window that the client already has."""
+    qs = (
+        Transaction.objects
+        .filter(debtor__created_by_id=creditor_id, id__gt=max(up_to_id - LOOKBACK_IDS, 0), id__lte=up_to_id)
+        .values_list('id', flat=True)
+    )
+    return {pk async for pk in qs}
+
+
+async def last_recount(creditor_id, after_id=0):
+    """
+    Id of the newest audit event after `after_id` that changed the cards of
+    `creditor_id`, or None. Purges are the system's and may touch any creditor.
+    """
+    latest = await (
+        AuditEvent.objects
+        .filter(Q(actor_id=creditor_id) | Q(actor__isnull=True), id__gt=after_id, action__in=RECOUNT_ACTIONS)
+        .aaggregate(last=Max('id'))
+    )
+    return latest['last']
@@ -0,0 +1,40 @@
+"""
+Post a day's interest for every debtor with active interest terms.
+
+Meant to run once a day (cron, systemd timer). Running it again for the same
+day posts nothing, so a failed or repeated run is safe to re-run:
+
+    python manage.py accrue_interest
+    python manage.py accrue_interest --date 2026-01-31
+"""
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from debtapp import interest
+
+
+class Command(BaseCommand):
+    help = "Accrue daily interest and post it as debit transactions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Accrual date (YYYY-MM-DD), default today.")
+        parser.add_argument('--chunk-size', type=int, default=interest.CHUNK_SIZE, help="Debtors per bulk insert.")
+
+    def handle(self, *args, **options):
+        day = timezone.localdate()
+        if options['date']:
+            try:
+                day = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Invalid date '{options['date']}', expected YYYY-MM-DD.")
+            if day > timezone.localdate():
+                raise CommandError("Cannot accrue interest for a future date.")
+
+        started = time.perf_counter()
+        charged, total = interest.accrue(day, chunk_size=max(options['chunk_size'], 1))
+        self.stdout.write(
+            f"Accrued {total} interest for {charged} debtors on {day} in {time.perf_counter() - started:.1f}s"
+        )
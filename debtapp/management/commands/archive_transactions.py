@@ -0,0 +1,39 @@
+"""
+Move the ledgers of long-recovered debtors out of the transaction table.
+
+Meant to run nightly or weekly. Debtors that are recovered, owe nothing and
+had no transaction for ARCHIVE_AFTER_DAYS (or --days) get their transactions
+compressed into the archive; their pages and exports read them from there:
+
+    python manage.py archive_transactions
+    python manage.py archive_transactions --days 180 --batch-size 500
+
+`manage.py restore_archived` moves a debtor's ledger back.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from debtapp import archive
+
+
+class Command(BaseCommand):
+    help = "Archive the transactions of debtors recovered more than ARCHIVE_AFTER_DAYS ago."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Archive after this many days without transactions, default ARCHIVE_AFTER_DAYS.")
+        parser.add_argument('--batch-size', type=int, default=archive.BATCH_DEBTORS,
+                            help="Debtors archived per transaction.")
+
+    def handle(self, *args, **options):
+        days = archive.archive_after_days() if options['days'] is None else options['days']
+        if days < 1 or options['batch_size'] < 1:
+            raise CommandError("--days and --batch-size must be positive.")
+
+        started = time.perf_counter()
+        debtors, transactions = archive.archive(days, options['batch_size'])
+        self.stdout.write(
+            f"Archived {transactions} transactions of {debtors} debtors inactive for {days} days "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
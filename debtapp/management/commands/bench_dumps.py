@@ -0,0 +1,55 @@
+"""
+Benchmark the CSV dumps (debtapp.dumps): rows and megabytes per second of
+COPY ... TO STDOUT against the values_list() fallback, plain and gzipped.
+Reads the tables of the active shard as they are, archived ledgers left out:
+
+    python manage.py bench_dumps
+    python manage.py bench_dumps transactions --repeat 5
+
+COPY is only timed on PostgreSQL.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from debtapp import dumps
+
+from .bench_http import percentile
+
+
+class Command(BaseCommand):
+    help = "Time the CSV dumps with COPY and with the values_list() fallback."
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f"Dumps to time: {', '.join(dumps.COLUMNS)} (default all).")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per dump and method.")
+
+    def handle(self, *args, **options):
+        names = options['names'] or list(dumps.COLUMNS)
+        unknown = [name for name in names if name not in dumps.COLUMNS]
+        if unknown:
+            raise CommandError(f"Unknown dump(s): {', '.join(unknown)}")
+
+        started = time.perf_counter()
+        for name in names:
+            queryset = dumps.rows_queryset(name)
+            rows = queryset.count()
+            methods = [('fetch', dumps.fetch)]
+            if dumps.can_copy(queryset.db):
+                methods.insert(0, ('copy', dumps.copy))
+            for label, method in methods:
+                for compress in (False, True):
+                    timings = []
+                    for _ in range(max(options['repeat'], 1)):
+                        run_started = time.perf_counter()
+                        chunks = method(queryset.all())
+                        size = sum(len(chunk) for chunk in (dumps.gzipped(chunks) if compress else chunks))
+                        timings.append(time.perf_counter() - run_started)
+                    timings.sort()
+                    seconds = percentile(timings, 50)
+                    self.stdout.write(
+                        f"{name:12} {label:5} {'gzip' if compress else 'plain':5} {rows:>9} rows "
+                        f"{size / 1e6:8.1f} MB  p50={seconds:7.2f}s  "
+                        f"{rows / seconds:>10,.0f} rows/s {size / 1e6 / seconds:7.1f} MB/s"
+                    )
+        self.stdout.write(f"Benchmarked {len(names)} dumps in {time.perf_counter() - started:.1f}s")
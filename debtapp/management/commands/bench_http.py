@@ -0,0 +1,138 @@
+"""
+Small HTTP load generator for comparing server and database settings.
+
+Fires a fixed number of GET requests at a running server from N concurrent
+clients and prints throughput and latency percentiles. Run it once per
+configuration, e.g. without and with pooling:
+
+    DB_CONN_MAX_AGE=0 python manage.py runserver --noreload
+    python manage.py bench_http http://127.0.0.1:8000/redirect/ --user alice -n 2000 -c 20
+
+    DB_POOL=True python manage.py runserver --noreload
+    python manage.py bench_http http://127.0.0.1:8000/redirect/ --user alice -n 2000 -c 20
+
+Pass several concurrency levels to see where a server stops scaling, e.g.
+WSGI against ASGI for the async dashboard:
+
+    gunicorn debt_mgmt_system.wsgi -w 2 --threads 4 -b 127.0.0.1:8000
+    uvicorn debt_mgmt_system.asgi:application --workers 2 --port 8001
+    python manage.py bench_http http://127.0.0.1:8000/dashboard/ --user alice -n 2000 -c 10,50,200
+    python manage.py bench_http http://127.0.0.1:8001/dashboard/ --user alice -n 2000 -c 10,50,200
+"""
+import http.client
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def session_cookie_for(username):
+    """Create a logged-in session for `username` and return it as a Cookie header."""
+    user = get_user_model().objects.filter(username=username).first()
+    if user is None:
+        raise CommandError(f"User '{username}' does not exist.")
+    session = SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    return f"{settings.SESSION_COOKIE_NAME}={session.session_key}"
+
+
+def run_load(url, total, concurrency, headers=None, timeout=30):
+    """Send `total` GETs to `url` from `concurrency` threads; return (elapsed, latencies, errors)."""
+    parts = urlsplit(url)
+    conn_cls = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    path = parts.path or '/'
+    if parts.query:
+        path = f"{path}?{parts.query}"
+
+    remaining = [total]
+    lock = threading.Lock()
+    latencies = []
+    errors = []
+
+    def worker():
+        local = []
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                conn = conn_cls(parts.netloc, timeout=timeout)
+                conn.request('GET', path, headers=headers or {})
+                resp = conn.getresponse()
+                resp.read()
+                conn.close()
+                if resp.status >= 400:
+                    errors.append(resp.status)
+                    continue
+            except OSError as exc:
+                errors.append(type(exc).__name__)
+                continue
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - started
+    return elapsed, sorted(latencies), errors
+
+
+class Command(BaseCommand):
+    help = "Benchmark a URL of a running server: requests per second and latency percentiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help="Full URL to request, e.g. http://127.0.0.1:8000/redirect/")
+        parser.add_argument('-n', '--requests', type=int, default=1000, help="Total number of requests.")
+        parser.add_argument(
+            '-c', '--concurrency', default='10',
+            help="Concurrent clients; a comma separated list runs one round per level, e.g. 10,50,200.",
+        )
+        parser.add_argument('--user', help="Send requests as this user (a session is created in the database).")
+
+    def handle(self, *args, **options):
+        headers = {}
+        if options['user']:
+            headers['Cookie'] = session_cookie_for(options['user'])
+
+        db = settings.DATABASES['default']
+        self.stdout.write(
+            f"DB: CONN_MAX_AGE={db.get('CONN_MAX_AGE', 0)} "
+            f"health_checks={db.get('CONN_HEALTH_CHECKS', False)} "
+            f"pool={'pool' in db.get('OPTIONS', {})}  (as seen by this process)"
+        )
+
+        try:
+            levels = [int(level) for level in str(options['concurrency']).split(',')]
+        except ValueError:
+            raise CommandError("--concurrency must be an integer or a comma separated list of integers.")
+
+        for concurrency in levels:
+            elapsed, latencies, errors = run_load(options['url'], options['requests'], concurrency, headers)
+            ok = len(latencies)
+            self.stdout.write(
+                f"c={concurrency}: {ok} ok / {len(errors)} errors in {elapsed:.2f}s -> {ok / elapsed:.1f} req/s\n"
+                f"  latency ms: p50={percentile(latencies, 50) * 1000:.1f} "
+                f"p95={percentile(latencies, 95) * 1000:.1f} "
+                f"p99={percentile(latencies, 99) * 1000:.1f} "
+                f"max={(latencies[-1] if latencies else 0) * 1000:.1f}"
+            )
@@ -0,0 +1,102 @@
+"""
+Benchmark date-ranged transaction queries, to compare the plain and the
+partitioned transaction table (see debtapp.partitions).
+
+Times each query and counts the tables its plan reads; with partitions only
+those of the queried months should appear. Run it before and after
+converting:
+
+    python manage.py bench_partitions --user alice --month 2026-09
+    python manage.py partition_transactions --convert
+    python manage.py bench_partitions --user alice --month 2026-09 --explain
+"""
+import json
+import time
+from datetime import date, datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from debtapp.models import Transaction
+
+from .bench_http import percentile
+
+EXPORT_COLUMNS = ('tran_id', 'debtor_id', 'tran_type', 'debit_amount', 'credit_amount', 'current_debt', 'tran_date')
+
+
+def _start(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def _queries(user, month):
+    next_month = (month + timedelta(days=32)).replace(day=1)
+    month_range = {'tran_date__gte': _start(month), 'tran_date__lt': _start(next_month)}
+    day_range = {'tran_date__gte': _start(month + timedelta(days=14)), 'tran_date__lt': _start(month + timedelta(days=15))}
+    totals = {'debit': Sum('debit_amount'), 'credit': Sum('credit_amount'), 'rows': Count('id')}
+    return [
+        # rollups.compute_month
+        ("creditor month totals",
+         Transaction.objects.filter(debtor__created_by=user, **month_range).values('debtor__created_by').annotate(**totals)),
+        # digest: one day's activity of every creditor
+        ("all creditors, one day",
+         Transaction.objects.filter(**day_range).values('debtor__created_by').annotate(**totals)),
+        # a month of the all-transactions export
+        ("month export rows",
+         Transaction.objects.filter(**month_range).order_by('-tran_date').values_list(*EXPORT_COLUMNS)),
+        ("whole ledger totals (no date)",
+         Transaction.objects.filter(debtor__created_by=user).values('debtor__created_by').annotate(**totals)),
+    ]
+
+
+def _relations(plan):
+    """Names of the tables a JSON plan scans, skipping partitions pruned at run time."""
+    found = set()
+    if 'Relation Name' in plan and not plan.get('Actual Loops', 1) == 0:
+        found.add(plan['Relation Name'])
+    for child in plan.get('Plans', ()):
+        found |= _relations(child)
+    return found
+
+
+class Command(BaseCommand):
+    help = "Time date-ranged transaction queries and count the partitions they read."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help="Creditor whose month is queried.")
+        parser.add_argument('--month', help="YYYY-MM, default last month.")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per query.")
+        parser.add_argument('--explain', action='store_true', help="Print EXPLAIN ANALYZE of each query.")
+
+    def handle(self, *args, **options):
+        vendor = connections[router.db_for_read(Transaction)].vendor
+        if vendor != 'postgresql':
+            raise CommandError(f"Partitioning is not implemented for {vendor}.")
+        user = get_user_model().objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f"User '{options['user']}' does not exist.")
+        if options['month']:
+            try:
+                month = date.fromisoformat(f"{options['month']}-01")
+            except ValueError:
+                raise CommandError("--month must be YYYY-MM.")
+        else:
+            month = (timezone.localdate().replace(day=1) - timedelta(days=1)).replace(day=1)
+
+        for label, queryset in _queries(user, month):
+            timings = []
+            for _ in range(max(options['repeat'], 1)):
+                started = time.perf_counter()
+                rows = len(list(queryset.all()))
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            plan = json.loads(queryset.explain(format='json', analyze=True))[0]['Plan']
+            self.stdout.write(
+                f"{label:30} {rows:>8} rows  p50={percentile(timings, 50) * 1000:8.1f} ms  "
+                f"tables read: {len(_relations(plan))}"
+            )
+            if options['explain']:
+                for line in queryset.explain(analyze=True).splitlines():
+                    self.stdout.write(f"    {line}")
@@ -0,0 +1,146 @@
+"""
+Benchmark transaction full-text search.
+
+Optionally seeds a creditor with synthetic debtors and transactions first, then
+times each query (count + first result page + highlighting) and prints the
+plan of the page query. Seed a scratch database only; the rows are real:
+
+    python manage.py bench_search --user bench --seed 2000000
+    python manage.py bench_search --user bench "cheque 4711" "medical -cash" --repeat 5 --explain
+"""
+import random
+import time
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.db import connections, router, transaction
+
+from debtapp import balances, ledger, rollups, search
+from debtapp.models import Debtor, Transaction
+
+from .bench_http import percentile
+
+WORDS = (
+    'loan rent school fees medical bills wedding festival dashain tihar shop stock tractor '
+    'repair land deposit salary advance tuition hospital travel visa phone laptop motorbike '
+    'cash cheque transfer partial final settlement interest installment remittance'
+).split()
+TRANSACTIONS_PER_DEBTOR = 50
+BATCH_SIZE = 5000
+
+
+def _phrase(rng, words=6):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+class Command(BaseCommand):
+    help = "Time transaction full-text search, optionally after seeding synthetic rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', default=['cheque', 'medical bills', '"final settlement" -cash'])
+        parser.add_argument('--user', required=True, help="Creditor to search (and seed) as; created if missing.")
+        parser.add_argument('--seed', type=int, default=0, help="Insert this many synthetic transactions first.")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per query.")
+        parser.add_argument('--explain', action='store_true', help="Print EXPLAIN ANALYZE of the page query.")
+
+    def handle(self, *args, **options):
+        user_model = get_user_model()
+        user, _ = user_model.objects.get_or_create(username=options['user'])
+        if options['seed']:
+            self.seed(user, options['seed'])
+
+        vendor = search.vendor_for(Transaction)
+        total = Transaction.objects.filter(debtor__created_by=user).count()
+        self.stdout.write(f"{vendor}: {total} transactions for '{user.username}'")
+
+        for query in options['queries']:
+            timings = []
+            for _ in range(max(options['repeat'], 1)):
+                started = time.perf_counter()
+                page = Paginator(search.transaction_search(user, query), search.SEARCH_PAGE_SIZE).get_page(1)
+                search.highlight_transactions(page.object_list, query)
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            self.stdout.write(
+                f"{query!r}: {page.paginator.count} matches, "
+                f"p50={percentile(timings, 50) * 1000:.1f} ms max={timings[-1] * 1000:.1f} ms"
+            )
+            if options['explain']:
+                self.explain(search.transaction_search(user, query)[:search.SEARCH_PAGE_SIZE], vendor)
+
+    def explain(self, queryset, vendor):
+        options = {'analyze': True, 'buffers': True} if vendor == 'postgresql' else {}
+        for line in queryset.explain(**options).splitlines():
+            self.stdout.write(f"    {line}")
+
+    def seed(self, user, count):
+        rng = random.Random(count)
+        alias = router.db_for_write(Transaction)
+        start = (Transaction.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        debtor_start = (Debtor.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        debtors_needed = -(-count // TRANSACTIONS_PER_DEBTOR)
+        if debtor_start + debtors_needed >= 10 ** 9:
+            raise CommandError("Too many rows for the synthetic id scheme.")
+
+        started = time.perf_counter()
+        with transaction.atomic(using=alias):
+            debtors = Debtor.objects.bulk_create(
+                [
+                    Debtor(
+                        created_by=user,
+                        debtor_id=f"B{debtor_start + i:09d}",
+                        name=f"Bench Debtor {debtor_start + i}",
+                        address='Kathmandu',
+                        mobile=f"9{debtor_start + i:09d}",
+                        debt_date=date.today(),
+                        debt_purpose=_phrase(rng, 3),
+                        voucher_cheque_no=f"CHQ{rng.randrange(10 ** 6):06d}",
+                    )
+                    for i in range(debtors_needed)
+                ],
+                batch_size=BATCH_SIZE,
+            )
+        if debtors[0].pk is None:
+            # backend cannot return ids from a bulk insert
+            debtors = list(Debtor.objects.filter(created_by=user, id__gte=debtor_start).order_by('id'))
+
+        batch = []
+        balance = 0
+        for n in range(count):
+            if n % TRANSACTIONS_PER_DEBTOR == 0:
+                balance = 0
+            amount = rng.randrange(100, 50000)
+            is_credit = balance > 0 and rng.random() < 0.4
+            if is_credit:
+                amount = min(amount, balance)
+                balance -= amount
+            else:
+                balance += amount
+            batch.append(Transaction(
+                debtor=debtors[n // TRANSACTIONS_PER_DEBTOR],
+                recorded_by=user,
+                tran_id=f"B{start + n:09d}",
+                tran_type='credit' if is_credit else 'debit',
+                debit_amount=0 if is_credit else amount,
+                credit_amount=amount if is_credit else 0,
+                tran_amount=amount,
+                current_debt=balance,
+                tran_desc=_phrase(rng),
+            ))
+            if len(batch) == BATCH_SIZE:
+                Transaction.objects.bulk_create(batch)
+                batch = []
+                self.stdout.write(f"\rseeded {n + 1}/{count}", ending='')
+        if batch:
+            Transaction.objects.bulk_create(batch)
+
+        # bulk_create skips the post_save signals
+        ledger.bump_version(user.pk)
+        balances.rebuild(user)
+        rollups.rebuild(user)
+        if connections[alias].vendor == 'postgresql':
+            with connections[alias].cursor() as cursor:
+                cursor.execute('ANALYZE debtapp_debtor, debtapp_transaction')
+        self.stdout.write(f"\rseeded {count} transactions in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,67 @@
+"""
+Put debtors on payment plans in bulk.
+
+Creates a plan over the current balance for every active debtor of a creditor
+(or the listed debtors) that owes something and has no active plan yet:
+
+    python manage.py create_payment_plans --user alice --installments 6 --start 2026-11-01
+    python manage.py create_payment_plans --user alice --installments 12 --frequency weekly --debtor D00012 D00031
+"""
+import time
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import DecimalField, OuterRef, Subquery
+
+from debtapp import plans
+from debtapp.models import Debtor, PaymentPlan, Transaction
+
+
+class Command(BaseCommand):
+    help = "Create installment plans over the current balance for many debtors at once."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help="Creditor whose debtors get plans.")
+        parser.add_argument('--installments', type=int, required=True)
+        parser.add_argument('--frequency', choices=[choice for choice, _ in PaymentPlan.FREQUENCY_CHOICES], default='monthly')
+        parser.add_argument('--start', required=True, help="First due date (YYYY-MM-DD).")
+        parser.add_argument('--debtor', nargs='*', default=None, help="Only these debtor ids.")
+
+    def handle(self, *args, **options):
+        creditor = get_user_model().objects.filter(username=options['user']).first()
+        if creditor is None:
+            raise CommandError(f"User '{options['user']}' does not exist.")
+        try:
+            start = date.fromisoformat(options['start'])
+        except ValueError:
+            raise CommandError(f"Invalid date '{options['start']}', expected YYYY-MM-DD.")
+        if options['installments'] < 1:
+            raise CommandError("--installments must be at least 1.")
+
+        latest_current_debt = (
+            Transaction.objects.filter(debtor=OuterRef('pk'))
+            .order_by('-tran_date', '-id')
+            .values('current_debt')[:1]
+        )
+        debtors = (
+            Debtor.objects.filter(created_by=creditor, is_delete=False, debtor_status='active')
+            .exclude(payment_plans__status=plans.ACTIVE)
+            .annotate(balance=Subquery(latest_current_debt, output_field=DecimalField(max_digits=12, decimal_places=2)))
+            .filter(balance__gt=0)
+        )
+        if options['debtor'] is not None:
+            debtors = debtors.filter(debtor_id__in=options['debtor'])
+
+        started = time.perf_counter()
+        created = plans.create_plans(
+            {
+                'debtor': debtor,
+                'total_amount': debtor.balance,
+                'installment_count': options['installments'],
+                'frequency': options['frequency'],
+                'start_date': start,
+            }
+            for debtor in debtors
+        )
+        self.stdout.write(f"Created {len(created)} payment plans in {time.perf_counter() - started:.1f}s")
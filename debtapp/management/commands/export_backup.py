@@ -0,0 +1,38 @@
+"""
+Write the full backup (see debtapp.backup) to a file, e.g. from cron:
+
+    python manage.py export_backup /var/backups/debt/backup.zip
+    python manage.py export_backup backup.zip --workers 1    # one dump after the other, to compare
+
+Prints how long each dump took; with enough workers the total is close to
+the slowest of them.
+"""
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from debtapp import backup
+
+
+class Command(BaseCommand):
+    help = "Write users, debtors, transactions and summaries as gzipped CSVs into a ZIP file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="ZIP file to write.")
+        parser.add_argument('--workers', type=int, default=backup.default_workers(),
+                            help="Dumps built at the same time (default: one per CPU, at most one per dump).")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def built(name, seconds):
+            self.stdout.write(f"{name:18} {seconds:7.1f}s")
+
+        with open(options['path'], 'wb') as handle:
+            for chunk in backup.zip_chunks(max(options['workers'], 1), on_built=built):
+                handle.write(chunk)
+        size = os.path.getsize(options['path'])
+        self.stdout.write(
+            f"Wrote {options['path']} ({size / 1e6:.1f} MB) in {time.perf_counter() - started:.1f}s"
+        )
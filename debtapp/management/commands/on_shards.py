@@ -0,0 +1,40 @@
+"""
+Run a management command once per shard, with that shard active; see
+debtapp.sharding. The periodic jobs need it when creditors are spread over
+several databases:
+
+    python manage.py on_shards accrue_interest
+    python manage.py on_shards send_daily_digest --date 2026-10-01
+    python manage.py on_shards --shard shard2 archive_transactions --days 400
+
+Without sharding it runs the command once, on 'default'.
+"""
+import argparse
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from debtapp.routers import shard_aliases, using_shard
+
+
+class Command(BaseCommand):
+    help = "Run a management command on every shard in turn."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shard', action='append', help="Only this shard; repeat for several.")
+        parser.add_argument('command_name', help="Command to run.")
+        parser.add_argument('command_args', nargs=argparse.REMAINDER, help="Its arguments and options.")
+
+    def handle(self, *args, **options):
+        aliases = options['shard'] or shard_aliases()
+        unknown = [alias for alias in aliases if alias not in shard_aliases()]
+        if unknown:
+            raise CommandError(f"Unknown shard(s): {', '.join(unknown)}")
+
+        started = time.perf_counter()
+        for alias in aliases:
+            self.stdout.write(f"[{alias}]")
+            with using_shard(alias):
+                call_command(options['command_name'], *options['command_args'], stdout=self.stdout, stderr=self.stderr)
+        self.stdout.write(f"Ran {options['command_name']} on {len(aliases)} shards in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,67 @@
+"""
+Partition the transaction table by month (PostgreSQL) and keep future
+partitions ready; see debtapp.partitions.
+
+    python manage.py partition_transactions --convert     # once, in a maintenance window
+    python manage.py partition_transactions               # monthly, e.g. from cron
+    python manage.py partition_transactions --list
+    python manage.py partition_transactions --revert
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+
+from debtapp import partitions
+from debtapp.models import Transaction
+
+
+class Command(BaseCommand):
+    help = "Convert the transaction table to monthly partitions or create the upcoming ones."
+
+    def add_arguments(self, parser):
+        action = parser.add_mutually_exclusive_group()
+        action.add_argument('--convert', action='store_true', help="Rebuild the table partitioned by month.")
+        action.add_argument('--revert', action='store_true', help="Rebuild the plain, unpartitioned table.")
+        action.add_argument('--list', action='store_true', help="Show the partitions and their row estimates.")
+        parser.add_argument('--months-ahead', type=int, default=None,
+                            help="Future months to create partitions for, default PARTITION_MONTHS_AHEAD.")
+
+    def handle(self, *args, **options):
+        if options['months_ahead'] is not None and options['months_ahead'] < 0:
+            raise CommandError("--months-ahead must not be negative.")
+
+        started = time.perf_counter()
+        try:
+            if options['list']:
+                return self.list()
+            if options['convert']:
+                created = partitions.convert(options['months_ahead'])
+                if created is None:
+                    raise CommandError("The transaction table is already partitioned.")
+                message = f"Converted to {len(created)} partitions"
+            elif options['revert']:
+                if not partitions.revert():
+                    raise CommandError("The transaction table is not partitioned.")
+                message = "Reverted to a plain table"
+            else:
+                created = partitions.ensure_partitions(options['months_ahead'])
+                message = f"Created {len(created)} partitions" + (f" ({', '.join(created)})" if created else "")
+        except (NotImplementedError, ValueError) as exc:
+            raise CommandError(exc)
+        self.stdout.write(f"{message} in {time.perf_counter() - started:.1f}s")
+
+    def list(self):
+        connection = connections[router.db_for_write(Transaction)]
+        if connection.vendor != 'postgresql':
+            raise NotImplementedError(f"Partitioning is not implemented for {connection.vendor}.")
+        with connection.cursor() as cursor:
+            if not partitions.is_partitioned(cursor):
+                raise CommandError("The transaction table is not partitioned.")
+            rows = partitions.list_partitions(cursor)
+            cursor.execute(
+                "SELECT relname, reltuples::bigint FROM pg_class WHERE relname = ANY(%s)", [[name for name, _ in rows]],
+            )
+            estimates = dict(cursor.fetchall())
+        for name, bounds in rows:
+            self.stdout.write(f"{name:32} {max(estimates.get(name, 0), 0):>10} rows  {bounds}")
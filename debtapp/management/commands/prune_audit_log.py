@@ -0,0 +1,41 @@
+"""
+Apply the audit log retention period and compact older edits.
+
+Meant to run daily or weekly. Events older than AUDIT_RETENTION_DAYS (or
+--days) are deleted; edits older than --compact-after days made by the same
+user to the same debtor on the same day are merged into one event:
+
+    python manage.py prune_audit_log
+    python manage.py prune_audit_log --days 365 --compact-after 30
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from debtapp import audit
+
+
+class Command(BaseCommand):
+    help = "Delete audit events past the retention period and compact old edits."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Keep this many days of events, default AUDIT_RETENTION_DAYS.")
+        parser.add_argument('--compact-after', type=int, default=90,
+                            help="Compact edits older than this many days (0: don't compact).")
+        parser.add_argument('--batch-size', type=int, default=audit.PRUNE_BATCH, help="Rows per delete.")
+
+    def handle(self, *args, **options):
+        days = audit.retention_days() if options['days'] is None else options['days']
+        if days < 1 or options['compact_after'] < 0 or options['batch_size'] < 1:
+            raise CommandError("--days and --batch-size must be positive, --compact-after not negative.")
+
+        started = time.perf_counter()
+        deleted = audit.prune(days, options['batch_size'])
+        compacted = 0
+        if options['compact_after']:
+            compacted = audit.compact(options['compact_after'], options['batch_size'])
+        self.stdout.write(
+            f"Deleted {deleted} events older than {days} days and compacted away {compacted} "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
@@ -0,0 +1,27 @@
+"""
+Delete expired idempotency keys.
+
+Meant to run daily; a key is only needed for IDEMPOTENCY_KEY_TTL_HOURS after
+its form was posted:
+
+    python manage.py purge_idempotency_keys
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from debtapp import idempotency
+
+
+class Command(BaseCommand):
+    help = "Delete idempotency keys past their expiry."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=idempotency.PURGE_BATCH, help="Rows per delete.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive.")
+        started = time.perf_counter()
+        deleted = idempotency.purge(options['batch_size'])
+        self.stdout.write(f"Deleted {deleted} expired idempotency keys in {time.perf_counter() - started:.1f}s")
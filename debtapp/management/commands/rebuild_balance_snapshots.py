@@ -0,0 +1,33 @@
+"""
+Recompute the daily balance snapshots from the transactions.
+
+Run once after migrating, and after loading transactions in bulk (fixtures,
+imports, raw SQL), which bypasses the signals that maintain the snapshots:
+
+    python manage.py rebuild_balance_snapshots
+    python manage.py rebuild_balance_snapshots --user alice
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from debtapp import balances
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-debtor and per-creditor daily balance snapshots."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only rebuild this creditor's snapshots.")
+
+    def handle(self, *args, **options):
+        creditor = None
+        if options['user']:
+            creditor = get_user_model().objects.filter(username=options['user']).first()
+            if creditor is None:
+                raise CommandError(f"User '{options['user']}' does not exist.")
+
+        started = time.perf_counter()
+        created = balances.rebuild(creditor)
+        self.stdout.write(f"Created {created} snapshot rows in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,33 @@
+"""
+Recompute the monthly rollups from the debtors and transactions.
+
+Run once after migrating, and after loading debtors or transactions in bulk,
+which bypasses the signals that maintain the rollups:
+
+    python manage.py rebuild_rollups
+    python manage.py rebuild_rollups --user alice
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from debtapp import rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-creditor monthly debit/credit rollups."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only rebuild this creditor's rollups.")
+
+    def handle(self, *args, **options):
+        creditor = None
+        if options['user']:
+            creditor = get_user_model().objects.filter(username=options['user']).first()
+            if creditor is None:
+                raise CommandError(f"User '{options['user']}' does not exist.")
+
+        started = time.perf_counter()
+        created = rollups.rebuild(creditor)
+        self.stdout.write(f"Created {created} rollup rows in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,43 @@
+"""
+Move archived debtors' transactions back into the transaction table.
+
+    python manage.py restore_archived D00042
+    python manage.py restore_archived D00042 D00043
+
+Posting a new transaction to an archived debtor restores it automatically;
+this is for when the hot rows are needed otherwise, e.g. for search.
+"""
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from debtapp import archive
+from debtapp.models import Debtor
+
+
+class Command(BaseCommand):
+    help = "Restore the archived transactions of the given debtors."
+
+    def add_arguments(self, parser):
+        parser.add_argument('debtor_ids', nargs='+', help="Debtor ids, e.g. D00042.")
+
+    def handle(self, *args, **options):
+        debtors = {debtor.debtor_id: debtor for debtor in Debtor.objects.filter(debtor_id__in=options['debtor_ids'])}
+        unknown = [code for code in options['debtor_ids'] if code not in debtors]
+        if unknown:
+            raise CommandError(f"Unknown debtor(s): {', '.join(unknown)}")
+
+        started = time.perf_counter()
+        restored = 0
+        for code in options['debtor_ids']:
+            try:
+                count = archive.restore(debtors[code])
+            except ValidationError as exc:
+                raise CommandError(exc.messages[0])
+            if count:
+                self.stdout.write(f"{code}: restored {count} transactions")
+            else:
+                self.stdout.write(f"{code}: not archived")
+            restored += count
+        self.stdout.write(f"Restored {restored} transactions in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,43 @@
+"""
+Email every creditor a summary of yesterday and of their book.
+
+Meant to run once each morning. Use a local mail backend to try it out:
+
+    python manage.py send_daily_digest
+    python manage.py send_daily_digest --backend django.core.mail.backends.console.EmailBackend
+    python manage.py send_daily_digest --date 2026-11-01 --backend django.core.mail.backends.locmem.EmailBackend
+"""
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from debtapp import digest
+
+
+class Command(BaseCommand):
+    help = "Send the daily digest email to creditors."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Day to summarize (YYYY-MM-DD), default yesterday.")
+        parser.add_argument('--batch-size', type=int, default=digest.BATCH_SIZE,
+                            help="Messages rendered and sent per batch.")
+        parser.add_argument('--backend', help="Email backend, default EMAIL_BACKEND.")
+
+    def handle(self, *args, **options):
+        day = None
+        if options['date']:
+            try:
+                day = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Invalid date '{options['date']}', expected YYYY-MM-DD.")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        started = time.perf_counter()
+        stats = digest.dispatch(day, batch_size=options['batch_size'], backend=options['backend'])
+        self.stdout.write(
+            f"Sent {stats['sent']} of {stats['creditors']} digests "
+            f"(queries {stats['query_seconds']:.1f}s, rendering {stats['render_seconds']:.1f}s, "
+            f"sending {stats['send_seconds']:.1f}s) in {time.perf_counter() - started:.1f}s"
+        )
@@ -0,0 +1,58 @@
+"""
+Show how creditors, debtors and transactions are spread over the shards, and
+copy the user rows to them; see debtapp.sharding.
+
+    python manage.py shards
+    python manage.py shards --sync-users    # after adding a shard (migrate it first)
+
+New and changed users are copied as they are saved; --sync-users copies all
+of them, e.g. the staff users to a new shard.
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from debtapp import sharding
+from debtapp.models import Debtor, Transaction, TransactionArchive
+from debtapp.routers import active_shard
+
+
+def _counts():
+    return {
+        'users': get_user_model()._base_manager.using(active_shard()).count(),
+        'debtors': Debtor.objects.count(),
+        'transactions': Transaction.objects.count(),
+        'archived': TransactionArchive.objects.count(),
+    }
+
+
+class Command(BaseCommand):
+    help = "List the shards with their row counts, or copy the users to them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sync-users', action='store_true', help="Copy every user to its shard(s).")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['sync_users']:
+            users = get_user_model().objects.order_by('pk')
+            synced = 0
+            for user in users.iterator(chunk_size=500):
+                sharding.mirror(user)
+                synced += 1
+            self.stdout.write(f"Copied {synced} users in {time.perf_counter() - started:.1f}s")
+            return
+
+        creditors = dict(
+            (alias or sharding.DIRECTORY, count)
+            for alias, count in get_user_model().objects.order_by().values_list('shard').annotate(count=Count('pk'))
+        )
+        for alias, counts in sharding.fan_out(_counts):
+            self.stdout.write(
+                f"{alias:12} {creditors.get(alias, 0):>8} creditors {counts['debtors']:>10} debtors "
+                f"{counts['transactions']:>12} transactions {counts['archived']:>8} archived ledgers "
+                f"{counts['users']:>8} user rows"
+            )
+        self.stdout.write(f"Counted {len(sharding.shard_aliases())} shards in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,79 @@
+"""
+Check that every debtor's stored running balances, transaction types and
+status agree with the transaction amounts, and optionally fix them.
+
+The debtors are checked in slices spread over a pool of worker processes:
+
+    python manage.py verify_ledger
+    python manage.py verify_ledger --user alice --workers 1
+    python manage.py verify_ledger --repair
+
+Exits with an error when discrepancies are left unfixed, so it can run from
+cron or CI.
+"""
+import time
+from collections import Counter
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from debtapp import integrity, parallel
+
+
+class Command(BaseCommand):
+    help = "Verify running balances, debit/credit types and debtor statuses."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only verify this creditor's debtors.")
+        parser.add_argument('--workers', type=int, default=parallel.default_workers(),
+                            help="Worker processes (1: run in this process).")
+        parser.add_argument('--slice-size', type=int, default=integrity.SLICE_DEBTORS,
+                            help="Debtors per task handed to a worker.")
+        parser.add_argument('--repair', action='store_true', help="Write the fixes back.")
+        parser.add_argument('--batch-size', type=int, default=integrity.BATCH_SIZE,
+                            help="Fixes written per transaction.")
+        parser.add_argument('--show', type=int, default=integrity.SAMPLES_PER_SLICE,
+                            help="Example discrepancies to print.")
+
+    def handle(self, *args, **options):
+        creditor_id = None
+        if options['user']:
+            creditor_id = get_user_model().objects.filter(username=options['user']).values_list('pk', flat=True).first()
+            if creditor_id is None:
+                raise CommandError(f"User '{options['user']}' does not exist.")
+        if options['workers'] < 1 or options['slice_size'] < 1 or options['batch_size'] < 1:
+            raise CommandError("--workers, --slice-size and --batch-size must be positive.")
+
+        workers = options['workers']
+        if options['repair'] and connection.vendor == 'sqlite':
+            workers = 1  # SQLite takes one writer at a time
+
+        started = time.perf_counter()
+        tasks = integrity.plan_tasks(creditor_id, options['slice_size'])
+        check = partial(
+            integrity.verify_slice, repair=options['repair'], batch_size=options['batch_size'], samples=options['show'],
+        )
+        debtors = transactions = repaired = 0
+        found, samples, touched = Counter(), [], set()
+        for result in parallel.run(check, tasks, workers):
+            debtors += result['debtors']
+            transactions += result['transactions']
+            repaired += result['repaired']
+            found.update(result['found'])
+            touched |= result['touched']
+            samples += result['samples'][:options['show'] - len(samples)]
+        integrity.refresh_repaired(touched)
+
+        for kind, debtor_code, tran_id, stored, expected in samples:
+            self.stdout.write(f"{kind:8} {debtor_code:10} {tran_id:10} stored {stored}, expected {expected}")
+        summary = ", ".join(f"{found[kind]} {kind}" for kind in integrity.KINDS)
+        self.stdout.write(
+            f"Checked {debtors} debtors and {transactions} transactions in {len(tasks)} slices: "
+            f"{summary} discrepancies, {repaired} fixed in {time.perf_counter() - started:.1f}s"
+        )
+        if sum(found.values()) > repaired:
+            if options['repair']:
+                raise CommandError("Some discrepancies cannot be fixed automatically, see above.")
+            raise CommandError("Ledger discrepancies found; run with --repair to fix them.")
@@ -1,4 +1,10 @@
 # app1/middleware.py
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import audit, sharding
+from .routers import activate_shard, apin_to_primary, pin_to_primary, replica_alias
+
+
 class NoCacheMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
@@ -10,3 +16,85 @@ class NoCacheMiddleware:
             response['Pragma'] = 'no-cache'
             response['Expires'] = '0'
         return response
+
+
+class ShardMiddleware:
+    """Route the request's creditor data to the signed-in user's shard; see debtapp.sharding."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    # Not reset on the way out: a streamed response is iterated after this
+    # returns, and every request sets it afresh.
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        activate_shard(sharding.shard_for(request.user) if sharding.enabled() else None)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        activate_shard(sharding.shard_for(await request.auser()) if sharding.enabled() else None)
+        return await self.get_response(request)
+
+
+class ReplicaPinningMiddleware:
+    """After a write request, keep the user's reads on the primary for a short while."""
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self.should_pin(request):
+            pin_to_primary(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.should_pin(request):
+            await apin_to_primary(request)
+        return response
+
+    def should_pin(self, request):
+        return request.method not in self.SAFE_METHODS and replica_alias() and hasattr(request, 'session')
+
+
+class AuditMiddleware:
+    """Collect the request's audit events and write them in one INSERT once the view is done."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = audit.start()
+        try:
+            return self.get_response(request)
+        finally:
+            audit.flush(token)
+
+    async def __acall__(self, request):
+        token = audit.start()
+        try:
+            return await self.get_response(request)
+        finally:
+            await audit.aflush(token)
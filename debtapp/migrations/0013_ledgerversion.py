@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 12:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debtapp', '0012_customuser_user_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('creditor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_version', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.5 on 2026-10-19 12:21
+
+from django.db import migrations, models
+
+# PostgreSQL only: trigram index for name substring/similarity search and
+# pattern-ops indexes so prefix LIKE on mobile/debtor_id can use a btree
+# regardless of the database collation.
+POSTGRES_INDEXES = [
+    ('debtor_name_trgm_idx', 'USING gin (UPPER("name") gin_trgm_ops)'),
+    ('debtor_mobile_prefix_idx', '("mobile" varchar_pattern_ops)'),
+    ('debtor_debtor_id_prefix_idx', '("debtor_id" varchar_pattern_ops)'),
+]
+
+
+def create_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, definition in POSTGRES_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON "debtapp_debtor" {definition}'
+        )
+
+
+def drop_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in POSTGRES_INDEXES:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('debtapp', '0013_ledgerversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='debtor',
+            index=models.Index(fields=['created_by', 'name'], name='debtor_creditor_name_idx'),
+        ),
+        migrations.RunPython(create_postgres_indexes, drop_postgres_indexes),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 5.2.5 on 2026-10-19 12:25
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# PostgreSQL only: keep Transaction.search_vector up to date with triggers
+# and index it with GIN. The document is the transaction description and the
+# debtor's voucher/cheque number (weight A) plus the debt purpose (weight B).
+BACKFILL_BATCH = 50000
+
+CREATE_TRIGGERS = """
+CREATE OR REPLACE FUNCTION debtapp_transaction_search_vector() RETURNS trigger AS $$
+BEGIN
+    SELECT setweight(to_tsvector('english', coalesce(NEW.tran_desc, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(d.voucher_cheque_no, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(d.debt_purpose, '')), 'B')
+      INTO NEW.search_vector
+      FROM debtapp_debtor d
+     WHERE d.id = NEW.debtor_id;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS debtapp_transaction_search_vector ON debtapp_transaction;
+CREATE TRIGGER debtapp_transaction_search_vector
+    BEFORE INSERT OR UPDATE OF tran_desc, debtor_id, search_vector ON debtapp_transaction
+    FOR EACH ROW EXECUTE FUNCTION debtapp_transaction_search_vector();
+
+-- Re-index a debtor's transactions when the debtor part of the document changes.
+CREATE OR REPLACE FUNCTION debtapp_debtor_search_vector() RETURNS trigger AS $$
+BEGIN
+    UPDATE debtapp_transaction SET tran_desc = tran_desc WHERE debtor_id = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS debtapp_debtor_search_vector ON debtapp_debtor;
+CREATE TRIGGER debtapp_debtor_search_vector
+    AFTER UPDATE OF debt_purpose, voucher_cheque_no ON debtapp_debtor
+    FOR EACH ROW
+    WHEN (OLD.debt_purpose IS DISTINCT FROM NEW.debt_purpose
+          OR OLD.voucher_cheque_no IS DISTINCT FROM NEW.voucher_cheque_no)
+    EXECUTE FUNCTION debtapp_debtor_search_vector();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS debtapp_debtor_search_vector ON debtapp_debtor;
+DROP FUNCTION IF EXISTS debtapp_debtor_search_vector();
+DROP TRIGGER IF EXISTS debtapp_transaction_search_vector ON debtapp_transaction;
+DROP FUNCTION IF EXISTS debtapp_transaction_search_vector();
+"""
+
+
+def create_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(CREATE_TRIGGERS)
+
+    # Backfill in id ranges so a large table is not rewritten in one transaction.
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT coalesce(max(id), 0) FROM debtapp_transaction')
+        max_id = cursor.fetchone()[0]
+        for start in range(0, max_id, BACKFILL_BATCH):
+            cursor.execute(
+                'UPDATE debtapp_transaction SET tran_desc = tran_desc WHERE id > %s AND id <= %s',
+                [start, start + BACKFILL_BATCH],
+            )
+
+    schema_editor.execute(
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS "transaction_search_vector_idx" '
+        'ON "debtapp_transaction" USING gin ("search_vector")'
+    )
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS "transaction_search_vector_idx"')
+    schema_editor.execute(DROP_TRIGGERS)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY and the batched backfill need autocommit
+    atomic = False
+
+    dependencies = [
+        ('debtapp', '0014_debtor_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
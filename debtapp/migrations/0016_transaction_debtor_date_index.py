@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-19 12:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debtapp', '0015_transaction_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['debtor', 'tran_date', 'id'], name='tran_debtor_date_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-19 12:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debtapp', '0016_transaction_debtor_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditorDailyBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('total_debit', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_credit', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('last_tran_id', models.BigIntegerField(default=0)),
+                ('creditor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_balances', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('creditor', 'day'), name='creditor_daily_balance_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DebtorDailyBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('total_debit', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_credit', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('last_tran_id', models.BigIntegerField(default=0)),
+                ('debtor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_balances', to='debtapp.debtor')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('debtor', 'day'), name='debtor_daily_balance_uniq')],
+            },
+        ),
+    ]
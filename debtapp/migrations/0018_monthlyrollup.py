@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-19 12:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debtapp', '0017_daily_balances'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('total_debit', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_credit', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('new_debtors', models.PositiveIntegerField(default=0)),
+                ('recoveries', models.PositiveIntegerField(default=0)),
+                ('creditor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('creditor', 'month'), name='monthly_rollup_uniq')],
+            },
+        ),
+    ]
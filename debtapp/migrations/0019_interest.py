@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-19 12:41
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debtapp', '0018_monthlyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InterestTerms',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('annual_rate', models.DecimalField(decimal_places=2, default=0, help_text='Percent per year', max_digits=5, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)])),
+                ('compounding', models.CharField(choices=[('simple', 'Simple'), ('monthly', 'Monthly'), ('daily', 'Daily')], default='simple', max_length=10)),
+                ('grace_days', models.PositiveIntegerField(default=0, help_text='Days after the debt date before interest starts')),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('debtor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='interest_terms', to='debtapp.debtor')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InterestAccrual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('accrual_date', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('debtor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='interest_accruals', to='debtapp.debtor')),
+                ('transaction', models.OneToOneField(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='interest_accrual', to='debtapp.transaction')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('debtor', 'accrual_date'), name='interest_accrual_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-19 12:50
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debtapp', '0019_interest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentPlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=12, validators=[django.core.validators.MinValueValidator(0.01)])),
+                ('installment_count', models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(360)])),
+                ('frequency', models.CharField(choices=[('weekly', 'Weekly'), ('biweekly', 'Every two weeks'), ('monthly', 'Monthly')], default='monthly', max_length=10)),
+                ('start_date', models.DateField(help_text='Due date of the first installment')),
+                ('status', models.CharField(choices=[('active', 'Active'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], default='active', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('creditor', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payment_plans', to=settings.AUTH_USER_MODEL)),
+                ('debtor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_plans', to='debtapp.debtor')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Installment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveSmallIntegerField()),
+                ('due_date', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('paid_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('is_paid', models.BooleanField(default=False)),
+                ('paid_at', models.DateTimeField(blank=True, null=True)),
+                ('creditor', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='installments', to=settings.AUTH_USER_MODEL)),
+                ('debtor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='installments', to='debtapp.debtor')),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='installments', to='debtapp.paymentplan')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('is_paid', False)), fields=['due_date'], name='installment_open_due_idx'), models.Index(condition=models.Q(('is_paid', False)), fields=['creditor', 'due_date'], name='installment_creditor_due_idx')],
+                'constraints': [models.UniqueConstraint(fields=('plan', 'sequence'), name='installment_plan_sequence_uniq')],
+            },
+        ),
+    ]
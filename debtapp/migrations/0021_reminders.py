@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-19 13:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debtapp', '0020_payment_plans'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sent_on', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='installment',
+            index=models.Index(condition=models.Q(('is_paid', False)), fields=['creditor', 'id'], name='installment_creditor_id_idx'),
+        ),
+        migrations.AddField(
+            model_name='reminderlog',
+            name='creditor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='reminderlog',
+            name='installment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='debtapp.installment'),
+        ),
+        migrations.AddConstraint(
+            model_name='reminderlog',
+            constraint=models.UniqueConstraint(fields=('installment', 'sent_on'), name='reminder_installment_day_uniq'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+# PostgreSQL only: transactions are stamped with the time they are saved, so
+# tran_date follows the physical row order and a BRIN index (a few pages for
+# millions of rows) serves day-range scans such as the daily digest.
+INDEX = 'tran_date_brin_idx'
+
+
+def create_brin_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{INDEX}" ON "debtapp_transaction" USING brin ("tran_date")'
+    )
+
+
+def drop_brin_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{INDEX}"')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('debtapp', '0021_reminders'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_brin_index, drop_brin_index),
+    ]
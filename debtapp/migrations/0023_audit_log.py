@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-19 13:34
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debtapp', '0022_transaction_date_brin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actor_name', models.CharField(blank=True, max_length=150)),
+                ('debtor_ref', models.PositiveBigIntegerField(blank=True, help_text='Debtor primary key', null=True)),
+                ('debtor_code', models.CharField(blank=True, max_length=10)),
+                ('action', models.CharField(choices=[('debtor_created', 'Debtor created'), ('debtor_edited', 'Debtor edited'), ('opening_reset', 'Opening balance reset'), ('debtor_deleted', 'Moved to recycle bin'), ('debtor_restored', 'Restored from recycle bin'), ('debtor_hard_deleted', 'Permanently deleted'), ('debtor_purged', 'Purged from recycle bin')], max_length=30)),
+                ('details', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='audit_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['debtor_ref', 'created_at'], name='audit_debtor_idx'), models.Index(fields=['actor', 'created_at'], name='audit_actor_idx'), models.Index(fields=['created_at'], name='audit_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-19 13:40
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debtapp', '0024_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row_count', models.PositiveIntegerField()),
+                ('total_debit', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('total_credit', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('first_date', models.DateTimeField()),
+                ('last_date', models.DateTimeField()),
+                ('months', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('data', models.BinaryField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('debtor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='transaction_archive', to='debtapp.debtor')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debtapp', '0025_transaction_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='shard',
+            field=models.CharField(blank=True, default='', editable=False, max_length=30),
+        ),
+    ]
@@ -1,8 +1,10 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models 
 from django.conf import settings 
-from django.db import transaction 
+from django.contrib.postgres.search import SearchVectorField
+from django.db import router, transaction
 from django.core.exceptions import ValidationError 
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator, MaxValueValidator, RegexValidator 
 import os
 import uuid
@@ -75,6 +77,10 @@ class CustomUser(AbstractUser):
     )
     
     user_created_at = models.DateField(auto_now_add=True, blank=True, null=True)
+    # Database of the user's debtors and transactions when SHARD_DATABASES lists
+    # several; blank is 'default'. See debtapp.sharding.
+    shard = models.CharField(max_length=30, blank=True, default='', editable=False)
+
     def __str__(self):
         return f"{self.username}"
 
@@ -157,6 +163,13 @@ class Debtor(models.Model):
             
         super().save(*args, **kwargs)
 
+    class Meta:
+        indexes = [
+            # per-creditor name prefix search (autocomplete fallback); the
+            # PostgreSQL trigram/pattern indexes are created in migration 0014
+            models.Index(fields=['created_by', 'name'], name='debtor_creditor_name_idx'),
+        ]
+
     # class Meta:
     #     ordering = ['-created_at']
     #     verbose_name = 'Debtor'
@@ -173,7 +186,7 @@ class Debtor(models.Model):
     def save(self, *args, **kwargs):
         """Custom save to generate debtor_id"""
         if not self.debtor_id:
-            with transaction.atomic():
+            with transaction.atomic(using=kwargs.get('using') or router.db_for_write(type(self), instance=self)):
                 super().save(*args, **kwargs)  # First save to get PK
                 self.debtor_id = f"D{self.pk:05d}"
                 kwargs['force_insert'] = False
@@ -186,12 +199,22 @@ class Debtor(models.Model):
     def current_debt(self):
         """Calculate current debt from transactions"""
         latest_tran = self.transactions.order_by('-tran_date').first()
-        return latest_tran.current_debt if latest_tran else self.total_debt
+        if latest_tran:
+            return latest_tran.current_debt
+        archived = TransactionArchive.objects.filter(debtor=self).values_list('balance', flat=True).first()
+        return self.total_debt if archived is None else archived
 
    
     def __str__(self):
         return f"{self.name} ({self.debtor_id})"
 
+class TransactionManager(models.Manager):
+    """Leaves out the search document; transaction search only filters and ranks on it in SQL."""
+
+    def get_queryset(self):
+        return super().get_queryset().defer('search_vector')
+
+
 class Transaction(models.Model):
     """Model representing debt transactions"""
     TRANSACTION_TYPES = [
@@ -231,6 +254,18 @@ class Transaction(models.Model):
     )
     tran_date = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Full-text search document (tran_desc + debtor's debt_purpose and
+    # voucher_cheque_no). Maintained by PostgreSQL triggers, see migration 0015.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = TransactionManager()
+
+    class Meta:
+        indexes = [
+            # a debtor's ledger in date order: latest balance lookups and the
+            # running totals of the aging report
+            models.Index(fields=['debtor', 'tran_date', 'id'], name='tran_debtor_date_idx'),
+        ]
 
     # class Meta:
     #     ordering = ['-tran_date']
@@ -245,8 +280,9 @@ class Transaction(models.Model):
     def save(self, *args, **kwargs):
         """Generate transaction ID and calculate current debt"""
         if not self.tran_id:
-            last_tran = Transaction.objects.order_by('-id').first()
-            last_num = int(last_tran.tran_id[4:]) if last_tran else 0
+            # Bulk-posted rows (e.g. interest) use their own prefixes
+            last_tran = Transaction.objects.filter(tran_id__startswith='Txn').order_by('-id').first()
+            last_num = int(last_tran.tran_id[3:]) if last_tran else 0
             self.tran_id = f"Txn{last_num + 1:05d}"
         
               
@@ -265,4 +301,326 @@ class Transaction(models.Model):
 
     def __str__(self):
         return (f"{self.tran_id} - {self.debtor.name} - "
-                f"{self.tran_type} ${self.tran_amount}")
\ No newline at end of file
+                f"{self.tran_type} ${self.tran_amount}")
+
+class LedgerVersion(models.Model):
+    """Counter bumped on every write to a creditor's debtors or transactions.
+
+    Caches of derived data (dashboard fragments, exports) include it in their
+    key, so a write invalidates them without having to find and delete them.
+    """
+    creditor = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='ledger_version'
+    )
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.creditor_id} v{self.version}"
+
+
+class DailyBalance(models.Model):
+    """Running totals at the end of `day` (local time), through transaction `last_tran_id`.
+
+    Rows are kept up to date as transactions are saved and dropped from the
+    day of an edit or delete onwards; see debtapp.balances.
+    """
+    day = models.DateField()
+    total_debit = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_credit = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    last_tran_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def balance(self):
+        return self.total_debit - self.total_credit
+
+
+class DebtorDailyBalance(DailyBalance):
+    debtor = models.ForeignKey(Debtor, on_delete=models.CASCADE, related_name='daily_balances')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['debtor', 'day'], name='debtor_daily_balance_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.debtor_id} {self.day}: {self.balance}"
+
+
+class CreditorDailyBalance(DailyBalance):
+    creditor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='daily_balances'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['creditor', 'day'], name='creditor_daily_balance_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.creditor_id} {self.day}: {self.balance}"
+
+
+class MonthlyRollup(models.Model):
+    """Per creditor and calendar month: debits, credits, new debtors and recoveries.
+
+    Kept up to date as debtors and transactions are saved; see debtapp.rollups.
+    """
+    creditor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='monthly_rollups'
+    )
+    month = models.DateField(help_text="First day of the month")
+    total_debit = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_credit = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    new_debtors = models.PositiveIntegerField(default=0)
+    recoveries = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['creditor', 'month'], name='monthly_rollup_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.creditor_id} {self.month:%Y-%m}"
+
+
+class InterestTerms(models.Model):
+    """Optional interest charged on a debtor's outstanding balance; see debtapp.interest."""
+    COMPOUNDING_CHOICES = [
+        ('simple', 'Simple'),
+        ('monthly', 'Monthly'),
+        ('daily', 'Daily'),
+    ]
+
+    debtor = models.OneToOneField(Debtor, on_delete=models.CASCADE, related_name='interest_terms')
+    annual_rate = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        default=0,
+        validators=[MinValueValidator(0), MaxValueValidator(100)],
+        help_text="Percent per year"
+    )
+    compounding = models.CharField(max_length=10, choices=COMPOUNDING_CHOICES, default='simple')
+    grace_days = models.PositiveIntegerField(default=0, help_text="Days after the debt date before interest starts")
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.debtor_id} {self.annual_rate}% {self.compounding}"
+
+
+class InterestAccrual(models.Model):
+    """Interest posted for one debtor and day; at most one per day makes the accrual job idempotent.
+
+    Deleting the posted transaction (e.g. to waive it) keeps this row, so the
+    day is not charged again.
+    """
+    debtor = models.ForeignKey(Debtor, on_delete=models.CASCADE, related_name='interest_accruals')
+    accrual_date = models.DateField()
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    transaction = models.OneToOneField(
+        Transaction,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='interest_accrual'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['debtor', 'accrual_date'], name='interest_accrual_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.debtor_id} {self.accrual_date}: {self.amount}"
+
+
+class PaymentPlan(models.Model):
+    """An agreement to pay `total_amount` in installments; see debtapp.plans."""
+    FREQUENCY_CHOICES = [
+        ('weekly', 'Weekly'),
+        ('biweekly', 'Every two weeks'),
+        ('monthly', 'Monthly'),
+    ]
+    STATUS_CHOICES = [
+        ('active', 'Active'),
+        ('completed', 'Completed'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    debtor = models.ForeignKey(Debtor, on_delete=models.CASCADE, related_name='payment_plans')
+    # Denormalized from debtor.created_by so installment queries need no join
+    creditor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='payment_plans'
+    )
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(0.01)])
+    installment_count = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(360)])
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default='monthly')
+    start_date = models.DateField(help_text="Due date of the first installment")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.debtor_id}: {self.total_amount} in {self.installment_count} ({self.status})"
+
+
+class Installment(models.Model):
+    """One due payment of a plan. Credits are matched to open installments oldest due first."""
+    plan = models.ForeignKey(PaymentPlan, on_delete=models.CASCADE, related_name='installments')
+    # Denormalized from the plan for the due-date queries
+    debtor = models.ForeignKey(Debtor, on_delete=models.CASCADE, related_name='installments')
+    creditor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='installments'
+    )
+    sequence = models.PositiveSmallIntegerField()
+    due_date = models.DateField()
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    paid_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    is_paid = models.BooleanField(default=False)
+    paid_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['plan', 'sequence'], name='installment_plan_sequence_uniq'),
+        ]
+        indexes = [
+            # "due this week" / "overdue" across all creditors, and per creditor;
+            # partial so paid installments don't grow the indexes
+            models.Index(fields=['due_date'], name='installment_open_due_idx', condition=models.Q(is_paid=False)),
+            models.Index(
+                fields=['creditor', 'due_date'], name='installment_creditor_due_idx', condition=models.Q(is_paid=False),
+            ),
+            # keyset walk of a creditor's unpaid installments (reminders)
+            models.Index(
+                fields=['creditor', 'id'], name='installment_creditor_id_idx', condition=models.Q(is_paid=False),
+            ),
+        ]
+
+    @property
+    def remaining(self):
+        return self.amount - self.paid_amount
+
+    def __str__(self):
+        return f"{self.plan_id}#{self.sequence} due {self.due_date}: {self.amount}"
+
+
+class ReminderLog(models.Model):
+    """Marks an overdue installment as reminded on `sent_on`; reruns skip marked installments."""
+    installment = models.ForeignKey(Installment, on_delete=models.CASCADE, related_name='reminders')
+    creditor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='reminders'
+    )
+    sent_on = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['installment', 'sent_on'], name='reminder_installment_day_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.installment_id} reminded {self.sent_on}"
+
+
+class AuditEvent(models.Model):
+    """Append-only record of who changed a debtor, how and when; see debtapp.audit."""
+    ACTIONS = [
+        ('debtor_created', 'Debtor created'),
+        ('debtor_edited', 'Debtor edited'),
+        ('opening_reset', 'Opening balance reset'),
+        ('debtor_deleted', 'Moved to recycle bin'),
+        ('debtor_restored', 'Restored from recycle bin'),
+        ('debtor_hard_deleted', 'Permanently deleted'),
+        ('debtor_purged', 'Purged from recycle bin'),
+    ]
+
+    created_at = models.DateTimeField(default=timezone.now)
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='audit_events'
+    )
+    # Copies rather than foreign keys, so the trail outlives deleted users and debtors
+    actor_name = models.CharField(max_length=150, blank=True)
+    debtor_ref = models.PositiveBigIntegerField(null=True, blank=True, help_text="Debtor primary key")
+    debtor_code = models.CharField(max_length=10, blank=True)
+    action = models.CharField(max_length=30, choices=ACTIONS)
+    details = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['debtor_ref', 'created_at'], name='audit_debtor_idx'),
+            models.Index(fields=['actor', 'created_at'], name='audit_actor_idx'),
+            models.Index(fields=['created_at'], name='audit_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("Audit events are append-only.")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.created_at:%Y-%m-%d %H:%M} {self.actor_name or 'system'} {self.action} {self.debtor_code}"
+
+
+class IdempotencyKey(models.Model):
+    """A form POST that was processed, so a repeat with the same key replays its result; see debtapp.idempotency."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='idempotency_keys'
+    )
+    scope = models.CharField(max_length=30)
+    key = models.CharField(max_length=64)
+    result_url = models.CharField(max_length=500)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'key'], name='idempotency_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key}"
+
+
+class TransactionArchive(models.Model):
+    """Transactions of a long-recovered debtor, moved out of Transaction and stored compressed; see debtapp.archive."""
+    debtor = models.OneToOneField(Debtor, on_delete=models.CASCADE, related_name='transaction_archive')
+    row_count = models.PositiveIntegerField()
+    total_debit = models.DecimalField(max_digits=14, decimal_places=2)
+    total_credit = models.DecimalField(max_digits=14, decimal_places=2)
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    first_date = models.DateTimeField()
+    last_date = models.DateTimeField()
+    # {'YYYY-MM-01': [debit, credit, recoveries]}, so monthly rollups still count the archived rows
+    months = models.JSONField(encoder=DjangoJSONEncoder)
+    # zlib-compressed JSON lines, one transaction per line in ledger order
+    data = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.debtor_id}: {self.row_count} transactions"
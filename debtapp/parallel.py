@@ -0,0 +1,53 @@
+"""
+Process pool for work split into tasks: management commands, the full backup.
+
+Workers are spawned rather than forked so that none of them inherits the
+parent's database connections; each one sets Django up on start and opens its
+own. The routing of the caller, replica reads and the active shard
+(debtapp.sharding), applies in the workers too.
+Tasks and results must be picklable and the task function importable
+(defined at module level).
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+import django
+
+from .routers import apply_routing, routing
+
+
+def _init_worker(state):
+    django.setup()
+    apply_routing(state)
+
+
+def default_workers():
+    return min(os.cpu_count() or 1, 8)
+
+
+def run(func, tasks, workers=None):
+    """
+    Yield func(task) for every task as the tasks finish, in `workers`
+    processes (default: one per CPU, at most 8). With a single worker the
+    tasks run in this process, in order.
+    """
+    workers = workers or default_workers()
+    if workers == 1:
+        for task in tasks:
+            yield func(task)
+        return
+
+    # Spawned workers inherit no connections, so the caller's stay as they are
+    pool = ProcessPoolExecutor(
+        workers, mp_context=get_context('spawn'), initializer=_init_worker, initargs=(routing(),),
+    )
+    try:
+        futures = [pool.submit(func, task) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # Also when the caller stops early (a failed task, a download the
+        # client gave up on): drop the queued tasks and don't wait for the
+        # running ones, whose results nobody will read
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,283 @@
+"""
+Monthly range partitioning of the transaction table (PostgreSQL only).
+
+Optional: `manage.py partition_transactions --convert` rebuilds
+debtapp_transaction as a table partitioned by the local month of
+`tran_date`, and a monthly run of `manage.py partition_transactions` keeps
+PARTITION_MONTHS_AHEAD future partitions ready. Queries with a date range
+(rollup months, the daily digest, balance windows, date-filtered exports)
+then only read the partitions of their months.
+
+The model does not change; the differences are in the database:
+
+- the primary key is (id, tran_date), since PostgreSQL wants the partition
+  key in every unique index; ids still come from a single sequence
+- tran_id stays unique across partitions through the
+  debtapp_transaction_tran_id table, which a trigger keeps in step
+- InterestAccrual.transaction has no database foreign key (one cannot
+  reference part of a key); Django still applies its on_delete
+- rows outside the existing partitions land in a default partition;
+  ensure_partitions() moves them out when it creates their month
+- lookups by id alone probe the index of every partition
+
+`--revert` rebuilds the plain table. Both directions copy the table under an
+exclusive lock, so run them in a maintenance window. Migrations that create
+indexes CONCURRENTLY on the transaction table must run while it is plain.
+"""
+from datetime import datetime, time
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from . import rollups
+from .models import Transaction
+
+TABLE = Transaction._meta.db_table
+SEQUENCE = f'{TABLE}_id_seq'
+DEFAULT_PARTITION = f'{TABLE}_default'
+REGISTRY = f'{TABLE}_tran_id'
+REGISTRY_TRIGGER = f'{TABLE}_tran_id_unique'
+UNIQUE_TRAN_ID = f'{TABLE}_tran_id_key'
+
+REGISTRY_SQL = f"""
+CREATE TABLE {REGISTRY} (tran_id varchar(10) PRIMARY KEY);
+INSERT INTO {REGISTRY} SELECT tran_id FROM {TABLE};
+
+CREATE OR REPLACE FUNCTION {REGISTRY_TRIGGER}() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO {REGISTRY} VALUES (NEW.tran_id);
+    ELSIF TG_OP = 'DELETE' THEN
+        DELETE FROM {REGISTRY} WHERE tran_id = OLD.tran_id;
+    ELSIF NEW.tran_id IS DISTINCT FROM OLD.tran_id THEN
+        UPDATE {REGISTRY} SET tran_id = NEW.tran_id WHERE tran_id = OLD.tran_id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER {REGISTRY_TRIGGER}
+    AFTER INSERT OR DELETE OR UPDATE OF tran_id ON {TABLE}
+    FOR EACH ROW EXECUTE FUNCTION {REGISTRY_TRIGGER}();
+"""
+
+
+def months_ahead():
+    return getattr(settings, 'PARTITION_MONTHS_AHEAD', 3)
+
+
+def _connection():
+    connection = connections[router.db_for_write(Transaction)]
+    if connection.vendor != 'postgresql':
+        raise NotImplementedError(f"Partitioning is not implemented for {connection.vendor}.")
+    return connection
+
+
+def _month_start(month):
+    return timezone.make_aware(datetime.combine(month, time.min))
+
+
+def _next_month(month):
+    return month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+
+
+def _add_months(month, count):
+    for _ in range(count):
+        month = _next_month(month)
+    return month
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y_%m}'
+
+
+def is_partitioned(cursor):
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)", [TABLE])
+    return cursor.fetchone()[0]
+
+
+def _definitions(cursor):
+    """(indexes, foreign keys, triggers) of the table as (name, SQL) pairs, to recreate after a rebuild."""
+    cursor.execute(
+        """
+        SELECT i.indexrelid::regclass::text, pg_get_indexdef(i.indexrelid)
+          FROM pg_index i
+         WHERE i.indrelid = %s::regclass
+           AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+        """,
+        [TABLE],
+    )
+    indexes = cursor.fetchall()
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [TABLE],
+    )
+    foreign_keys = [(name, f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} {sql}') for name, sql in cursor.fetchall()]
+    cursor.execute(
+        "SELECT tgname, pg_get_triggerdef(oid) FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal",
+        [TABLE],
+    )
+    triggers = [(name, sql) for name, sql in cursor.fetchall() if name != REGISTRY_TRIGGER]
+    return indexes, foreign_keys, triggers
+
+
+def _next_id(cursor):
+    # Not max(id): archived transactions keep ids the sequence has handed out
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+    sequence = cursor.fetchone()[0]
+    cursor.execute(f'SELECT last_value + CASE WHEN is_called THEN 1 ELSE 0 END FROM {sequence}')
+    next_id = cursor.fetchone()[0]
+    cursor.execute(f'SELECT coalesce(max(id), 0) + 1 FROM {TABLE}')
+    return max(next_id, cursor.fetchone()[0])
+
+
+def _referencing_fields():
+    """Concrete foreign keys (e.g. InterestAccrual.transaction) that point at Transaction."""
+    return [
+        rel.field for rel in Transaction._meta.related_objects
+        if rel.field.concrete and rel.field.target_field.model is Transaction
+    ]
+
+
+def _rebuild(cursor, create_table):
+    """Swap the table for a copy made by `create_table`; returns the old definitions to recreate."""
+    definitions = _definitions(cursor)
+    next_id = _next_id(cursor)
+    cursor.execute(f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE')
+    cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {TABLE}_old')
+    create_table(cursor)
+    cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {TABLE}_old')
+    # Takes the foreign keys pointing at the old table with it
+    cursor.execute(f'DROP TABLE {TABLE}_old CASCADE')
+    return definitions, next_id
+
+
+def _recreate(cursor, definitions):
+    indexes, foreign_keys, triggers = definitions
+    for _, sql in indexes + foreign_keys + triggers:
+        cursor.execute(sql)
+
+
+def convert(ahead=None):
+    """Rebuild the transaction table partitioned by month. Returns the partitions created, None if it already was."""
+    connection = _connection()
+    ahead = months_ahead() if ahead is None else ahead
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        if is_partitioned(cursor):
+            return None
+        cursor.execute(f'SELECT min(tran_date) FROM {TABLE}')
+        first = rollups.month_of(cursor.fetchone()[0] or timezone.now())
+        last = _add_months(rollups.month_of(timezone.localdate()), ahead)
+
+        def create_table(cursor):
+            # LIKE copies the columns in order with NOT NULL and defaults, but not the identity
+            cursor.execute(f'CREATE TABLE {TABLE} (LIKE {TABLE}_old INCLUDING DEFAULTS) PARTITION BY RANGE (tran_date)')
+            cursor.execute(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT')
+            month = first
+            while month <= last:
+                _create_partition(cursor, month)
+                month = _next_month(month)
+
+        definitions, next_id = _rebuild(cursor, create_table)
+        cursor.execute(f'CREATE SEQUENCE {SEQUENCE} AS bigint OWNED BY {TABLE}.id')
+        cursor.execute('SELECT setval(%s, %s, false)', [SEQUENCE, next_id])
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{SEQUENCE}')")
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, tran_date)')
+        _recreate(cursor, definitions)
+        cursor.execute(REGISTRY_SQL)
+        # The copies have no planner statistics until autovacuum gets to them
+        cursor.execute(f'ANALYZE {TABLE}')
+        return [name for name, _ in list_partitions(cursor)]
+
+
+def revert():
+    """Rebuild the plain, unpartitioned transaction table. Returns False if it was not partitioned."""
+    connection = _connection()
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            return False
+
+        def create_table(cursor):
+            cursor.execute(f'CREATE TABLE {TABLE} (LIKE {TABLE}_old INCLUDING DEFAULTS)')
+            # The default points at the sequence that is dropped with the old table
+            cursor.execute(f'ALTER TABLE {TABLE} ALTER COLUMN id DROP DEFAULT')
+
+        definitions, next_id = _rebuild(cursor, create_table)
+        cursor.execute(f'DROP TABLE {REGISTRY}')
+        cursor.execute(f'DROP FUNCTION {REGISTRY_TRIGGER}()')
+        cursor.execute(f'ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY (START WITH {next_id})')
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id)')
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {UNIQUE_TRAN_ID} UNIQUE (tran_id)')
+        _recreate(cursor, definitions)
+        for field in _referencing_fields():
+            table, column = field.model._meta.db_table, field.column
+            cursor.execute(
+                f'ALTER TABLE {table} ADD CONSTRAINT {f"{table}_{column}_fk"[:63]} FOREIGN KEY ({column}) '
+                f'REFERENCES {TABLE} (id) DEFERRABLE INITIALLY DEFERRED'
+            )
+        cursor.execute(f'ANALYZE {TABLE}')
+        return True
+
+
+def _create_partition(cursor, month):
+    name = partition_name(month)
+    start, end = _month_start(month), _month_start(_next_month(month))
+    cursor.execute(
+        f'SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE tran_date >= %s AND tran_date < %s)', [start, end],
+    )
+    if not cursor.fetchone()[0]:
+        cursor.execute(f'CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)', [start, end])
+        return
+    # Rows of this month went to the default partition: move them into a new
+    # table and attach that. The move deletes their tran_ids from the
+    # registry, so register them again once the table is attached.
+    cursor.execute(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)')
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE tran_date >= %s AND tran_date < %s RETURNING *) '
+        f'INSERT INTO {name} SELECT * FROM moved',
+        [start, end],
+    )
+    cursor.execute(f'ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)', [start, end])
+    cursor.execute(f'INSERT INTO {REGISTRY} SELECT tran_id FROM {name}')
+
+
+def list_partitions(cursor):
+    """(name, bounds) of every partition, oldest month first and the default partition last."""
+    cursor.execute(
+        """
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+          FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+         WHERE i.inhparent = %s::regclass
+         ORDER BY c.relname = %s, c.relname
+        """,
+        [TABLE, DEFAULT_PARTITION],
+    )
+    return cursor.fetchall()
+
+
+def ensure_partitions(ahead=None):
+    """
+    Create the missing monthly partitions from this month to `ahead` months
+    on, and for any month with rows in the default partition. Returns the
+    names created.
+    """
+    connection = _connection()
+    ahead = months_ahead() if ahead is None else ahead
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            raise ValueError("The transaction table is not partitioned; convert it first.")
+        existing = {name for name, _ in list_partitions(cursor)}
+        this_month = rollups.month_of(timezone.localdate())
+        months = {_add_months(this_month, offset) for offset in range(ahead + 1)}
+        cursor.execute(
+            f'SELECT DISTINCT date_trunc(\'month\', tran_date AT TIME ZONE %s)::date FROM {DEFAULT_PARTITION}',
+            [timezone.get_current_timezone_name()],
+        )
+        months |= {month for month, in cursor.fetchall()}
+        created = []
+        for month in sorted(months):
+            if partition_name(month) not in existing:
+                _create_partition(cursor, month)
+                created.append(partition_name(month))
+        return created
@@ -0,0 +1,247 @@
+"""
+Payment plans and installment schedules.
+
+A PaymentPlan splits an amount into equal installments (the odd cents go to
+the first ones) due weekly, every two weeks or monthly from a start date.
+Plans are created and rescheduled in bulk: a constant number of queries per
+call however many plans it touches.
+
+Cancelling or rescheduling a plan removes its unpaid installments, so every
+unpaid installment belongs to an active plan.
+
+Credits are matched to the debtor's open installments as they are saved,
+earliest due first; a partly paid installment stays open for the rest.
+Editing or deleting a credit re-matches that debtor's plans from scratch.
+
+Installments carry their debtor and creditor, and open ones are indexed by
+due date (overall and per creditor), so due-soon and overdue lists are a
+range scan on the index.
+"""
+import calendar
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Exists, F, Max, OuterRef, Sum
+from django.utils import timezone
+
+from . import sharding
+from .models import Installment, PaymentPlan, Transaction
+
+ACTIVE = 'active'
+COMPLETED = 'completed'
+CANCELLED = 'cancelled'
+BATCH_SIZE = 2000
+DUE_SOON_DAYS = 7
+
+
+def due_date(start, frequency, index):
+    """Due date of installment `index` (0-based); monthly keeps the start's day where it exists."""
+    if frequency == 'weekly':
+        return start + timedelta(weeks=index)
+    if frequency == 'biweekly':
+        return start + timedelta(weeks=2 * index)
+    month = start.month - 1 + index
+    year, month = start.year + month // 12, month % 12 + 1
+    return start.replace(year=year, month=month, day=min(start.day, calendar.monthrange(year, month)[1]))
+
+
+def split_amount(total, count):
+    """`total` in `count` installments that differ by at most a cent."""
+    base, extra = divmod(int(Decimal(total) * 100), count)
+    return [Decimal(base + (1 if i < extra else 0)) / 100 for i in range(count)]
+
+
+def _installments(plan, amount, count, frequency, start, first_sequence=1):
+    return [
+        Installment(
+            plan_id=plan.pk,
+            debtor_id=plan.debtor_id,
+            creditor_id=plan.creditor_id,
+            sequence=first_sequence + i,
+            due_date=due_date(start, frequency, i),
+            amount=part,
+        )
+        for i, part in enumerate(split_amount(amount, count))
+    ]
+
+
+def create_plans(entries):
+    """
+    Create plans with their schedules. `entries` are dicts with debtor,
+    total_amount, installment_count, frequency and start_date.
+    """
+    plans = [
+        PaymentPlan(
+            debtor_id=entry['debtor'].pk,
+            creditor_id=entry['debtor'].created_by_id,
+            total_amount=entry['total_amount'],
+            installment_count=entry['installment_count'],
+            frequency=entry['frequency'],
+            start_date=entry['start_date'],
+        )
+        for entry in entries
+    ]
+    with sharding.atomic():
+        PaymentPlan.objects.bulk_create(plans, batch_size=BATCH_SIZE)
+        Installment.objects.bulk_create(
+            [
+                installment
+                for plan in plans
+                for installment in _installments(
+                    plan, plan.total_amount, plan.installment_count, plan.frequency, plan.start_date,
+                )
+            ],
+            batch_size=BATCH_SIZE,
+        )
+    return plans
+
+
+def reschedule(plans, start_date, installment_count=None, frequency=None):
+    """
+    Spread what is still owed on each active plan over a new schedule from
+    `start_date`. Paid installments are kept; a partly paid one is closed at
+    what was paid. Plans with nothing left are completed.
+    """
+    plans = [plan for plan in plans if plan.status == ACTIVE]
+    for start in range(0, len(plans), BATCH_SIZE):
+        _reschedule_batch(plans[start:start + BATCH_SIZE], start_date, installment_count, frequency)
+    return plans
+
+
+def _reschedule_batch(plans, start_date, installment_count, frequency):
+    plan_ids = [plan.pk for plan in plans]
+    now = timezone.now()
+    with sharding.atomic():
+        progress = {
+            row['plan_id']: row
+            for row in Installment.objects.filter(plan_id__in=plan_ids, paid_amount__gt=0)
+            .values('plan_id')
+            .annotate(paid=Sum('paid_amount'), last=Max('sequence'))
+        }
+        _close_open(plan_ids, now)
+
+        changes = {'start_date': start_date, 'updated_at': now}
+        if installment_count:
+            changes['installment_count'] = installment_count
+        if frequency:
+            changes['frequency'] = frequency
+        PaymentPlan.objects.filter(pk__in=plan_ids).update(**changes)
+
+        new_installments, finished = [], []
+        for plan in plans:
+            for field, value in changes.items():
+                setattr(plan, field, value)
+            done = progress.get(plan.pk, {'paid': Decimal(0), 'last': 0})
+            remaining = plan.total_amount - done['paid']
+            if remaining <= 0:
+                plan.status = COMPLETED
+                finished.append(plan.pk)
+                continue
+            new_installments += _installments(
+                plan, remaining, plan.installment_count, plan.frequency, start_date, done['last'] + 1,
+            )
+        PaymentPlan.objects.filter(pk__in=finished).update(status=COMPLETED)
+        Installment.objects.bulk_create(new_installments)
+
+
+def _close_open(plan_ids, now):
+    """Drop the unpaid installments of plans, closing partly paid ones at what was paid."""
+    Installment.objects.filter(plan_id__in=plan_ids, is_paid=False, paid_amount__gt=0).update(
+        amount=F('paid_amount'), is_paid=True, paid_at=now,
+    )
+    Installment.objects.filter(plan_id__in=plan_ids, is_paid=False).delete()
+
+
+def cancel(plan):
+    """Cancel a plan; what was paid stays on record, nothing more falls due."""
+    with sharding.atomic():
+        _close_open([plan.pk], timezone.now())
+        plan.status = CANCELLED
+        plan.save(update_fields=['status', 'updated_at'])
+
+
+def _allocate(installments, amount, paid_at):
+    """Pay `amount` into `installments` in order; returns the ones that changed."""
+    changed = []
+    for installment in installments:
+        if amount <= 0:
+            break
+        part = min(amount, installment.remaining)
+        if part <= 0:
+            continue
+        installment.paid_amount += part
+        amount -= part
+        if installment.remaining <= 0:
+            installment.is_paid = True
+            installment.paid_at = installment.paid_at or paid_at
+        changed.append(installment)
+    return changed
+
+
+def _complete_finished(plan_ids):
+    open_installments = Installment.objects.filter(plan=OuterRef('pk'), is_paid=False)
+    PaymentPlan.objects.filter(pk__in=plan_ids, status=ACTIVE).exclude(Exists(open_installments)).update(
+        status=COMPLETED, updated_at=timezone.now(),
+    )
+
+
+def apply_credit(tran):
+    """Match a new credit transaction to the debtor's open installments."""
+    if tran.credit_amount <= 0:
+        return
+    with sharding.atomic():
+        installments = (
+            Installment.objects.select_for_update()
+            .filter(debtor_id=tran.debtor_id, is_paid=False)
+            .order_by('due_date', 'plan_id', 'sequence')
+        )
+        changed = _allocate(installments, tran.credit_amount, tran.tran_date)
+        if changed:
+            Installment.objects.bulk_update(changed, ['paid_amount', 'is_paid', 'paid_at'])
+            _complete_finished({installment.plan_id for installment in changed})
+
+
+def rematch(debtor_id):
+    """Recompute what is paid on a debtor's plans after a credit was edited or deleted."""
+    with sharding.atomic():
+        plans = list(
+            PaymentPlan.objects.select_for_update().filter(debtor_id=debtor_id, status__in=[ACTIVE, COMPLETED])
+        )
+        if not plans:
+            return
+        since = min(plan.created_at for plan in plans)
+        paid = Transaction.objects.filter(
+            debtor_id=debtor_id, tran_date__gte=since, credit_amount__gt=0,
+        ).aggregate(total=Sum('credit_amount'))['total'] or Decimal(0)
+
+        installments = list(Installment.objects.filter(plan__in=plans).order_by('due_date', 'plan_id', 'sequence'))
+        for installment in installments:
+            installment.paid_amount, installment.is_paid = Decimal(0), False
+        _allocate(installments, paid, timezone.now())
+        for installment in installments:
+            if not installment.is_paid:
+                installment.paid_at = None
+        Installment.objects.bulk_update(installments, ['paid_amount', 'is_paid', 'paid_at'], batch_size=BATCH_SIZE)
+
+        PaymentPlan.objects.filter(pk__in=[plan.pk for plan in plans]).update(status=ACTIVE)
+        _complete_finished([plan.pk for plan in plans])
+
+
+def open_installments(creditor=None):
+    # Only active plans have unpaid installments (see reschedule and cancel),
+    # so this needs no join and can use the partial due-date indexes.
+    qs = Installment.objects.filter(is_paid=False)
+    if creditor is not None:
+        qs = qs.filter(creditor=creditor)
+    return qs
+
+
+def overdue(as_of=None, creditor=None):
+    """Open installments due before `as_of` (default today), oldest first."""
+    as_of = as_of or timezone.localdate()
+    return open_installments(creditor).filter(due_date__lt=as_of).order_by('due_date', 'id')
+
+
+def due_between(start, end, creditor=None):
+    """Open installments due from `start` to `end` inclusive."""
+    return open_installments(creditor).filter(due_date__gte=start, due_date__lte=end).order_by('due_date', 'id')
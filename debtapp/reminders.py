@@ -0,0 +1,159 @@
+"""
+Overdue installment reminders.
+
+`dispatch()` (run by `manage.py send_overdue_reminders`) emails each creditor
+the installments of their debtors that are overdue and were not reminded in
+the last `interval_days`:
+
+- the overdue installments are walked creditor by creditor, and within a
+  creditor in keyset pages by id, both served by the partial (creditor, id)
+  index of unpaid installments; only one page is in memory at a time
+- each page becomes one message to its creditor; the templates are loaded
+  once per batch of messages
+- a batch is sent over one mail connection, opened once for the run, at no
+  more than `rate` messages per second
+- each message's ReminderLog markers are inserted as soon as it is sent, so
+  a rerun on the same day sends nothing twice, and when sending fails midway
+  the next run sends only the messages that did not go out
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import Exists, OuterRef, Q
+from django.template.loader import get_template
+from django.utils import timezone
+
+from . import sharding
+from .models import CustomUser, Installment, ReminderLog
+
+TEMPLATES = {'html': 'emails/overdue_reminder.html', 'text': 'emails/overdue_reminder.txt'}
+SUBJECT = "{count} overdue installment(s) from your debtors"
+INTERVAL_DAYS = 7
+PAGE_SIZE = 200
+MESSAGES_PER_BATCH = 50
+
+
+def overdue_to_remind(as_of, interval_days=INTERVAL_DAYS):
+    """Unpaid installments due before `as_of` without a reminder in the last `interval_days`."""
+    recent = ReminderLog.objects.filter(
+        installment=OuterRef('pk'), sent_on__gt=as_of - timedelta(days=interval_days),
+    )
+    return Installment.objects.filter(
+        is_paid=False, due_date__lt=as_of, creditor__isnull=False,
+    ).exclude(Exists(recent))
+
+
+def pages(as_of, interval_days=INTERVAL_DAYS, page_size=PAGE_SIZE):
+    """
+    Yield (creditor_id, installments) pages of the overdue installments,
+    keyset-walked by (creditor_id, id); installments within a page are in due order.
+    """
+    due = overdue_to_remind(as_of, interval_days)
+    creditor_id = 0
+    while True:
+        creditor_id = (
+            due.filter(creditor_id__gt=creditor_id).order_by('creditor_id')
+            .values_list('creditor_id', flat=True).first()
+        )
+        if creditor_id is None:
+            return
+        after = 0
+        while True:
+            page = list(
+                due.filter(creditor_id=creditor_id, id__gt=after).select_related('debtor').order_by('id')[:page_size]
+            )
+            if page:
+                after = page[-1].pk
+                yield creditor_id, sorted(page, key=lambda installment: (installment.due_date, installment.pk))
+            if len(page) < page_size:
+                break
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart (no limit when rate is 0)."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = 0.0
+
+    def wait(self):
+        now = time.monotonic()
+        if now < self.next_at:
+            time.sleep(self.next_at - now)
+            now = self.next_at
+        self.next_at = now + self.interval
+
+
+def _message(templates, creditor, installments, as_of):
+    # Values are formatted here once instead of by the template filters per row.
+    context = {
+        'creditor': creditor,
+        'as_of': as_of.isoformat(),
+        'rows': [
+            {
+                'debtor': f"{installment.debtor.name} ({installment.debtor.debtor_id})",
+                'mobile': installment.debtor.mobile,
+                'sequence': f"#{installment.sequence}",
+                'due_date': installment.due_date.isoformat(),
+                'unpaid': f"{installment.remaining:.2f}",
+                'days_overdue': str((as_of - installment.due_date).days),
+            }
+            for installment in installments
+        ],
+    }
+    message = EmailMultiAlternatives(
+        subject=SUBJECT.format(count=len(installments)),
+        body=templates['text'].render(context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[creditor.email],
+    )
+    message.attach_alternative(templates['html'].render(context), "text/html")
+    return message
+
+
+def _send_batch(connection, limiter, batch, as_of):
+    """Render, send and mark one batch of (creditor_id, installments) pages."""
+    templates = {kind: get_template(name) for kind, name in TEMPLATES.items()}
+    creditors = CustomUser.objects.in_bulk({creditor_id for creditor_id, _ in batch})
+    sent = marked = 0
+    for creditor_id, installments in batch:
+        creditor = creditors.get(creditor_id)
+        if creditor is None or not creditor.email:
+            continue
+        message = _message(templates, creditor, installments, as_of)
+        limiter.wait()
+        if not connection.send_messages([message]):
+            continue  # not sent (a fail_silently backend): left for the next run
+        sent += 1
+        # Committed right away: an error on a later message must not unmark this one
+        with sharding.atomic():
+            ReminderLog.objects.bulk_create([
+                ReminderLog(installment_id=installment.pk, creditor_id=creditor_id, sent_on=as_of)
+                for installment in installments
+            ])
+        marked += len(installments)
+    return sent, marked
+
+
+def dispatch(as_of=None, interval_days=INTERVAL_DAYS, rate=0, page_size=PAGE_SIZE,
+             messages_per_batch=MESSAGES_PER_BATCH, backend=None):
+    """
+    Send the reminders for `as_of` (default today). Returns (messages sent,
+    installments reminded).
+    """
+    as_of = as_of or timezone.localdate()
+    limiter = RateLimiter(rate)
+    messages_sent = reminded = 0
+    with get_connection(backend=backend) as connection:
+        batch = []
+        for page in pages(as_of, interval_days, page_size):
+            batch.append(page)
+            if len(batch) == messages_per_batch:
+                sent, marked = _send_batch(connection, limiter, batch, as_of)
+                messages_sent, reminded, batch = messages_sent + sent, reminded + marked, []
+        if batch:
+            sent, marked = _send_batch(connection, limiter, batch, as_of)
+            messages_sent, reminded = messages_sent + sent, reminded + marked
+    return messages_sent, reminded
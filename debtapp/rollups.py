@@ -0,0 +1,203 @@
+"""
+Monthly rollups per creditor.
+
+MonthlyRollup keeps one row per creditor and month with the debits, credits,
+new debtors and recoveries (credits that bring a debtor's balance to zero)
+of that month, so trend views read a few dozen rows instead of aggregating
+the ledger.
+
+New debtors and transactions are added to their month's row as they are
+saved. The first event of a month, and any edit or delete, recomputes that
+one month from the raw rows. `manage.py rebuild_rollups` recomputes all of
+them, e.g. after a bulk import. Ledgers moved to the archive (see
+debtapp.archive) are counted from the archive's monthly sums.
+"""
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from django.db import IntegrityError
+from django.db.models import Count, DateField, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from . import ledger, sharding
+from .models import Debtor, MonthlyRollup, Transaction, TransactionArchive
+
+ZERO = Value(0, output_field=DecimalField(max_digits=14, decimal_places=2))
+SERIES_MONTHS = 12
+SERIES_MAX_MONTHS = 120
+RECOVERY = Q(credit_amount__gt=0, current_debt__lte=0)
+
+
+def month_of(value):
+    """First day of the local month of a date or datetime."""
+    if isinstance(value, datetime):
+        value = timezone.localdate(value)
+    return value.replace(day=1)
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _month_range(month):
+    start = timezone.make_aware(datetime.combine(month, time.min))
+    end = timezone.make_aware(datetime.combine(_add_months(month, 1), time.min))
+    return start, end
+
+
+def compute_month(creditor_id, month):
+    """The rollup values of one creditor and month, from the raw rows."""
+    start, end = _month_range(month)
+    totals = Transaction.objects.filter(
+        debtor__created_by_id=creditor_id, tran_date__gte=start, tran_date__lt=end,
+    ).aggregate(
+        total_debit=Coalesce(Sum('debit_amount'), ZERO),
+        total_credit=Coalesce(Sum('credit_amount'), ZERO),
+        recoveries=Count('id', filter=RECOVERY),
+    )
+    totals['new_debtors'] = Debtor.objects.filter(
+        created_by_id=creditor_id, created_at__gte=start, created_at__lt=end,
+    ).count()
+    for months in TransactionArchive.objects.filter(
+        debtor__created_by_id=creditor_id, first_date__lt=end, last_date__gte=start,
+    ).values_list('months', flat=True):
+        _add_archived(totals, months.get(month.isoformat()))
+    return totals
+
+
+def _add_archived(totals, sums):
+    if sums:
+        debit, credit, recoveries = sums
+        totals['total_debit'] += Decimal(debit)
+        totals['total_credit'] += Decimal(credit)
+        totals['recoveries'] += recoveries
+
+
+def _add(creditor_id, month, **increments):
+    updates = {field: F(field) + value for field, value in increments.items() if value}
+    if not updates:
+        return MonthlyRollup.objects.filter(creditor_id=creditor_id, month=month).exists()
+    return MonthlyRollup.objects.filter(creditor_id=creditor_id, month=month).update(**updates)
+
+
+def _record(creditor_id, month, **increments):
+    if creditor_id is None or _add(creditor_id, month, **increments):
+        return
+    # First event of the month: start the row from the raw data (which
+    # already includes this event).
+    values = compute_month(creditor_id, month)
+    try:
+        with sharding.atomic():
+            MonthlyRollup.objects.create(creditor_id=creditor_id, month=month, **values)
+    except IntegrityError:
+        # Created concurrently without this uncommitted event; add it on top.
+        _add(creditor_id, month, **increments)
+
+
+def record_transaction(tran):
+    """Add a newly saved transaction to its month."""
+    _record(
+        ledger.creditor_id_for(tran),
+        month_of(tran.tran_date),
+        total_debit=tran.debit_amount,
+        total_credit=tran.credit_amount,
+        recoveries=1 if tran.credit_amount > 0 and tran.current_debt <= 0 else 0,
+    )
+
+
+def record_debtor(debtor):
+    """Count a newly created debtor in its month."""
+    _record(debtor.created_by_id, month_of(debtor.created_at), new_debtors=1)
+
+
+def add_bulk(creditor_id, month, **increments):
+    """Add rows inserted in bulk, which skip the signals, e.g. add_bulk(1, month, total_debit=...)."""
+    _record(creditor_id, month, **increments)
+
+
+def refresh_month(creditor_id, month):
+    """Recompute one month after an edit or delete."""
+    if creditor_id is None:
+        return
+    MonthlyRollup.objects.update_or_create(
+        creditor_id=creditor_id, month=month, defaults=compute_month(creditor_id, month),
+    )
+
+
+def rebuild(creditor=None):
+    """Recompute every rollup row (of one creditor) from the raw rows."""
+    transactions = Transaction.objects.filter(debtor__created_by__isnull=False)
+    archives = TransactionArchive.objects.filter(debtor__created_by__isnull=False)
+    debtors = Debtor.objects.filter(created_by__isnull=False)
+    rollups = MonthlyRollup.objects.all()
+    if creditor is not None:
+        transactions = transactions.filter(debtor__created_by=creditor)
+        archives = archives.filter(debtor__created_by=creditor)
+        debtors = debtors.filter(created_by=creditor)
+        rollups = rollups.filter(creditor=creditor)
+
+    rows = {}
+
+    def row(creditor_id, month):
+        key = (creditor_id, month)
+        if key not in rows:
+            rows[key] = MonthlyRollup(creditor_id=creditor_id, month=month)
+        return rows[key]
+
+    for item in (
+        transactions.annotate(month=TruncMonth('tran_date', output_field=DateField()))
+        .values('month', creditor_id=F('debtor__created_by_id'))
+        .annotate(
+            debit=Sum('debit_amount'), credit=Sum('credit_amount'), recovered=Count('id', filter=RECOVERY),
+        )
+    ):
+        rollup = row(item['creditor_id'], item['month'])
+        rollup.total_debit = item['debit']
+        rollup.total_credit = item['credit']
+        rollup.recoveries = item['recovered']
+
+    for creditor_id, months in archives.values_list('debtor__created_by_id', 'months').iterator(chunk_size=1000):
+        for month, (debit, credit, recoveries) in months.items():
+            rollup = row(creditor_id, date.fromisoformat(month))
+            rollup.total_debit += Decimal(debit)
+            rollup.total_credit += Decimal(credit)
+            rollup.recoveries += recoveries
+
+    for item in (
+        debtors.annotate(month=TruncMonth('created_at', output_field=DateField()))
+        .values('month', creditor_id=F('created_by_id'))
+        .annotate(created=Count('id'))
+    ):
+        row(item['creditor_id'], item['month']).new_debtors = item['created']
+
+    with sharding.atomic():
+        rollups.delete()
+        MonthlyRollup.objects.bulk_create(rows.values(), batch_size=1000)
+    return len(rows)
+
+
+async def series(creditor, months=SERIES_MONTHS, until=None):
+    """
+    The last `months` months up to `until` (default: this month) as parallel
+    lists, oldest first; months without activity are zero.
+    """
+    last = month_of(until or timezone.localdate())
+    first = _add_months(last, 1 - months)
+    stored = {
+        rollup.month: rollup
+        async for rollup in MonthlyRollup.objects.filter(creditor=creditor, month__gte=first, month__lte=last)
+    }
+
+    data = {'months': [], 'debits': [], 'credits': [], 'net': [], 'new_debtors': [], 'recoveries': []}
+    for offset in range(months):
+        month = _add_months(first, offset)
+        rollup = stored.get(month) or MonthlyRollup(total_debit=Decimal('0.00'), total_credit=Decimal('0.00'))
+        data['months'].append(f"{month:%Y-%m}")
+        data['debits'].append(rollup.total_debit)
+        data['credits'].append(rollup.total_credit)
+        data['net'].append(rollup.total_debit - rollup.total_credit)
+        data['new_debtors'].append(rollup.new_debtors)
+        data['recoveries'].append(rollup.recoveries)
+    return data
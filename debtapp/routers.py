@@ -0,0 +1,148 @@
+"""
+Database routing.
+
+Reads go to the read replica only inside views wrapped with ``@use_replica``
+(reports and exports); every other query and every write goes to the primary.
+A user who just wrote something is pinned to the primary for a few seconds so
+they always see their own changes.
+
+With SHARD_DATABASES configured, creditor data (every debtapp model but the
+user) goes to the active shard instead, see debtapp.sharding. The 'default'
+shard is routed as without sharding, replica included.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+_read_from_replica = ContextVar('read_from_replica', default=False)
+_active_shard = ContextVar('active_shard', default=None)
+
+PIN_SESSION_KEY = '_db_primary_until'
+
+
+def replica_alias():
+    """Alias of the configured replica, or None when only the primary exists."""
+    alias = getattr(settings, 'REPLICA_DATABASE', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+
+def pin_to_primary(request):
+    """Keep this session's reads on the primary for REPLICA_PIN_SECONDS."""
+    request.session[PIN_SESSION_KEY] = time.time() + getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+async def apin_to_primary(request):
+    await request.session.aset(PIN_SESSION_KEY, time.time() + getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+
+
+def is_pinned(request):
+    session = getattr(request, 'session', None)
+    return session is not None and session.get(PIN_SESSION_KEY, 0) > time.time()
+
+
+async def ais_pinned(request):
+    session = getattr(request, 'session', None)
+    return session is not None and await session.aget(PIN_SESSION_KEY, 0) > time.time()
+
+
+def use_replica(view_func):
+    """Run a read-only view against the replica unless the user wrote recently."""
+    if iscoroutinefunction(view_func):
+        async def _view_wrapper(request, *args, **kwargs):
+            if replica_alias() is None or await ais_pinned(request):
+                return await view_func(request, *args, **kwargs)
+            token = _read_from_replica.set(True)
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                _read_from_replica.reset(token)
+    else:
+        def _view_wrapper(request, *args, **kwargs):
+            if replica_alias() is None or is_pinned(request):
+                return view_func(request, *args, **kwargs)
+            token = _read_from_replica.set(True)
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                _read_from_replica.reset(token)
+    return wraps(view_func)(_view_wrapper)
+
+
+def routing():
+    """The routing in effect here (@use_replica, active shard), to apply_routing() in another process."""
+    return _read_from_replica.get(), _active_shard.get()
+
+
+def apply_routing(state):
+    read_from_replica, shard = state
+    _read_from_replica.set(read_from_replica)
+    _active_shard.set(shard)
+
+
+def shard_aliases():
+    """Databases the creditors are spread over; just 'default' unless SHARD_DATABASES lists more."""
+    return list(getattr(settings, 'SHARD_DATABASES', None) or [DEFAULT_DB_ALIAS])
+
+
+def active_shard():
+    return _active_shard.get() or DEFAULT_DB_ALIAS
+
+
+def activate_shard(alias):
+    """Route creditor data to `alias` (None: 'default') from here on; returns the token to reset."""
+    return _active_shard.set(alias)
+
+
+@contextmanager
+def using_shard(alias):
+    token = _active_shard.set(alias)
+    try:
+        yield
+    finally:
+        _active_shard.reset(token)
+
+
+def is_sharded(model):
+    """Whether rows of `model` (a model or an instance) live on the shards: all of debtapp but the user."""
+    return model._meta.app_label == 'debtapp' and model._meta.label != settings.AUTH_USER_MODEL
+
+
+class ShardRouter:
+    """Creditor data to the shard its instance came from, else to the active one; 'default' is left to ReplicaRouter."""
+
+    def _shard(self, model, hints):
+        if not is_sharded(model):
+            return None
+        instance = hints.get('instance')
+        if instance is not None and is_sharded(instance) and instance._state.db in shard_aliases():
+            alias = instance._state.db
+        else:
+            alias = _active_shard.get()
+        return alias if alias and alias != DEFAULT_DB_ALIAS else None
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, hints)
+
+
+class ReplicaRouter:
+    """Primary for writes and normal reads; replica for reads inside @use_replica."""
+
+    def db_for_read(self, model, **hints):
+        if _read_from_replica.get():
+            return replica_alias() or 'default'
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primary and replica hold the same data.
+        return True
@@ -0,0 +1,150 @@
+"""
+Debtor and transaction search.
+
+On PostgreSQL the lookups are backed by pg_trgm GIN and pattern-ops indexes
+(see migration 0014) and transaction text search by a trigger-maintained
+tsvector column with a GIN index (migration 0015); other backends fall back
+to indexed prefix matching and substring search.
+"""
+import re
+
+from django.db import connections, router
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Debtor, Transaction
+
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 25
+
+# Must match the configuration used by the trigger in migration 0015.
+SEARCH_CONFIG = 'english'
+SEARCH_PAGE_SIZE = 25
+# ts_headline markers: the headline is HTML-escaped first and the markers are
+# swapped for <mark> afterwards, so stored text can never inject markup.
+_HIGHLIGHT_START, _HIGHLIGHT_STOP = '\x02', '\x03'
+
+
+def vendor_for(model):
+    return connections[router.db_for_read(model)].vendor
+
+
+def debtor_autocomplete(creditor, term, limit=AUTOCOMPLETE_LIMIT, include_deleted=False):
+    """
+    Best matching debtors of `creditor` for `term` as a values() queryset.
+
+    Matches debtor_id and mobile prefixes and name prefixes everywhere, plus
+    name substrings on PostgreSQL, ranked exact id > id/mobile prefix > name
+    prefix > name similarity.
+    """
+    term = term.strip()
+    upper = term.upper()
+    qs = Debtor.objects.filter(created_by=creditor)
+    if not include_deleted:
+        qs = qs.filter(is_delete=False)
+
+    prefix_match = Q(debtor_id__startswith=upper) | Q(mobile__startswith=term) | Q(name__istartswith=term)
+    rank = Case(
+        When(debtor_id=upper, then=Value(3.0)),
+        When(Q(debtor_id__startswith=upper) | Q(mobile__startswith=term), then=Value(2.0)),
+        When(name__istartswith=term, then=Value(1.5)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+    if vendor_for(Debtor) == 'postgresql':
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        # UPPER(name) LIKE '%TERM%' is served by the gin_trgm_ops index
+        qs = qs.filter(prefix_match | Q(name__icontains=term))
+        rank = Greatest(rank, TrigramSimilarity('name', term))
+    else:
+        qs = qs.filter(prefix_match)
+
+    return (
+        qs.annotate(rank=rank)
+        .order_by('-rank', 'name', 'id')
+        .values('id', 'debtor_id', 'name', 'mobile', 'debtor_status', 'is_delete')[:limit]
+    )
+
+
+def transaction_search(creditor, query):
+    """
+    Transactions of `creditor` whose description, debt purpose or voucher/cheque
+    number match `query`, best match first.
+
+    On PostgreSQL `query` uses web search syntax ("quoted phrases", -excluded,
+    or); elsewhere every word has to appear somewhere in the three fields.
+    """
+    qs = Transaction.objects.filter(debtor__created_by=creditor).select_related('debtor')
+
+    if vendor_for(Transaction) == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        return (
+            qs.filter(search_vector=search_query)
+            .annotate(rank=SearchRank(F('search_vector'), search_query))
+            .order_by('-rank', '-id')
+        )
+
+    for word in query.split():
+        qs = qs.filter(
+            Q(tran_desc__icontains=word)
+            | Q(debtor__debt_purpose__icontains=word)
+            | Q(debtor__voucher_cheque_no__icontains=word)
+        )
+    return qs.annotate(rank=Value(0.0, output_field=FloatField())).order_by('-id')
+
+
+def highlight_transactions(transactions, query):
+    """
+    Set `desc_html` and `purpose_html` on each transaction of a result page:
+    the escaped text with the matched words wrapped in <mark>.
+
+    Only the page is highlighted; ts_headline re-parses the text and is too
+    slow to run over every match.
+    """
+    if not transactions:
+        return transactions
+
+    if vendor_for(Transaction) == 'postgresql':
+        from django.contrib.postgres.search import SearchHeadline, SearchQuery
+
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        options = dict(
+            config=SEARCH_CONFIG, start_sel=_HIGHLIGHT_START, stop_sel=_HIGHLIGHT_STOP, highlight_all=True,
+        )
+        headlines = {
+            row['id']: row
+            for row in Transaction.objects.filter(id__in=[t.id for t in transactions]).annotate(
+                desc_headline=SearchHeadline('tran_desc', search_query, **options),
+                purpose_headline=SearchHeadline('debtor__debt_purpose', search_query, **options),
+            ).values('id', 'desc_headline', 'purpose_headline')
+        }
+        for tran in transactions:
+            row = headlines.get(tran.id, {})
+            tran.desc_html = _markers_to_html(row.get('desc_headline') or tran.tran_desc)
+            tran.purpose_html = _markers_to_html(row.get('purpose_headline') or tran.debtor.debt_purpose)
+        return transactions
+
+    words = [re.escape(escape(word)) for word in query.split()]
+    pattern = re.compile('|'.join(words), re.IGNORECASE) if words else None
+    for tran in transactions:
+        tran.desc_html = _mark_words(tran.tran_desc, pattern)
+        tran.purpose_html = _mark_words(tran.debtor.debt_purpose, pattern)
+    return transactions
+
+
+def _markers_to_html(text):
+    html = escape(text).replace(_HIGHLIGHT_START, '<mark>').replace(_HIGHLIGHT_STOP, '</mark>')
+    return mark_safe(html)
+
+
+def _mark_words(text, pattern):
+    html = escape(text)
+    if pattern is not None:
+        html = pattern.sub(lambda m: f'<mark>{m.group(0)}</mark>', html)
+    return mark_safe(html)
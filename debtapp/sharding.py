@@ -0,0 +1,229 @@
+"""
+Creditor-based sharding.
+
+With more than one database in SHARD_DATABASES, every creditor is placed on
+one of them, and their debtors, transactions and everything derived from
+them (snapshots, rollups, plans, archives, audit events, idempotency keys)
+live on that database only. The user table stays on 'default', which serves
+as the directory: CustomUser.shard records the creditor's database. It is
+picked by a stable hash of the pk when the user is created and never
+recomputed, so adding a shard later only affects new creditors. Users from
+before sharding have no shard recorded and stay on 'default'. Each user row
+is copied to its shard (staff rows to every shard) so that foreign keys and
+joins to the user table work there.
+
+Routing (debtapp.routers.ShardRouter): ShardMiddleware activates the
+signed-in user's shard for the request, and queries on creditor data go to
+the active shard or to the shard their instance was loaded from. Code that
+reads across creditors activates shards itself: using_shard() for one,
+fan_out() to run a function on every shard in parallel threads, merged() to
+stream rows from every shard in parallel. `manage.py on_shards <command>`
+runs a management command once per shard.
+
+transaction.atomic() opens its transaction on 'default'; code that writes
+creditor data uses atomic() from here, which opens it on the active shard.
+
+Each shard numbers its own rows, so ids, debtor_ids and tran_ids are unique
+per shard only; admin links carry ?shard= to say which one is meant.
+
+With only 'default' configured all of this does nothing.
+"""
+import hashlib
+import heapq
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .routers import active_shard, shard_aliases, using_shard
+
+DIRECTORY = DEFAULT_DB_ALIAS
+MERGE_CHUNK = 500
+MERGE_CHUNKS_AHEAD = 4
+
+_DONE = object()
+
+
+def enabled():
+    return len(shard_aliases()) > 1
+
+
+def place(pk):
+    """Shard for a new creditor: a stable hash of the pk over the configured shards."""
+    aliases = shard_aliases()
+    digest = hashlib.md5(str(pk).encode(), usedforsecurity=False).digest()
+    return aliases[int.from_bytes(digest[:8], 'big') % len(aliases)]
+
+
+def shard_for(user):
+    """Database holding `user`'s creditor data; None for anonymous users."""
+    if user is None or not user.is_authenticated:
+        return None
+    if not user.shard:
+        return DIRECTORY
+    if user.shard not in shard_aliases():
+        raise ImproperlyConfigured(f"User {user.pk} is placed on '{user.shard}', which is not in SHARD_DATABASES.")
+    return user.shard
+
+
+def requested(request):
+    """The shard named by the request's ?shard= parameter, None if absent or unknown."""
+    alias = request.GET.get('shard')
+    return alias if alias in shard_aliases() else None
+
+
+def atomic(func=None):
+    """transaction.atomic() on the active shard; as a decorator the shard is looked up on each call."""
+    if func is None:
+        return transaction.atomic(using=active_shard())
+
+    @wraps(func)
+    def _wrapper(*args, **kwargs):
+        with transaction.atomic(using=active_shard()):
+            return func(*args, **kwargs)
+    return _wrapper
+
+
+def mirror(user):
+    """Copy `user`'s row from the directory to its shard, or to every shard for staff."""
+    User = type(user)
+    values = {field.attname: getattr(user, field.attname) for field in User._meta.concrete_fields}
+    values.pop(User._meta.pk.attname)
+    targets = shard_aliases() if user.is_staff or user.is_superuser else [shard_for(user)]
+    for alias in targets:
+        if alias == DIRECTORY:
+            continue
+        # Queryset writes: the copies must not fire the user signals again
+        copies = User._base_manager.using(alias)
+        if not copies.filter(pk=user.pk).update(**values):
+            copies.bulk_create([User(pk=user.pk, **values)])
+
+
+def unmirror(user):
+    """Delete the copies of a user deleted from the directory, applying on_delete to their data on the shards."""
+    for alias in shard_aliases():
+        if alias == DIRECTORY:
+            continue
+        with using_shard(alias):
+            type(user)._base_manager.using(alias).filter(pk=user.pk).delete()
+
+
+def _run(alias, func, args):
+    try:
+        with using_shard(alias):
+            return func(*args)
+    finally:
+        # Connections are per thread, and this thread is about to go
+        connections.close_all()
+
+
+def fan_out(func, *args, aliases=None):
+    """
+    Run func(*args) with each shard active, in parallel threads, and return
+    [(alias, result)] in shard order. With a single shard it runs here.
+    """
+    aliases = aliases or shard_aliases()
+    if len(aliases) == 1:
+        with using_shard(aliases[0]):
+            return [(aliases[0], func(*args))]
+    with ThreadPoolExecutor(len(aliases)) as pool:
+        # copy_context() carries e.g. the @use_replica flag into the threads
+        futures = [pool.submit(copy_context().run, _run, alias, func, args) for alias in aliases]
+        return [(alias, future.result()) for alias, future in zip(aliases, futures)]
+
+
+async def afan_out(func, *args, aliases=None):
+    """fan_out() for async views."""
+    return await sync_to_async(fan_out)(func, *args, aliases=aliases)
+
+
+def find(queryset_factory, aliases=None):
+    """
+    The first shard, in shard order, on which queryset_factory() has a row,
+    None if none has. With a single shard that one, without querying.
+    """
+    aliases = aliases or shard_aliases()
+    if len(aliases) == 1:
+        return aliases[0]
+    for alias, found in fan_out(lambda: queryset_factory().exists(), aliases=aliases):
+        if found:
+            return alias
+    return None
+
+
+def _produce(alias, rows, chunk_size, out, stop):
+    def put(item):
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        with using_shard(alias):
+            chunk = []
+            for row in rows():
+                chunk.append(row)
+                if len(chunk) == chunk_size:
+                    if not put(chunk):
+                        return
+                    chunk = []
+            if chunk and not put(chunk):
+                return
+        put(_DONE)
+    except BaseException as exc:
+        put(exc)
+    finally:
+        connections.close_all()
+
+
+def _drain(out):
+    while True:
+        item = out.get()
+        if item is _DONE:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield from item
+
+
+def merged(rows, key=None, reverse=False, aliases=None, chunk_size=MERGE_CHUNK):
+    """
+    Iterate rows() on every shard and yield what they produce: merged by
+    `key` when given (each shard's rows must be sorted by it, see
+    heapq.merge), else one shard after the other. The shards are read in
+    parallel threads, each at most a few chunks of `chunk_size` rows ahead
+    of the consumer.
+    """
+    aliases = aliases or shard_aliases()
+    if aliases == [DIRECTORY]:
+        yield from rows()
+        return
+
+    stop = threading.Event()
+    outs = [queue.Queue(MERGE_CHUNKS_AHEAD) for _ in aliases]
+    threads = [
+        threading.Thread(target=copy_context().run, args=(_produce, alias, rows, chunk_size, out, stop), daemon=True)
+        for alias, out in zip(aliases, outs)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        streams = [_drain(out) for out in outs]
+        if key is None:
+            for stream in streams:
+                yield from stream
+        else:
+            yield from heapq.merge(*streams, key=key, reverse=reverse)
+    finally:
+        # Also when the consumer stops early, e.g. a download is cancelled
+        stop.set()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,94 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import balances, ledger, plans, rollups, sharding
+from .models import CustomUser, Debtor, Transaction
+from .routers import using_shard
+
+_suspended = ContextVar('transaction_signals_suspended', default=False)
+
+
+@contextmanager
+def suspended():
+    """Skip the transaction bookkeeping below, for code that moves rows and does its own (see debtapp.archive)."""
+    token = _suspended.set(True)
+    try:
+        yield
+    finally:
+        _suspended.reset(token)
+
+
+@receiver(post_save, sender=CustomUser)
+def user_saved(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw or using != sharding.DIRECTORY or not sharding.enabled():
+        return
+    if created and not instance.shard:
+        instance.shard = sharding.place(instance.pk)
+        sender._base_manager.filter(pk=instance.pk).update(shard=instance.shard)
+    sharding.mirror(instance)
+
+
+@receiver(post_save, sender=CustomUser)
+def user_changed(sender, instance, raw=False, using=None, **kwargs):
+    # The admin exports list the users, so their cached copies must go stale too
+    if raw or using != sharding.DIRECTORY:
+        return
+    with using_shard(sharding.shard_for(instance)):
+        ledger.bump_version(instance.pk)
+
+
+@receiver(post_delete, sender=CustomUser)
+def user_deleted(sender, instance, using=None, **kwargs):
+    if using == sharding.DIRECTORY and sharding.enabled():
+        sharding.unmirror(instance)
+
+
+@receiver(post_save, sender=Debtor)
+@receiver(post_delete, sender=Debtor)
+def debtor_changed(sender, instance, **kwargs):
+    ledger.bump_version(instance.created_by_id)
+
+
+@receiver(post_save, sender=Debtor)
+def debtor_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        rollups.record_debtor(instance)
+
+
+@receiver(post_delete, sender=Debtor)
+def debtor_deleted(sender, instance, **kwargs):
+    rollups.refresh_month(instance.created_by_id, rollups.month_of(instance.created_at))
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+def transaction_changed(sender, instance, **kwargs):
+    if _suspended.get():
+        return
+    ledger.bump_version(ledger.creditor_id_for(instance))
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or _suspended.get():
+        return
+    if created:
+        balances.record_transaction(instance)
+        rollups.record_transaction(instance)
+        plans.apply_credit(instance)
+    else:
+        balances.invalidate_from(instance)
+        rollups.refresh_month(ledger.creditor_id_for(instance), rollups.month_of(instance.tran_date))
+        plans.rematch(instance.debtor_id)
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_deleted(sender, instance, **kwargs):
+    if _suspended.get():
+        return
+    balances.invalidate_from(instance)
+    rollups.refresh_month(ledger.creditor_id_for(instance), rollups.month_of(instance.tran_date))
+    plans.rematch(instance.debtor_id)
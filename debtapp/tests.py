@@ -1,3 +1,1298 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import re
+import tempfile
+import zipfile
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db.models import Sum
+from django.db import IntegrityError, connection, router, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from . import (
+    aging, archive, audit, backup, balances, digest, dumps, export_cache, forecast, idempotency, integrity, interest,
+    live, partitions, plans, reminders, rollups, search, sharding,
+)
+from .models import (
+    AuditEvent, CreditorDailyBalance, Debtor, IdempotencyKey, InterestTerms, MonthlyRollup, ReminderLog, Transaction,
+    TransactionArchive,
+)
+from .routers import pin_to_primary, use_replica, using_shard
+
+TWO_SQLITE_DATABASES = {
+    'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'},
+    'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'},
+}
+
+
+@override_settings(DATABASES=TWO_SQLITE_DATABASES, REPLICA_DATABASE='replica')
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+        self.request.session = {}
+
+    def route(self, request):
+        return router.db_for_read(Debtor), router.db_for_write(Debtor), router.db_for_read(get_user_model())
+
+    def test_reads_go_to_the_replica_inside_use_replica_only(self):
+        self.assertEqual(self.route(self.request), ('default', 'default', 'default'))
+        self.assertEqual(use_replica(self.route)(self.request), ('replica', 'default', 'replica'))
+
+    def test_recent_writers_read_from_the_primary(self):
+        pin_to_primary(self.request)
+        self.assertEqual(use_replica(self.route)(self.request), ('default', 'default', 'default'))
+
+    @override_settings(DATABASES={'default': TWO_SQLITE_DATABASES['default']})
+    def test_without_a_replica_everything_uses_the_primary(self):
+        self.assertEqual(use_replica(self.route)(self.request), ('default', 'default', 'default'))
+
+
+@override_settings(
+    DATABASES={**TWO_SQLITE_DATABASES, 'shard1': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+    REPLICA_DATABASE='replica', SHARD_DATABASES=['default', 'shard1'],
+)
+class ShardRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+        self.request.session = {}
+
+    def route(self, request=None):
+        return router.db_for_read(Debtor), router.db_for_write(Debtor), router.db_for_read(get_user_model())
+
+    def test_creditor_data_goes_to_the_active_shard(self):
+        with using_shard('shard1'):
+            # Users stay in the directory on 'default'
+            self.assertEqual(self.route(), ('shard1', 'shard1', 'default'))
+            self.assertEqual(use_replica(self.route)(self.request), ('shard1', 'shard1', 'replica'))
+        self.assertEqual(self.route(), ('default', 'default', 'default'))
+
+    def test_instances_go_back_to_their_shard(self):
+        debtor = Debtor()
+        debtor._state.db = 'shard1'
+        self.assertEqual(router.db_for_write(Debtor, instance=debtor), 'shard1')
+        self.assertEqual(router.db_for_write(Transaction, instance=debtor), 'shard1')
+        with using_shard('default'):
+            self.assertEqual(router.db_for_read(Transaction, instance=debtor), 'shard1')
+
+    def test_creditors_are_placed_on_the_configured_shards(self):
+        User = get_user_model()
+        self.assertEqual(sharding.shard_for(User(pk=1, shard='shard1')), 'shard1')
+        self.assertEqual(sharding.shard_for(User(pk=2, shard='')), sharding.DIRECTORY)
+        with self.assertRaises(ImproperlyConfigured):
+            sharding.shard_for(User(pk=3, shard='shard9'))
+        placed = [sharding.place(pk) for pk in range(1, 41)]
+        self.assertEqual(set(placed), {'default', 'shard1'})
+        self.assertEqual(placed, [sharding.place(pk) for pk in range(1, 41)])
+
+
+class LiveUpdateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.creditor = get_user_model().objects.create_user('creditor', password='secret', address='Kathmandu')
+        cls.paid = Debtor.objects.create(
+            created_by=cls.creditor, name='Sita', address='Pokhara', mobile='9800000001',
+            initial_debt=300, debt_date=date(2025, 1, 1), debt_purpose='shop',
+        )
+        Transaction.objects.create(debtor=cls.paid, tran_type='debit', tran_amount=300, debit_amount=300, current_debt=300)
+        Transaction.objects.create(debtor=cls.paid, tran_type='credit', tran_amount=300, credit_amount=300, current_debt=0)
+        cls.start = Transaction.objects.latest('id').pk
+
+    def delta_since(self, after_id):
+        delta = live.empty_delta()
+        seen = async_to_sync(live.seen_ids)(self.creditor.pk, after_id)
+        for row in async_to_sync(live.new_transactions)(self.creditor.pk, after_id, seen):
+            live.apply_transaction(delta, row)
+        return {key: value for key, value in delta.items() if value}
+
+    def test_deltas_follow_the_posted_transactions(self):
+        debtor = Debtor.objects.create(
+            created_by=self.creditor, name='Ram', address='Kathmandu', mobile='9800000002',
+            initial_debt=500, debt_date=date(2025, 2, 1), debt_purpose='loan',
+        )
+        opening = Transaction.objects.create(debtor=debtor, tran_type='debit', tran_amount=500, debit_amount=500, current_debt=500)
+        self.assertEqual(self.delta_since(self.start), {
+            'total_debtors_no': 1, 'active_debtors_no': 1,
+            'total_debt_amount': Decimal(500), 'total_current_debt': Decimal(500),
+        })
+
+        payment = Transaction.objects.create(debtor=debtor, tran_type='credit', tran_amount=500, credit_amount=500, current_debt=0)
+        self.assertEqual(self.delta_since(opening.pk), {
+            'active_debtors_no': -1, 'recovered_debtors_no': 1,
+            'total_recovered_debt': Decimal(500), 'total_current_debt': Decimal(-500),
+        })
+
+        Transaction.objects.create(debtor=debtor, tran_type='debit', tran_amount=200, debit_amount=200, current_debt=200)
+        self.assertEqual(self.delta_since(payment.pk), {
+            'active_debtors_no': 1, 'recovered_debtors_no': -1,
+            'total_debt_amount': Decimal(200), 'total_current_debt': Decimal(200),
+        })
+
+
+@override_settings(DASHBOARD_EVENTS_POLL_SECONDS=0, DASHBOARD_EVENTS_STREAM_SECONDS=5)
+class LiveStreamTests(TransactionTestCase):
+    # Audit events go out when the view's transaction commits, so no TestCase
+    def setUp(self):
+        self.creditor = get_user_model().objects.create_user('creditor', password='secret', address='Kathmandu')
+        self.debtor = Debtor.objects.create(
+            created_by=self.creditor, name='Sita', address='Pokhara', mobile='9800000001',
+            initial_debt=300, debt_date=date(2025, 1, 1), debt_purpose='shop',
+        )
+        Transaction.objects.create(debtor=self.debtor, tran_type='debit', tran_amount=300, debit_amount=300, current_debt=300)
+        Transaction.objects.create(debtor=self.debtor, tran_type='credit', tran_amount=300, credit_amount=300, current_debt=0)
+        self.after = f"{Transaction.objects.latest('id').pk}-0"
+        self.client.force_login(self.creditor)
+
+    def read_events(self, count):
+        async def read():
+            await self.async_client.aforce_login(self.creditor)
+            response = await self.async_client.get(reverse('dashboard_events'), {'after': self.after})
+            events = []
+            async for chunk in response.streaming_content:
+                match = re.match(r'id: \S+\nevent: (\w+)\ndata: (.*)\n', chunk.decode())
+                if match:
+                    # amounts arrive as strings, with the backend's number of decimals
+                    events.append((match[1], json.loads(match[2], object_hook=lambda data: {
+                        key: Decimal(value) if isinstance(value, str) else value for key, value in data.items()
+                    })))
+                if len(events) == count:
+                    break
+            return events
+        return async_to_sync(read)()
+
+    def test_debtor_changes_send_the_recomputed_figures(self):
+        self.client.get(reverse('delete_debtor', args=[self.debtor.pk]))
+        self.assertEqual(self.read_events(1), [('totals', {
+            'total_debtors_no': 1, 'active_debtors_no': 0, 'recovered_debtors_no': 0, 'deleted_debtors_no': 1,
+            'total_debt_amount': Decimal(300), 'total_current_debt': Decimal(0), 'total_recovered_debt': Decimal(300),
+        })])
+
+    def test_recount_includes_the_transactions_already_sent(self):
+        self.client.get(reverse('delete_debtor', args=[self.debtor.pk]))
+        self.client.get(reverse('restore_debtor', args=[self.debtor.pk]))
+        Transaction.objects.create(debtor=self.debtor, tran_type='debit', tran_amount=50, debit_amount=50, current_debt=50)
+        (_, delta), (_, totals) = self.read_events(2)
+        self.assertEqual(delta['total_debt_amount'], Decimal(50))
+        self.assertEqual((totals['deleted_debtors_no'], totals['total_debt_amount']), (0, Decimal(350)))
+
+
+class DashboardFragmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.creditor = get_user_model().objects.create_user('creditor', password='secret', address='Kathmandu')
+        for mobile, debit, credit, deleted in [
+            ('9800000001', 1000, 400, False),
+            ('9800000002', 700, 0, False),
+            ('9800000003', 500, 500, False),
+            ('9800000004', 200, 200, True),
+        ]:
+            debtor = Debtor.objects.create(
+                created_by=cls.creditor, name=f"Debtor {mobile}", address='Kathmandu', mobile=mobile,
+                initial_debt=debit, debt_date=date(2025, 1, 1), debt_purpose='loan',
+            )
+            Transaction.objects.create(debtor=debtor, tran_type='debit', tran_amount=debit, debit_amount=debit, current_debt=debit)
+            if credit:
+                Transaction.objects.create(
+                    debtor=debtor, tran_type='credit', tran_amount=credit, credit_amount=credit, current_debt=debit - credit,
+                )
+            if deleted:
+                Debtor.objects.filter(pk=debtor.pk).update(is_delete=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.creditor)
+
+    def fragment(self, section, **headers):
+        return self.client.get(reverse('dashboard_fragment', args=[section]), headers=headers)
+
+    def test_fragments_match_the_dashboard(self):
+        cards = self.client.get(reverse('user_dashboard')).context
+        for section, card in [('active', 'active_debtors_no'), ('recovered', 'recovered_debtors_no'), ('deleted', 'deleted_debtors_no')]:
+            self.assertEqual(len(self.fragment(section).context['debtors']), cards[card], section)
+        debtors = self.fragment('amounts').context['debtors']
+        self.assertEqual(len(debtors), cards['total_debtors_no'])
+        self.assertEqual(sum(d.total_debit for d in debtors), cards['total_debt_amount'])
+        self.assertEqual(sum(d.total_credit for d in debtors), cards['total_recovered_debt'])
+        self.assertEqual(sum(d.remaining_debt for d in debtors), cards['total_current_debt'])
+        self.assertEqual(cards['total_current_debt'], Decimal(1300))
+
+    def test_unchanged_fragment_is_not_sent_again(self):
+        first = self.fragment('active')
+        self.assertEqual(self.fragment('active', if_none_match=first['ETag']).status_code, 304)
+        debtor = Debtor.objects.get(mobile='9800000002')
+        Transaction.objects.create(debtor=debtor, tran_type='credit', tran_amount=100, credit_amount=100, current_debt=600)
+        again = self.fragment('active', if_none_match=first['ETag'])
+        self.assertEqual(again.status_code, 200)
+        self.assertContains(again, '600.00')
+
+
+class DebtorAutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.creditor = User.objects.create_user('creditor', password='secret', address='Kathmandu')
+        other = User.objects.create_user('other', password='secret', address='Lalitpur')
+        for creditor, name, mobile, deleted in [
+            (cls.creditor, 'Ram Bahadur', '9841000001', False),
+            (cls.creditor, 'Ramesh Thapa', '9841000002', False),
+            (cls.creditor, 'Sita Karki', '9851000003', False),
+            (cls.creditor, 'Ramu Shrestha', '9861000004', True),
+            (other, 'Ram Prasad', '9841000005', False),
+        ]:
+            Debtor.objects.create(
+                created_by=creditor, name=name, address='Kathmandu', mobile=mobile,
+                debt_date=date(2025, 1, 1), debt_purpose='loan', is_delete=deleted,
+            )
+        cls.sita = Debtor.objects.get(name='Sita Karki')
+
+    def setUp(self):
+        self.client.force_login(self.creditor)
+
+    def names(self, **params):
+        response = self.client.get(reverse('debtor_autocomplete'), params)
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.json()['results']]
+
+    def test_name_prefix_matches_own_debtors_only(self):
+        self.assertEqual(self.names(q='ram')[:2], ['Ram Bahadur', 'Ramesh Thapa'])
+        self.assertNotIn('Ram Prasad', self.names(q='ram'))
+        self.assertNotIn('Ramu Shrestha', self.names(q='ram'))
+        self.assertIn('Ramu Shrestha', self.names(q='ram', include_deleted='1'))
+
+    def test_id_and_mobile_prefixes(self):
+        self.assertEqual(self.names(q='98410'), ['Ram Bahadur', 'Ramesh Thapa'])
+        self.assertEqual(self.names(q=self.sita.debtor_id.lower())[0], 'Sita Karki')
+        self.assertEqual(self.names(q='98', limit='1'), ['Ram Bahadur'])
+        self.assertEqual(self.names(q=' '), [])
+
+
+class TransactionSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.creditor = User.objects.create_user('creditor', password='secret', address='Kathmandu')
+        other = User.objects.create_user('other', password='secret', address='Lalitpur')
+        farmer = Debtor.objects.create(
+            created_by=cls.creditor, name='Hari', address='Chitwan', mobile='9800000001',
+            debt_date=date(2025, 1, 1), debt_purpose='tractor loan', voucher_cheque_no='778812',
+        )
+        shop = Debtor.objects.create(
+            created_by=cls.creditor, name='Gita', address='Butwal', mobile='9800000002',
+            debt_date=date(2025, 1, 1), debt_purpose='shop stock',
+        )
+        neighbour = Debtor.objects.create(
+            created_by=other, name='Shyam', address='Chitwan', mobile='9800000003',
+            debt_date=date(2025, 1, 1), debt_purpose='tractor loan',
+        )
+        for debtor, desc in [
+            (farmer, 'paid for seeds'), (farmer, 'fertilizer bags'), (shop, 'seeds and tools'), (neighbour, 'seeds'),
+        ]:
+            Transaction.objects.create(
+                debtor=debtor, tran_type='debit', tran_amount=100, debit_amount=100, current_debt=100, tran_desc=desc,
+            )
+
+    def found(self, query):
+        return {t.tran_desc for t in search.transaction_search(self.creditor, query)}
+
+    def test_matches_descriptions_purposes_and_vouchers(self):
+        self.assertEqual(self.found('seeds'), {'paid for seeds', 'seeds and tools'})
+        self.assertEqual(self.found('tractor'), {'paid for seeds', 'fertilizer bags'})
+        self.assertEqual(self.found('778812'), {'paid for seeds', 'fertilizer bags'})
+        self.assertEqual(self.found('tools seeds'), {'seeds and tools'})
+        self.assertEqual(self.found('harvest'), set())
+
+    def test_results_page_highlights_the_match(self):
+        self.client.force_login(self.creditor)
+        response = self.client.get(reverse('transaction_text_search'), {'q': 'fertilizer'})
+        [tran] = response.context['page_obj'].object_list
+        self.assertEqual(tran.desc_html, '<mark>fertilizer</mark> bags')
+
+    def test_search_document_is_not_loaded(self):
+        self.assertEqual(Transaction.objects.first().get_deferred_fields(), {'search_vector'})
+        self.assertEqual(self.creditor.debtors.first().transactions.first().get_deferred_fields(), {'search_vector'})
+
+
+class AgingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.creditor = get_user_model().objects.create_user('creditor', password='secret', address='Kathmandu')
+        cls.today = timezone.localdate()
+        cls.debtor = Debtor.objects.create(
+            created_by=cls.creditor, name='Ram', address='Kathmandu', mobile='9800000001',
+            initial_debt=1000, debt_date=cls.today - timedelta(days=100), debt_purpose='loan',
+        )
+        # Added without debt: a zero opening row, then the first real loan
+        cls.late = Debtor.objects.create(
+            created_by=cls.creditor, name='Sita', address='Pokhara', mobile='9800000002',
+            initial_debt=0, debt_date=cls.today - timedelta(days=100), debt_purpose='shop',
+        )
+        for debtor, days_ago, debit, credit in [
+            (cls.debtor, 100, 1000, 0), (cls.debtor, 40, 200, 0), (cls.debtor, 10, 0, 1100),
+            (cls.late, 100, 0, 0), (cls.late, 20, 500, 0),
+        ]:
+            cls.post(debtor, cls.today - timedelta(days=days_ago), debit, credit)
+
+    @staticmethod
+    def post(debtor, day, debit, credit, hour=12):
+        tran = Transaction.objects.create(
+            debtor=debtor, tran_type='credit' if credit else 'debit', tran_amount=debit or credit,
+            debit_amount=debit, credit_amount=credit, current_debt=debtor.current_debt + debit - credit,
+        )
+        Transaction.objects.filter(pk=tran.pk).update(tran_date=timezone.make_aware(datetime.combine(day, time(hour))))
+
+    def report(self, days_ago):
+        rows, totals = aging.aging_report(self.creditor, self.today - timedelta(days=days_ago))
+        buckets = {row['name']: [row[key] for key, _ in aging.BUCKETS] for row in rows}
+        return buckets, totals['outstanding']
+
+    def test_credits_pay_the_oldest_debits_first(self):
+        # The payment cleared the opening debit and half of the later one
+        self.assertEqual(self.report(0), ({'Ram': [0, 100, 0, 0], 'Sita': [500, 0, 0, 0]}, Decimal(600)))
+
+    def test_as_of_ignores_later_transactions(self):
+        self.assertEqual(self.report(20), ({'Ram': [200, 0, 1000, 0], 'Sita': [500, 0, 0, 0]}, Decimal(1700)))
+        self.assertEqual(self.report(50), ({'Ram': [0, 1000, 0, 0]}, Decimal(1000)))
+        self.assertEqual(self.report(101), ({}, 0))
+
+    def test_first_debit_after_a_zero_opening_is_aged_from_its_own_day(self):
+        rows, _ = aging.aging_report(self.creditor, self.today)
+        self.assertEqual({row['name']: row['oldest_unpaid'] for row in rows}['Sita'], self.today - timedelta(days=20))
+
+    def test_transactions_are_dated_in_local_time(self):
+        # 01:00 in Kathmandu is still the previous day in UTC
+        self.post(self.debtor, self.today - timedelta(days=5), 300, 0, hour=1)
+        self.assertEqual(self.report(5)[0]['Ram'], [300, 100, 0, 0])
+        self.assertEqual(self.report(6)[0]['Ram'], [0, 100, 0, 0])
+
+
+class BalanceSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.creditor = get_user_model().objects.create_user('creditor', password='secret', address='Kathmandu')
+        cls.today = timezone.localdate()
+        cls.days = [cls.today - timedelta(days=n) for n in (800, 500, 400, 60, 1, 0)]
+        # Settled two years ago, so archive() takes it
+        cls.old = Debtor.objects.create(
+            created_by=cls.creditor, name='Ram', address='Kathmandu', mobile='9800000001',
+            initial_debt=700, debt_date=cls.days[0], debt_purpose='loan',
+        )
+        # Still owing, with recent activity
+        cls.open = Debtor.objects.create(
+            created_by=cls.creditor, name='Sita', address='Pokhara', mobile='9800000002',
+            initial_debt=1000, debt_date=cls.days[1], debt_purpose='shop',
+        )
+        trans = {}
+        for name, debtor, day, debit, credit in [
+            ('old_loan', cls.old, cls.days[0], 700, 0),
+            ('old_payment', cls.old, cls.days[1], 0, 200),
+            ('old_settled', cls.old, cls.days[2], 0, 500),
+            ('open_loan', cls.open, cls.days[1], 1000, 0),
+            ('open_payment', cls.open, cls.days[3], 0, 300),
+            ('open_topup', cls.open, cls.days[4], 50, 0),
+        ]:
+            trans[name] = Transaction.objects.create(
+                debtor=debtor, tran_type='credit' if credit else 'debit', tran_amount=debit or credit,
+                debit_amount=debit, credit_amount=credit, current_debt=debtor.current_debt + debit - credit,
+            )
+            Transaction.objects.filter(pk=trans[name].pk).update(tran_date=cls.noon(day))
+        cls.old_payment, cls.open_loan = trans['old_payment'], trans['open_loan']
+        # The transactions were moved after their snapshots were recorded
+        balances.rebuild(cls.creditor)
+
+    @staticmethod
+    def noon(day):
+        return timezone.make_aware(datetime.combine(day, time(12)))
+
+    def expected(self, day):
+        """Totals at the end of `day` from every row, in the table or archived."""
+        end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+        hot = Transaction.objects.filter(debtor__created_by=self.creditor, tran_date__lt=end).aggregate(
+            debit=Sum('debit_amount'), credit=Sum('credit_amount'),
+        )
+        debit, credit = hot['debit'] or Decimal(0), hot['credit'] or Decimal(0)
+        for data in TransactionArchive.objects.values_list('data', flat=True):
+            for row in archive._rows(data):
+                if row['tran_date'] < end:
+                    debit += row['debit_amount']
+                    credit += row['credit_amount']
+        return debit, credit
+
+    def assertTotalsMatch(self):
+        for day in self.days + [self.days[0] - timedelta(days=1), self.days[2] + timedelta(days=1)]:
+            totals = balances.totals_as_of(day, creditor=self.creditor)
+            self.assertEqual((totals['total_debit'], totals['total_credit']), self.expected(day), day)
+
+    def test_totals_match_full_aggregate(self):
+        self.assertTotalsMatch()
+        self.assertEqual(balances.balance_as_of(self.today, debtor=self.open), Decimal(750))
+
+    def test_totals_keep_archived_ledgers(self):
+        self.assertEqual(archive.archive(days=365), (1, 3))
+        self.assertTotalsMatch()
+        balances.rebuild(self.creditor)
+        self.assertTotalsMatch()
+        self.assertEqual(balances.totals_as_of(self.today, creditor=self.creditor)['total_debit'], Decimal(1750))
+
+    def test_totals_after_invalidating_across_an_archive(self):
+        archive.archive(days=365)
+        # Editing an early row drops every snapshot from its day on, so reads
+        # scan from before the archived ledger
+        loan = Transaction.objects.get(pk=self.open_loan.pk)
+        loan.tran_desc = 'edited'
+        loan.save()
+        self.assertTotalsMatch()
+        Transaction.objects.create(
+            debtor=self.open, tran_type='credit', tran_amount=25, credit_amount=25, current_debt=725,
+        )
+        self.assertTotalsMatch()
+
+    def test_snapshot_inside_an_archived_ledger(self):
+        archive.archive(days=365)
+        # A snapshot on a day in the middle of the archived ledger, through
+        # its archived row of that day but not the table's later one
+        CreditorDailyBalance.objects.filter(creditor=self.creditor).delete()
+        CreditorDailyBalance.objects.create(
+            creditor=self.creditor, day=self.days[1], total_debit=700, total_credit=200,
+            last_tran_id=self.old_payment.pk,
+        )
+        self.assertLess(self.old_payment.pk, self.open_loan.pk)
+        self.assertTotalsMatch()
+
+
+class MonthlyRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.creditor = get_user_model().objects.create_user('creditor', password='secret', address='Kathmandu')
+        cls.this_month = rollups.month_of(timezone.localdate())
+        months = [rollups._add_months(cls.this_month, -n) for n in (2, 1, 0)]
+        ram = Debtor.objects.create(
+            created_by=cls.creditor, name='Ram', address='Kathmandu', mobile='9800000001',
+            initial_debt=1000, debt_date=months[0], debt_purpose='loan',
+        )
+        sita = Debtor.objects.create(
+            created_by=cls.creditor, name='Sita', address='Pokhara', mobile='9800000002',
+            initial_debt=400, debt_date=months[1], debt_purpose='shop',
+        )
+        for debtor, month, debit, credit in [
+            (ram, months[0], 1000, 0), (ram, months[1], 0, 600), (sita, months[1], 400, 0),
+            (sita, months[2], 0, 400), (ram, months[2], 0, 400),
+        ]:
+            tran = Transaction.objects.create(
+                debtor=debtor, tran_type='credit' if credit else 'debit', tran_amount=debit or credit,
+                debit_amount=debit, credit_amount=credit, current_debt=debtor.current_debt + debit - credit,
+            )
+            # Just after midnight on the 1st, still the month before in UTC
+            tran_date = timezone.make_aware(datetime.combine(month, time(0, 30)))
+            Transaction.objects.filter(pk=tran.pk).update(tran_date=tran_date)
+        # The rows were moved out of the month they were recorded in
+        rollups.rebuild(cls.creditor)
+
+    def expected(self):
+        months = {}
+        for tran in Transaction.objects.filter(debtor__created_by=self.creditor):
+            row = months.setdefault(rollups.month_of(tran.tran_date), [Decimal(0), Decimal(0), 0, 0])
+            row[0] += tran.debit_amount
+            row[1] += tran.credit_amount
+            row[2] += tran.credit_amount > 0 and tran.current_debt <= 0
+        for debtor in Debtor.objects.filter(created_by=self.creditor):
+            months.setdefault(rollups.month_of(debtor.created_at), [Decimal(0), Decimal(0), 0, 0])[3] += 1
+        return months
+
+    def stored(self):
+        return {
+            rollup.month: [rollup.total_debit, rollup.total_credit, rollup.recoveries, rollup.new_debtors]
+            for rollup in MonthlyRollup.objects.filter(creditor=self.creditor)
+            if rollup.total_debit or rollup.total_credit or rollup.new_debtors
+        }
+
+    def test_rollups_match_full_aggregate(self):
+        self.assertEqual(self.stored(), self.expected())
+        self.assertEqual(len(self.stored()), 3)
+
+    def test_rollups_follow_adds_and_deletes(self):
+        debtor = Debtor.objects.create(
+            created_by=self.creditor, name='Hari', address='Chitwan', mobile='9800000003',
+            initial_debt=250, debt_date=self.this_month, debt_purpose='seeds',
+        )
+        Transaction.objects.create(debtor=debtor, tran_type='debit', tran_amount=250, debit_amount=250, current_debt=250)
+        self.assertEqual(self.stored(), self.expected())
+        Transaction.objects.filter(debtor__name='Ram', credit_amount=600).get().delete()
+        self.assertEqual(self.stored(), self.expected())
+        rollups.rebuild(self.creditor)
+        self.assertEqual(self.stored(), self.expected())
+
+    def test_series_endpoint(self):
+        self.client.force_login(self.creditor)
+        data = self.client.get(reverse('dashboard_series'), {'months': 2}).json()
+        self.assertEqual(data['months'], [f"{rollups._add_months(self.this_month, -1):%Y-%m}", f"{self.this_month:%Y-%m}"])
+        self.assertEqual([Decimal(value) for value in data['net']], [Decimal(-200), Decimal(-800)])
+        self.assertEqual(data['recoveries'], [0, 2])
+        self.assertEqual(self.client.get(reverse('dashboard_series'), {'months': 'x'}).status_code, 400)
+
+
+class ForecastTests(TestCase):
+    as_of = date(2025, 6, 30)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.creditor = get_user_model().objects.create_user('creditor', password='secret', address='Kathmandu')
+        start = cls.as_of - timedelta(days=60)
+        for name, mobile, ledger in [
+            # pays 100 every 10 days
+            ('Ram', '9800000001', [(60, 1000, 0), (30, 0, 100), (20, 0, 100), (10, 0, 100)]),
+            ('Sita', '9800000002', [(60, 500, 0), (5, 0, 100)]),
+            ('Hari', '9800000003', [(60, 300, 0)]),
+            # pays 100 every 15 days
+            ('Gita', '9800000004', [(60, 400, 0), (30, 0, 100), (15, 0, 100)]),
+            ('Kiran', '9800000005', [(60, 200, 0), (30, 0, 100), (15, 0, 100)]),
+        ]:
+            debtor = Debtor.objects.create(
+                created_by=cls.creditor, name=name, address='Kathmandu', mobile=mobile,
+                initial_debt=ledger[0][1], debt_date=start, debt_purpose='loan',
+            )
+            for days_ago, debit, credit in ledger:
+                tran = Transaction.objects.create(
+                    debtor=debtor, tran_type='credit' if credit else 'debit', tran_amount=debit or credit,
+                    debit_amount=debit, credit_amount=credit, current_debt=debtor.current_debt + debit - credit,
+                )
+                tran_date = timezone.make_aware(datetime.combine(cls.as_of - timedelta(days=days_ago), time(12)))
+                Transaction.objects.filter(pk=tran.pk).update(tran_date=tran_date)
+
+    def test_forecast_of_a_small_book(self):
+        result = forecast.forecast_book(self.creditor, as_of=self.as_of)
+        # Kiran paid off and is recovered; Sita and Hari have too few payments
+        self.assertEqual(result['totals'], {'balance': 1600.0, 'debtors': 4, 'forecastable': 2, 'expected_cash': 900.0})
+        self.assertEqual(
+            [(d['name'], d['next_payment'], d['payments_left'], d['payoff_date']) for d in result['debtors'][:2]],
+            [('Gita', self.as_of, 2, self.as_of + timedelta(days=15)), ('Ram', self.as_of, 7, self.as_of + timedelta(days=60))],
+        )
+        self.assertEqual([d['status'] for d in result['debtors'][2:]], [forecast.STATUS_NO_PAYMENTS, forecast.STATUS_ONE_PAYMENT])
+        # Ram's payments on days 0, 10, ..., 60 and Gita's on days 0 and 15
+        self.assertEqual([cash for _, cash in result['weeks'][:9]], [200, 100, 200, 0, 100, 100, 0, 100, 100])
+
+    def test_weekly_cash_does_not_depend_on_the_chunk_size(self):
+        expected = forecast.forecast_book(self.creditor, as_of=self.as_of, horizon_weeks=2)
+        self.assertEqual(expected['totals']['expected_cash'], 300.0)
+        with mock.patch.object(forecast, 'EVENTS_PER_CHUNK', 1):
+            self.assertEqual(forecast.forecast_book(self.creditor, as_of=self.as_of, horizon_weeks=2), expected)
+
+
+class InterestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.creditor = get_user_model().objects.create_user('creditor', password='secret', address='Kathmandu')
+        cls.today = timezone.localdate()
+        cls.debtor = Debtor.objects.create(
+            created_by=cls.creditor, name='Ram', address='Kathmandu', mobile='9800000001',
+            initial_debt=10000, debt_date=cls.today - timedelta(days=100), debt_purpose='loan',
+        )
+        # 36.5% a year is 0.1% a day
+        InterestTerms.objects.create(debtor=cls.debtor, annual_rate=Decimal('36.50'), compounding='daily')
+        for days_ago, debit, credit in [(100, 10000, 0), (5, 0, 4000)]:
+            tran = Transaction.objects.create(
+                debtor=cls.debtor, tran_type='credit' if credit else 'debit', tran_amount=debit or credit,
+                debit_amount=debit, credit_amount=credit, current_debt=cls.debtor.current_debt + debit - credit,
+            )
+            tran_date = timezone.make_aware(datetime.combine(cls.today - timedelta(days=days_ago), time(12)))
+            Transaction.objects.filter(pk=tran.pk).update(tran_date=tran_date)
+        cls.payment = tran
+        balances.rebuild(cls.creditor)
+
+    def balance_at_end_of(self, day):
+        end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+        totals = self.debtor.transactions.filter(tran_date__lt=end).aggregate(
+            debit=Sum('debit_amount'), credit=Sum('credit_amount'),
+        )
+        return totals['debit'] - totals['credit']
+
+    def test_past_day_is_charged_on_that_days_balance(self):
+        day = self.today - timedelta(days=10)
+        self.assertEqual(interest.accrue(day), (1, Decimal('10.00')))
+        accrual = Transaction.objects.get(tran_id__startswith=interest.TRAN_ID_PREFIX)
+        self.assertEqual(timezone.localdate(accrual.tran_date), day)
+        self.assertEqual(accrual.current_debt, Decimal('10010.00'))
+        # The later payment's running balance now includes the interest
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.current_debt, Decimal('6010.00'))
+        self.assertEqual(self.debtor.current_debt, Decimal('6010.00'))
+        for as_of in (day - timedelta(days=1), day, self.today):
+            self.assertEqual(balances.balance_as_of(as_of, debtor=self.debtor), self.balance_at_end_of(as_of))
+        # Posted once per day
+        self.assertEqual(interest.accrue(day), (0, Decimal(0)))
+
+    def test_today_is_charged_on_the_current_balance(self):
+        self.assertEqual(interest.accrue(), (1, Decimal('6.00')))
+        self.assertEqual(self.debtor.current_debt, Decimal('6006.00'))
+        self.assertEqual(balances.balance_as_of(self.today, debtor=self.debtor), Decimal('6006.00'))
+
+    def test_runs_continue_the_numbering(self):
+        interest.accrue(self.today - timedelta(days=2))
+        interest.accrue(self.today - timedelta(days=1))
+        self.assertEqual(
+            list(self.debtor.transactions.filter(tran_id__startswith='I').order_by('tran_date').values_list('tran_id', flat=True)),
+            ['I000000001', 'I000000002'],
+        )
+
+
+class PaymentPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.creditor = get_user_model().objects.create_user('creditor', password='secret', address='Kathmandu')
+        cls.debtor = Debtor.objects.create(
+            created_by=cls.creditor, name='Ram', address='Kathmandu', mobile='9800000001',
+            initial_debt=1000, debt_date=date(2025, 1, 1), debt_purpose='loan',
+        )
+        Transaction.objects.create(debtor=cls.debtor, tran_type='debit', tran_amount=1000, debit_amount=1000, current_debt=1000)
+        [cls.plan] = plans.create_plans([{
+            'debtor': cls.debtor, 'total_amount': Decimal(1000), 'installment_count': 3,
+            'frequency': 'monthly', 'start_date': date(2025, 1, 31),
+        }])
+
+    def schedule(self):
+        return list(self.plan.installments.order_by('sequence').values_list('due_date', 'amount', 'paid_amount', 'is_paid'))
+
+    def pay(self, amount):
+        return Transaction.objects.create(
+            debtor=self.debtor, tran_type='credit', tran_amount=amount, credit_amount=amount,
+            current_debt=self.debtor.current_debt - amount,
+        )
+
+    def test_schedule_splits_the_amount_by_month(self):
+        self.assertEqual(self.schedule(), [
+            (date(2025, 1, 31), Decimal('333.34'), 0, False),
+            (date(2025, 2, 28), Decimal('333.33'), 0, False),
+            (date(2025, 3, 31), Decimal('333.33'), 0, False),
+        ])
+        self.assertEqual(
+            list(plans.overdue(date(2025, 3, 1), creditor=self.creditor).values_list('sequence', flat=True)), [1, 2],
+        )
+
+    def test_credits_pay_the_earliest_installments_first(self):
+        payment = self.pay(400)
+        self.assertEqual([row[2:] for row in self.schedule()], [
+            (Decimal('333.34'), True), (Decimal('66.66'), False), (0, False),
+        ])
+        self.pay(600)
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.status, plans.COMPLETED)
+        # Deleting a credit matches the rest again
+        payment.delete()
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.status, plans.ACTIVE)
+        self.assertEqual([row[2:] for row in self.schedule()], [
+            (Decimal('333.34'), True), (Decimal('266.66'), False), (0, False),
+        ])
+
+    def test_reschedule_spreads_what_is_left(self):
+        self.pay(400)
+        plans.reschedule([self.plan], date(2025, 6, 1), installment_count=2, frequency='weekly')
+        self.assertEqual(self.schedule(), [
+            (date(2025, 1, 31), Decimal('333.34'), Decimal('333.34'), True),
+            # closed at what was paid
+            (date(2025, 2, 28), Decimal('66.66'), Decimal('66.66'), True),
+            (date(2025, 6, 1), Decimal('300.00'), 0, False),
+            (date(2025, 6, 8), Decimal('300.00'), 0, False),
+        ])
+
+
+class ReminderTests(TestCase):
+    backend = 'django.core.mail.backends.locmem.EmailBackend'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.creditor = get_user_model().objects.create_user(
+            'creditor', email='creditor@example.com', password='secret', address='Kathmandu',
+        )
+        cls.debtor = Debtor.objects.create(
+            created_by=cls.creditor, name='Ram', address='Kathmandu', mobile='9800000001',
+            initial_debt=900, debt_date=date(2025, 1, 1), debt_purpose='loan',
+        )
+        Transaction.objects.create(debtor=cls.debtor, tran_type='debit', tran_amount=900, debit_amount=900, current_debt=900)
+        plans.create_plans([{
+            'debtor': cls.debtor, 'total_amount': Decimal(900), 'installment_count': 3,
+            'frequency': 'monthly', 'start_date': date(2025, 1, 31),
+        }])
+
+    def test_overdue_installments_are_reminded_once_per_interval(self):
+        self.assertEqual(reminders.dispatch(date(2025, 3, 1), backend=self.backend), (1, 2))
+        [message] = mail.outbox
+        self.assertEqual(message.to, ['creditor@example.com'])
+        self.assertEqual(message.subject, '2 overdue installment(s) from your debtors')
+        self.assertIn('Ram', message.body)
+        # A rerun, and any run within the interval, sends nothing
+        self.assertEqual(reminders.dispatch(date(2025, 3, 1), backend=self.backend), (0, 0))
+        self.assertEqual(reminders.dispatch(date(2025, 3, 7), backend=self.backend), (0, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(reminders.dispatch(date(2025, 3, 8), backend=self.backend), (1, 2))
+        self.assertEqual(ReminderLog.objects.filter(creditor=self.creditor).count(), 4)
+
+    def test_pages_are_sent_as_separate_messages(self):
+        self.assertEqual(reminders.dispatch(date(2025, 4, 1), page_size=2, backend=self.backend), (2, 3))
+        self.assertEqual([message.subject[0] for message in mail.outbox], ['2', '1'])
+        self.assertEqual(reminders.dispatch(date(2025, 4, 1), page_size=2, backend=self.backend), (0, 0))
+
+
+class DigestTests(TestCase):
+    backend = 'django.core.mail.backends.locmem.EmailBackend'
+
+    @classmethod
+    def setUpTestData(cls):
+        users = get_user_model().objects
+        cls.creditor = users.create_user('creditor', email='creditor@example.com', password='secret', address='Kathmandu')
+        # No book, and a book but no email: neither gets a digest
+        users.create_user('idle', email='idle@example.com', password='secret', address='Kathmandu')
+        silent = users.create_user('silent', password='secret', address='Kathmandu')
+        for creditor, mobile, debit, credit, deleted in [
+            (cls.creditor, '9800000001', 1000, 400, False),
+            (cls.creditor, '9800000002', 500, 500, False),
+            (cls.creditor, '9800000003', 300, 0, False),
+            (cls.creditor, '9800000004', 200, 50, True),
+            (silent, '9800000005', 900, 0, False),
+        ]:
+            debtor = Debtor.objects.create(
+                created_by=creditor, name=f"Debtor {mobile}", address='Kathmandu', mobile=mobile,
+                initial_debt=debit, debt_date=date(2025, 1, 1), debt_purpose='loan',
+            )
+            Transaction.objects.create(debtor=debtor, tran_type='debit', tran_amount=debit, debit_amount=debit, current_debt=debit)
+            if credit:
+                Transaction.objects.create(
+                    debtor=debtor, tran_type='credit', tran_amount=credit, credit_amount=credit, current_debt=debit - credit,
+                )
+            if deleted:
+                Debtor.objects.filter(pk=debtor.pk).update(is_delete=True)
+
+    def test_figures_match_the_dashboard(self):
+        [(creditor, figures)] = digest.compute(timezone.localdate())
+        self.assertEqual(creditor, self.creditor)
+        cards = async_to_sync(live.figures)(self.creditor.pk)
+        self.assertEqual(figures['outstanding'], cards['total_current_debt'])
+        self.assertEqual(figures['active'], cards['active_debtors_no'])
+        self.assertEqual(figures['recovered'], cards['recovered_debtors_no'])
+        self.assertEqual(figures['paid'], cards['total_recovered_debt'])
+        self.assertEqual(figures['debited'], cards['total_debt_amount'])
+        self.assertEqual((figures['payments'], figures['debts'], figures['new_debtors']), (3, 4, 4))
+
+    def test_yesterday_is_a_quiet_day(self):
+        [(_, figures)] = digest.compute(timezone.localdate() - timedelta(days=1))
+        self.assertEqual((figures['payments'], figures['paid'], figures['debts'], figures['new_debtors']), (0, 0, 0, 0))
+        self.assertEqual(figures['outstanding'], Decimal(1050))
+
+    def test_one_message_per_creditor(self):
+        stats = digest.dispatch(timezone.localdate(), backend=self.backend)
+        self.assertEqual((stats['creditors'], stats['sent']), (1, 1))
+        [message] = mail.outbox
+        self.assertEqual(message.to, ['creditor@example.com'])
+        self.assertIn('Outstanding now: 1050.00', message.body)
+
+
+class LedgerIntegrityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.creditor = get_user_model().objects.create_user('creditor', password='secret', address='Kathmandu')
+        cls.debtor = Debtor.objects.create(
+            created_by=cls.creditor, name='Ram', address='Kathmandu', mobile='9800000001',
+            initial_debt=1000, debt_date=date(2025, 1, 1), debt_purpose='loan',
+        )
+        cls.rows = [
+            Transaction.objects.create(
+                debtor=cls.debtor, tran_type=tran_type, tran_amount=amount, current_debt=balance,
+                **{f"{tran_type}_amount": amount},
+            )
+            for tran_type, amount, balance in [('debit', 1000, 1000), ('credit', 400, 600), ('credit', 200, 400)]
+        ]
+
+    def verify(self, **kwargs):
+        [task] = integrity.plan_tasks(self.creditor.pk)
+        return integrity.verify_slice(task, **kwargs)
+
+    def test_clean_ledger(self):
+        result = self.verify()
+        self.assertEqual((result['debtors'], result['transactions'], sum(result['found'].values())), (1, 3, 0))
+
+    def test_corrupted_balance_is_found_and_repaired(self):
+        Transaction.objects.filter(pk=self.rows[1].pk).update(current_debt=999)
+        Debtor.objects.filter(pk=self.debtor.pk).update(debtor_status='recovered')
+        result = self.verify()
+        self.assertEqual(result['found'], {'balance': 1, 'status': 1})
+        self.assertEqual(result['samples'][0], ('balance', self.debtor.debtor_id, self.rows[1].tran_id, '999.00', '600.00'))
+        self.assertEqual(result['repaired'], 0)
+
+        result = self.verify(repair=True)
+        self.assertEqual(result['repaired'], 2)
+        self.assertIn((self.creditor.pk, rollups.month_of(self.rows[1].tran_date)), result['touched'])
+        self.assertEqual(
+            list(self.debtor.transactions.order_by('id').values_list('current_debt', flat=True)),
+            [1000, 600, 400],
+        )
+        self.debtor.refresh_from_db()
+        self.assertEqual(self.debtor.debtor_status, 'active')
+        self.assertFalse(self.verify()['found'])
+
+
+class AuditTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.creditor = get_user_model().objects.create_user('creditor', password='secret', address='Kathmandu')
+        cls.debtor = Debtor.objects.create(
+            created_by=cls.creditor, name='Ram', address='Kathmandu', mobile='9800000001',
+            initial_debt=1000, debt_date=date(2025, 1, 1), debt_purpose='loan',
+        )
+
+    def test_events_are_written_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                audit.record('debtor_edited', actor=self.creditor, debtor=self.debtor, changes={'name': ['Ram', 'Hari']})
+                self.assertFalse(AuditEvent.objects.exists())
+        [event] = audit.for_debtor(self.debtor.pk)
+        self.assertEqual((event.actor, event.actor_name, event.debtor_code), (self.creditor, 'creditor', self.debtor.debtor_id))
+        self.assertEqual(event.details, {'changes': {'name': ['Ram', 'Hari']}})
+
+    def test_rolled_back_change_leaves_no_event(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    audit.record('debtor_deleted', actor=self.creditor, debtor=self.debtor)
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertFalse(AuditEvent.objects.exists())
+
+    def test_compact_merges_a_run_of_edits(self):
+        day = timezone.make_aware(datetime(2024, 1, 10, 9))
+        AuditEvent.objects.bulk_create([
+            AuditEvent(
+                created_at=created_at, action='debtor_edited', actor=self.creditor, actor_name='creditor',
+                debtor_ref=self.debtor.pk, debtor_code=self.debtor.debtor_id, details={'changes': changes},
+            )
+            for created_at, changes in [
+                (day, {'name': ['Ram', 'Hari']}),
+                (day + timedelta(minutes=1), {'name': ['Hari', 'Shyam'], 'address': ['Kathmandu', 'Pokhara']}),
+                (day + timedelta(minutes=2), {'address': ['Pokhara', 'Lalitpur']}),
+                (day + timedelta(days=2), {'mobile': ['9800000001', '9800000009']}),
+            ]
+        ])
+        self.assertEqual(audit.compact(older_than_days=365, batch_size=2), 2)
+        merged, other_day = audit.for_debtor(self.debtor.pk).order_by('created_at')
+        self.assertEqual(merged.details, {
+            'changes': {'name': ['Ram', 'Shyam'], 'address': ['Kathmandu', 'Lalitpur']}, 'compacted': 3,
+        })
+        self.assertEqual(merged.created_at, day + timedelta(minutes=2))
+        self.assertEqual(other_day.details, {'changes': {'mobile': ['9800000001', '9800000009']}})
+        # Already compacted: nothing more to merge
+        self.assertEqual(audit.compact(older_than_days=365), 0)
+
+
+class IdempotencyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.creditor = get_user_model().objects.create_user('creditor', password='secret', address='Kathmandu')
+        cls.debtor = Debtor.objects.create(
+            created_by=cls.creditor, name='Ram', address='Kathmandu', mobile='9800000001',
+            initial_debt=500, debt_date=date(2025, 1, 1), debt_purpose='loan',
+        )
+        Transaction.objects.create(debtor=cls.debtor, tran_type='debit', tran_amount=500, debit_amount=500, current_debt=500)
+        cls.url = f"{reverse('add_transaction')}?debtor_id={cls.debtor.debtor_id}&tran_type=credit"
+        cls.form = {'idempotency_key': 'abcdef123456', 'tran_amount': '100', 'tran_medium': 'cash', 'tran_desc': 'paid'}
+
+    def setUp(self):
+        self.client.force_login(self.creditor)
+
+    def test_double_post_saves_once(self):
+        first = self.client.post(self.url, self.form)
+        second = self.client.post(self.url, self.form)
+        self.assertEqual(first.status_code, 302)
+        self.assertEqual((second.status_code, second['Location']), (302, first['Location']))
+        self.assertEqual(self.debtor.transactions.filter(credit_amount=100).count(), 1)
+
+    def test_rejected_post_releases_the_key(self):
+        response = self.client.post(self.url, dict(self.form, tran_amount='900'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.client.post(self.url, self.form).status_code, 302)
+        self.assertEqual(self.debtor.transactions.filter(credit_amount=100).count(), 1)
+
+    def test_redirect_without_saving_releases_the_key(self):
+        response = self.client.post(reverse('add_transaction'), self.form)
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_concurrent_duplicate_replays_or_conflicts(self):
+        # The other request with the key committed its result first
+        IdempotencyKey.objects.create(
+            user=self.creditor, scope='add_transaction', key=self.form['idempotency_key'],
+            result_url='/debtors-list/', expires_at=timezone.now() + timedelta(hours=1),
+        )
+        with mock.patch.object(idempotency, '_done', side_effect=[None, IdempotencyKey.objects.get()]):
+            response = self.client.post(self.url, self.form)
+        self.assertEqual((response.status_code, response['Location']), (302, '/debtors-list/'))
+        # ... or failed and released it
+        with mock.patch.object(idempotency, '_done', return_value=None):
+            response = self.client.post(self.url, self.form)
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(self.debtor.transactions.filter(credit_amount=100).exists())
+
+
+class ArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.creditor = get_user_model().objects.create_user('creditor', password='secret', address='Kathmandu')
+        start = timezone.localdate() - timedelta(days=500)
+        cls.debtor = Debtor.objects.create(
+            created_by=cls.creditor, name='Ram', address='Kathmandu', mobile='9800000001',
+            initial_debt=800, debt_date=start, debt_purpose='loan',
+        )
+        # Posts later: the newest transaction number must stay in the table
+        sita = Debtor.objects.create(
+            created_by=cls.creditor, name='Sita', address='Pokhara', mobile='9800000002',
+            initial_debt=100, debt_date=timezone.localdate(), debt_purpose='shop',
+        )
+        for debtor, day, debit, credit in [
+            (cls.debtor, start, 800, 0), (cls.debtor, start + timedelta(days=30), 0, 300),
+            (cls.debtor, start + timedelta(days=60), 0, 500), (sita, timezone.localdate(), 100, 0),
+        ]:
+            tran = Transaction.objects.create(
+                debtor=debtor, tran_type='credit' if credit else 'debit', tran_amount=debit or credit,
+                debit_amount=debit, credit_amount=credit, current_debt=debtor.current_debt + debit - credit,
+            )
+            Transaction.objects.filter(pk=tran.pk).update(tran_date=timezone.make_aware(datetime.combine(day, time(12))))
+        cls.ledger = list(cls.debtor.transactions.order_by('id').values(*archive.FIELDS))
+
+    def rows(self):
+        return list(self.debtor.transactions.order_by('id').values(*archive.FIELDS))
+
+    def test_archive_and_restore_round_trip(self):
+        self.assertEqual(archive.archive(), (1, 3))
+        self.assertFalse(self.debtor.transactions.exists())
+        self.assertEqual(
+            [(t.pk, t.tran_id, t.tran_date) for t in archive.transactions_for(self.debtor)],
+            [(row['id'], row['tran_id'], row['tran_date']) for row in self.ledger],
+        )
+        self.assertEqual(archive.restore(self.debtor), 3)
+        self.assertFalse(archive.is_archived(self.debtor.pk))
+        self.assertEqual(self.rows(), self.ledger)
+
+    def test_rejected_post_leaves_the_ledger_archived(self):
+        archive.archive()
+        self.client.force_login(self.creditor)
+        url = f"{reverse('add_transaction')}?debtor_id={self.debtor.debtor_id}&tran_type="
+        form = {'tran_amount': '10', 'tran_medium': 'cash', 'tran_desc': 'x'}
+        self.assertEqual(self.client.post(url + 'credit', form).status_code, 200)
+        self.assertTrue(archive.is_archived(self.debtor.pk))
+        self.assertEqual(self.client.post(url + 'debit', form).status_code, 302)
+        self.assertFalse(archive.is_archived(self.debtor.pk))
+        self.assertEqual(self.rows()[:3], self.ledger)
+
+
+class PartitionTests(TransactionTestCase):
+    # The conversion renames the table, which PostgreSQL refuses with the
+    # deferred foreign key checks of a TestCase's inserts still pending
+    def setUp(self):
+        creditor = get_user_model().objects.create_user('creditor', password='secret', address='Kathmandu')
+        self.debtor = Debtor.objects.create(
+            created_by=creditor, name='Ram', address='Kathmandu', mobile='9800000001',
+            initial_debt=1000, debt_date=date(2025, 1, 1), debt_purpose='loan',
+        )
+        self.this_month = rollups.month_of(timezone.localdate())
+        first = Transaction.objects.create(
+            debtor=self.debtor, tran_type='debit', tran_amount=1000, debit_amount=1000, current_debt=1000,
+        )
+        Transaction.objects.filter(pk=first.pk).update(
+            tran_date=timezone.make_aware(datetime.combine(rollups._add_months(self.this_month, -2), time(0, 30))),
+        )
+        Transaction.objects.create(debtor=self.debtor, tran_type='credit', tran_amount=400, credit_amount=400, current_debt=600)
+
+    def rows(self):
+        return list(Transaction.objects.order_by('id').values_list('id', 'tran_id', 'tran_date', 'current_debt'))
+
+    @skipUnless(connection.vendor == 'postgresql', "partitioning is PostgreSQL only")
+    def test_convert_and_revert_keep_the_ledger(self):
+        before = self.rows()
+        created = partitions.convert(ahead=1)
+        self.addCleanup(partitions.revert)
+        self.assertEqual(created, [
+            partitions.partition_name(rollups._add_months(self.this_month, offset)) for offset in (-2, -1, 0, 1)
+        ] + [partitions.DEFAULT_PARTITION])
+        self.assertEqual(self.rows(), before)
+        self.assertIsNone(partitions.convert())
+
+        added = Transaction.objects.create(
+            debtor=self.debtor, tran_type='credit', tran_amount=100, credit_amount=100, current_debt=500,
+        )
+        self.assertGreater(added.pk, before[-1][0])
+        # tran_id stays unique across partitions
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Transaction.objects.filter(pk=added.pk).update(tran_id=before[0][1])
+        self.assertEqual(
+            partitions.ensure_partitions(ahead=2),
+            [partitions.partition_name(rollups._add_months(self.this_month, 2))],
+        )
+
+        self.assertTrue(partitions.revert())
+        self.assertEqual(self.rows(), before + [(added.pk, added.tran_id, added.tran_date, Decimal(500))])
+
+    @skipIf(connection.vendor == 'postgresql', "PostgreSQL supports partitioning")
+    def test_other_backends_are_refused(self):
+        with self.assertRaisesMessage(CommandError, f"Partitioning is not implemented for {connection.vendor}."):
+            call_command('partition_transactions', '--convert')
+        self.assertEqual(len(self.rows()), 2)
+
+
+class CsvDumpTests(TestCase):
+    AMOUNTS = {
+        "Initial Debt", "Total Debt", "Debit Amount", "Credit Amount", "Transaction Amount", "Current Debt",
+    }
+    TIMES = {"Created At", "Updated At", "Transaction Date"}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = get_user_model().objects.create_user('staff', password='secret', address='Kathmandu', is_staff=True)
+        # Whole seconds: XLSX keeps timestamps to the millisecond only
+        stamp = timezone.make_aware(datetime(2025, 3, 1, 10, 30))
+        for mobile, name, debit, credit, deleted in [
+            ('9800000001', 'Ram', 1000, 400, False), ('9800000002', 'Sita, "Didi"', 500, 500, False),
+            ('9800000003', 'Hari', 300, 0, True),
+        ]:
+            debtor = Debtor.objects.create(
+                created_by=cls.staff, name=name, address='Kathmandu', mobile=mobile,
+                initial_debt=debit, debt_date=date(2025, 1, 1), debt_purpose='loan',
+            )
+            Transaction.objects.create(debtor=debtor, tran_type='debit', tran_amount=debit, debit_amount=debit, current_debt=debit)
+            if credit:
+                Transaction.objects.create(
+                    debtor=debtor, tran_type='credit', tran_amount=credit, credit_amount=credit,
+                    current_debt=debit - credit, tran_desc='paid in cash',
+                )
+            Debtor.objects.filter(pk=debtor.pk).update(is_delete=deleted, created_at=stamp, updated_at=stamp)
+        Transaction.objects.update(tran_date=stamp, updated_at=stamp)
+
+    def setUp(self):
+        # A fresh database versions its ledgers as the last run's did
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        export_files = override_settings(EXPORT_CACHE_DIR=directory.name)
+        export_files.enable()
+        self.addCleanup(export_files.disable)
+        self.client.force_login(self.staff)
+
+    def csv_rows(self, name):
+        response = self.client.get(reverse('export_dump_csv', args=[name]))
+        header, *rows = csv.reader(io.StringIO(b''.join(response.streaming_content).decode()))
+        return header, [
+            [self.csv_value(title, text) for title, text in zip(header, row)] for row in rows
+        ]
+
+    def xlsx_rows(self, url_name, header):
+        sheet = load_workbook(io.BytesIO(self.client.get(reverse(url_name)).content)).active
+        return [
+            [self.xlsx_value(title, value) for title, value in zip(header, row)]
+            for row in sheet.iter_rows(min_row=2, values_only=True) if row[1] is not None
+        ]
+
+    def csv_value(self, title, text):
+        if text and title in self.AMOUNTS:
+            return Decimal(text)
+        if text and title in self.TIMES:
+            return timezone.make_naive(datetime.fromisoformat(text))
+        return text
+
+    def xlsx_value(self, title, value):
+        if value is None:
+            return ''
+        if title in self.AMOUNTS:
+            return Decimal(str(value))
+        if title == "Debt Date":
+            return value.date().isoformat()
+        if title in self.TIMES:
+            return value
+        return {'Yes': 't', 'No': 'f'}.get(value, str(value))
+
+    def test_debtor_rows_match_the_xlsx_export(self):
+        header, rows = self.csv_rows('debtors')
+        self.assertEqual(header, [title for title, _ in dumps.COLUMNS['debtors']])
+        self.assertEqual([row[1] for row in rows], ['Ram', 'Sita, "Didi"'])
+        self.assertEqual(rows, self.xlsx_rows('export_all_debtors_xlsx', header))
+
+    def test_transaction_rows_match_the_xlsx_export(self):
+        header, rows = self.csv_rows('transactions')
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(sorted(rows), sorted(self.xlsx_rows('export_all_transactions_xlsx', header)))
+
+
+class ExportCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.creditor = get_user_model().objects.create_user('creditor', password='secret', address='Kathmandu')
+        cls.other = get_user_model().objects.create_user('other', password='secret', address='Pokhara')
+        cls.debtor = Debtor.objects.create(
+            created_by=cls.creditor, name='Ram', address='Kathmandu', mobile='9800000001',
+            initial_debt=1000, debt_date=date(2025, 1, 1), debt_purpose='loan',
+        )
+        Transaction.objects.create(debtor=cls.debtor, tran_type='debit', tran_amount=1000, debit_amount=1000, current_debt=1000)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        export_files = override_settings(EXPORT_CACHE_DIR=directory.name)
+        export_files.enable()
+        self.addCleanup(export_files.disable)
+        self.client.force_login(self.creditor)
+
+    def export(self, **headers):
+        """The response and its body, read from the file on a cache hit (which also closes it)."""
+        response = self.client.get(reverse('all_debtors_xls'), headers=headers)
+        return response, b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_repeat_download_is_served_from_the_file(self):
+        built, body = self.export()
+        self.assertEqual(built.status_code, 200)
+        self.assertFalse(built.streaming)
+        self.assertEqual(len(list(export_cache.cache_dir().glob('*.export'))), 1)
+        served, served_body = self.export()
+        self.assertTrue(served.streaming)
+        self.assertEqual((served['ETag'], served['Content-Disposition']), (built['ETag'], built['Content-Disposition']))
+        self.assertEqual(served_body, body)
+
+    def test_unchanged_export_is_not_sent_again(self):
+        etag = self.export()[0]['ETag']
+        self.assertEqual(self.export(if_none_match=etag)[0].status_code, 304)
+        # Another creditor's export has its own key
+        self.client.force_login(self.other)
+        self.assertEqual(self.export(if_none_match=etag)[0].status_code, 200)
+
+    def test_a_write_gives_a_new_key(self):
+        before, _ = self.export()
+        Transaction.objects.create(debtor=self.debtor, tran_type='credit', tran_amount=400, credit_amount=400, current_debt=600)
+        after, body = self.export(if_none_match=before['ETag'])
+        self.assertEqual(after.status_code, 200)
+        self.assertNotEqual(after['ETag'], before['ETag'])
+        self.assertFalse(after.streaming)
+        sheet = load_workbook(io.BytesIO(body)).active
+        self.assertIn(600, [cell for row in sheet.iter_rows(values_only=True) for cell in row])
+
+
+class BackupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = get_user_model().objects.create_user('staff', password='secret', address='Kathmandu', is_staff=True)
+        for mobile, debit, credit in [('9800000001', 1000, 400), ('9800000002', 500, 0)]:
+            debtor = Debtor.objects.create(
+                created_by=cls.staff, name=f"Debtor {mobile}", address='Kathmandu', mobile=mobile,
+                initial_debt=debit, debt_date=date(2025, 1, 1), debt_purpose='loan',
+            )
+            Transaction.objects.create(debtor=debtor, tran_type='debit', tran_amount=debit, debit_amount=debit, current_debt=debit)
+            if credit:
+                Transaction.objects.create(
+                    debtor=debtor, tran_type='credit', tran_amount=credit, credit_amount=credit, current_debt=debit - credit,
+                )
+
+    def test_zip_holds_every_dump(self):
+        self.client.force_login(self.staff)
+        # One worker builds the dumps in this process, which sees the test data
+        with mock.patch.object(backup, 'default_workers', return_value=1):
+            response = self.client.get(reverse('export_full_backup'))
+            content = b''.join(response.streaming_content)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(content)) as backup_zip:
+            self.assertEqual(backup_zip.namelist(), [f"{name}.csv.gz" for name in backup.SHEETS])
+            members = {name: gzip.decompress(backup_zip.read(f"{name}.csv.gz")) for name in backup.SHEETS}
+        for name, csv_bytes in members.items():
+            self.assertEqual(csv_bytes, b''.join(dumps.dump(name)), name)
+        # The header and three transactions
+        self.assertEqual(members['transactions'].count(b'\n'), 4)
+
+
+class DebtorReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.creditor = get_user_model().objects.create_user('creditor', password='secret', address='Kathmandu')
+        cls.ram = Debtor.objects.create(
+            created_by=cls.creditor, name='Ram', address='Kathmandu', mobile='9800000001',
+            initial_debt=1000, debt_date=date(2025, 1, 1), debt_purpose='loan',
+        )
+        # No transactions: owes its total debt
+        cls.hari = Debtor.objects.create(
+            created_by=cls.creditor, name='Hari', address='Pokhara', mobile='9800000002',
+            initial_debt=250, total_debt=250, debt_date=date(2025, 2, 1), debt_purpose='shop',
+        )
+        cls.sita = Debtor.objects.create(
+            created_by=cls.creditor, name='Sita', address='Lalitpur', mobile='9800000003',
+            initial_debt=40, debt_date=date(2025, 3, 1), debt_purpose='school fees for the spring term',
+        )
+        stamp = timezone.make_aware(datetime(2025, 3, 1, 10, 30))
+        for debtor, debit, credit, medium in [
+            (cls.ram, 1000, 0, 'cash'), (cls.ram, 0, Decimal('0.10'), 'esewa'), (cls.ram, 0, Decimal('0.20'), 'cash'),
+            (cls.sita, 40, 0, 'cash'), (cls.sita, 0, 40, 'cash'),
+        ]:
+            debtor.refresh_from_db()
+            tran = Transaction.objects.create(
+                debtor=debtor, tran_type='credit' if credit else 'debit', tran_amount=debit or credit,
+                debit_amount=debit, credit_amount=credit, current_debt=debtor.current_debt + debit - credit,
+                tran_medium=medium, tran_desc='instalment' if credit else '',
+            )
+            Transaction.objects.filter(pk=tran.pk).update(tran_date=stamp)
+            stamp += timedelta(minutes=1)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        export_files = override_settings(EXPORT_CACHE_DIR=directory.name)
+        export_files.enable()
+        self.addCleanup(export_files.disable)
+        self.client.force_login(self.creditor)
+
+    def sheet(self, url):
+        return load_workbook(io.BytesIO(self.client.get(url).content)).active
+
+    def test_all_debtors_cells_and_widths(self):
+        sheet = self.sheet(reverse('all_debtors_xls'))
+        rows = [
+            ["Name", "Debtor_ID", "Mobile", "Starting Debt", "Current Debt", "Start Date", "Purpose", "Status"],
+            ['Hari', self.hari.debtor_id, '9800000002', 250, 250, datetime(2025, 2, 1), 'shop', 'Active'],
+            ['Ram', self.ram.debtor_id, '9800000001', 1000, 999.7, datetime(2025, 1, 1), 'loan', 'Active'],
+            ['Sita', self.sita.debtor_id, '9800000003', 40, 0, datetime(2025, 3, 1),
+             'school fees for the spring term', 'Recovered'],
+        ]
+        self.assertEqual([list(row) for row in sheet.iter_rows(values_only=True)], rows)
+        self.assertEqual(
+            [(cell.number_format, cell.alignment.horizontal) for cell in sheet[3][3:6]],
+            [('#,##0.00', 'center'), ('#,##0.00', 'center'), ('yyyy-mm-dd', 'center')],
+        )
+        self.assertTrue(sheet['A1'].font.bold)
+        # The widths of the old auto-fit: the longest value written, plus two, within 12..40
+        written = [[float(v) if isinstance(v, int) else v.date() if isinstance(v, datetime) else v for v in row]
+                   for row in rows]
+        self.assertEqual(
+            [sheet.column_dimensions[letter].width for letter in 'ABCDEFGH'],
+            [min(max(12, max(len(str(row[col])) for row in written) + 2), 40) for col in range(8)],
+        )
+
+    def test_debtor_transactions_cells_and_exact_totals(self):
+        sheet = self.sheet(f"{reverse('debtor_transactions_xls')}?debtor_id={self.ram.debtor_id}")
+        self.assertEqual([str(cells) for cells in sheet.merged_cells.ranges], ['A1:I1'])
+        tran_ids = list(self.ram.transactions.order_by('tran_date').values_list('tran_id', flat=True))
+        self.assertEqual([list(row) for row in sheet.iter_rows(values_only=True)], [
+            [f"Transactions for Ram ({self.ram.debtor_id})"] + [None] * 8,
+            [None] * 9,
+            ["Txn ID", "Date", "Type", "Debit", "Credit", "Txn Amount", "Current Debt", "Medium", "Description"],
+            # Dated as before: the stored (UTC) time
+            [tran_ids[0], '2025-03-01 04:45', 'Debit', 1000, 0, 1000, 1000, 'Cash', None],
+            [tran_ids[1], '2025-03-01 04:46', 'Credit', 0, 0.1, 0.1, 999.9, 'eSewa', 'instalment'],
+            [tran_ids[2], '2025-03-01 04:47', 'Credit', 0, 0.2, 0.2, 999.7, 'Cash', 'instalment'],
+            # 0.1 + 0.2 in floats would be 0.30000000000000004
+            [None, None, 'Totals:', 1000, 0.3, None, None, None, None],
+        ])
+        self.assertEqual(sheet['C7'].alignment.horizontal, 'right')
+        self.assertEqual([sheet.column_dimensions[letter].width for letter in 'ABCDEFGHI'], [14, 18, 10, 14, 14, 14, 16, 14, 40])
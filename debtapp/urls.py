@@ -20,6 +20,9 @@ urlpatterns = [
 #     ), name='logout'),
     
     path('dashboard/', views.dashboard, name='user_dashboard'),
+    path('dashboard/events/', views.dashboard_events, name='dashboard_events'),
+    path('dashboard/series/', views.dashboard_series, name='dashboard_series'),
+    path('dashboard/fragments/<slug:section>/', views.dashboard_fragment, name='dashboard_fragment'),
     path('redirect/', custom_redirect_view, name='custom_redirect'),
     path('admin-dashboard/', admin_dashboard, name='admin_dashboard'),
     path('logout/', views.log_out, name = 'logout'),
@@ -28,8 +31,11 @@ urlpatterns = [
     path('debtors/add/', views.add_debtor, name='add_debtor'),
     path('debtors-detail/<int:debtor_id>/', views.debtor_detail, name='debtor_detail'),
     path('debtors-edit/<int:debtor_id>/edit/', views.debtor_edit, name='debtor_edit'),
+    path('debtors-detail/<int:debtor_id>/plan/', views.payment_plan, name='payment_plan'),
     # path('debtors/<int:debtor_id>/transaction/', views.add_transaction, name='add_transaction'),  
     path('transaction-search/',views.transaction_search, name='transaction_search'),
+    path('transactions/search/', views.transaction_text_search, name='transaction_text_search'),
+    path('debtors/autocomplete/', views.debtor_autocomplete, name='debtor_autocomplete'),
     path('transaction/add/', views.add_transaction, name='add_transaction'),
     path('voucher/<int:pk>/', views.voucher_view, name='voucher_view'),
     path('delete-debtor/<int:id>/', views.delete_debtor, name="delete_debtor"),
@@ -39,6 +45,11 @@ urlpatterns = [
     path('reports/', views.reports, name='reports'),
     path("reports/summary-details/", views.summary_details, name="summary_details"),
     path("reports/export-debtors/", views.all_debtors_xls, name="all_debtors_xls"),
+    path("reports/aging/", views.aging_report, name="aging_report"),
+    path("reports/aging/export/", views.aging_report_xlsx, name="aging_report_xlsx"),
+    path("reports/installments/", views.installments_report, name="installments_report"),
+    path("reports/forecast/", views.forecast_report, name="forecast_report"),
+    path("reports/forecast/export/", views.forecast_report_xlsx, name="forecast_report_xlsx"),
     path("reports/debtors-transactions/", views.debtor_transactions_xls, name="debtor_transactions_xls"),
     
     # Password change URLs
@@ -85,6 +96,9 @@ urlpatterns = [
     path('export/users/', views.export_all_users_xlsx, name='export_all_users_xlsx'),
     path('export/debtors/', views.export_all_debtors_xlsx, name='export_all_debtors_xlsx'),
     path('export/transactions/', views.export_all_transactions_xlsx, name='export_all_transactions_xlsx'),
+    path('export/backup.zip', views.export_full_backup, name='export_full_backup'),
+    path('export/<slug:name>.csv', views.export_dump_csv, name='export_dump_csv'),
+    path('export/<slug:name>.csv.gz', views.export_dump_csv, {'compress': True}, name='export_dump_csv_gz'),
     path('export/debtor-transactions/', views.export_debtor_transactions_xlsx, name='export_debtor_transactions_xlsx'),
     path('terms-condition/', views.terms_condition, name='terms_condition'),
     path('user-manual/', views.user_manual, name='user_manual'),
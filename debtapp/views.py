@@ -1,6 +1,12 @@
 # =========================
 # Standard Library Imports
 # =========================
+import asyncio
+import json
+from collections import Counter
+from itertools import chain
+from operator import attrgetter
+from time import perf_counter
 from datetime import timedelta, date, datetime
 from io import BytesIO
 from decimal import Decimal
@@ -21,17 +27,24 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import transaction as db_transaction
 from django.db import transaction as db_transaction
 from django.db.models import Sum
-from django.db.models import Count, Sum, F, Value, Q
+from django.db.models import Count, Sum, F, Value, Q, Max
 from django.db.models import OuterRef, Subquery, DecimalField
 from django.db.models.functions import Coalesce
-from django.http import HttpResponse, HttpResponseBadRequest
-from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponse, HttpResponseBadRequest, StreamingHttpResponse, Http404, JsonResponse
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.utils.html import strip_tags
 from django.views import View
 from django.views.decorators.cache import never_cache
@@ -53,9 +66,12 @@ from django.core.mail import EmailMultiAlternatives
 # =========================
 # Local App Imports
 # =========================
-from .forms import UserRegisterForm, TransactionSearchForm, DebtorForm, TransactionForm
-from .models import Debtor, Transaction, CustomUser
+from .forms import UserRegisterForm, TransactionSearchForm, DebtorForm, TransactionForm, InterestTermsForm, PaymentPlanForm
+from .models import Debtor, Transaction, CustomUser, InterestTerms, Installment, PaymentPlan, TransactionArchive
 from .models import Debtor, Transaction
+from .idempotency import form_key, idempotent, succeeded
+from .routers import use_replica, using_shard
+from . import aging, archive, audit, backup, balances, dumps, export_cache, forecast, ledger, live, plans, rollups, search, sharding, xlsx
 
 # =========================
 # Constants / Helpers
@@ -63,6 +79,35 @@ from .models import Debtor, Transaction
 ZERO = Value(0, output_field=DecimalField(max_digits=12, decimal_places=2))
 
 
+async def _alist(queryset):
+    """Evaluate a queryset from async code."""
+    return [obj async for obj in queryset]
+
+
+async def _arender(request, template_name, context):
+    """Render from an async view; every queryset in `context` must already be evaluated."""
+    # Templates read request.user synchronously, so hand them the already loaded user.
+    request.user = await request.auser()
+    return render(request, template_name, context)
+
+
+def _as_of_date(request):
+    """Report date from ?as_of=YYYY-MM-DD, today by default; None if malformed."""
+    value = request.GET.get('as_of')
+    if not value:
+        return timezone.localdate()
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def _as_of_params(request):
+    """Cache parameters of a report taking ?as_of=; None if the date is malformed."""
+    as_of = _as_of_date(request)
+    return None if as_of is None else [as_of]
+
+
 # =========================
 # Profile View
 # =========================
@@ -126,44 +171,147 @@ def login_view(request):
 # =========================
 @login_required
 @never_cache
-def dashboard(request):
-    base = Debtor.objects.filter(created_by=request.user)
-
-    # If FK uses related_name='transactions', this is correct. Otherwise use 'transaction__...'
-    annotated = base.annotate(
-        total_debit=Coalesce(Sum('transactions__debit_amount'), ZERO),
-        total_credit=Coalesce(Sum('transactions__credit_amount'), ZERO),
-        remaining_debt=F('total_debit') - F('total_credit'),  # <-- not 'current_debt'
-    )
+async def dashboard(request):
+    user = await request.auser()
 
-    active_debtors = annotated.filter(debtor_status='active', is_delete=False)
-    recovered_debtors = annotated.filter(debtor_status='recovered', is_delete=False)
-    deleted_debtors = annotated.filter(is_delete=True)
+    # Only the stat cards are rendered here; the debtor tables are fragments
+    # loaded by the page (see dashboard_fragment), so this stays cheap for big books.
+    context, last_recount = await asyncio.gather(live.figures(user.pk), live.last_recount(user.pk))
+    # Live updates start after the last transaction and debtor change included above
+    context['events_after'] = f"{context['last_tran_id']}-{last_recount or 0}"
+    return await _arender(request, 'dashboard.html', context)
 
-    totals = Transaction.objects.filter(debtor__created_by=request.user).aggregate(
-        total_debit_amount=Coalesce(Sum('debit_amount'), ZERO),
-        total_credit_amount=Coalesce(Sum('credit_amount'), ZERO),
-    )
-    total_debit_amount = totals['total_debit_amount']
-    total_credit_amount = totals['total_credit_amount']
-    total_current_debt = total_debit_amount - total_credit_amount
 
-    context = {
-        'debtors': annotated,
-        'active_debtors': active_debtors,
-        'recovered_debtors': recovered_debtors,
-        'deleted_debtors': deleted_debtors,
-
-        'total_debtors_no': base.count(),
-        'active_debtors_no': base.filter(debtor_status='active', is_delete=False).count(),
-        'recovered_debtors_no': base.filter(debtor_status='recovered', is_delete=False).count(),
-        'deleted_debtors_no': base.filter(is_delete=True).count(),
-
-        'total_debt_amount': total_debit_amount,
-        'total_current_debt': total_current_debt,
-        'total_recovered_debt': total_credit_amount,
-    }
-    return render(request, 'dashboard.html', context)
+# =========================
+# Dashboard Fragments (lazy-loaded tables)
+# =========================
+DASHBOARD_FRAGMENTS = {
+    # section: (template, debtor filter)
+    'active': ('dashboard_info/debtor_table.html', Q(debtor_status='active', is_delete=False)),
+    'recovered': ('dashboard_info/debtor_table.html', Q(debtor_status='recovered', is_delete=False)),
+    'deleted': ('dashboard_info/debtor_table.html', Q(is_delete=True)),
+    'amounts': ('dashboard_info/debt_amount_table.html', Q()),
+}
+
+
+@login_required
+async def dashboard_fragment(request, section):
+    if section not in DASHBOARD_FRAGMENTS:
+        raise Http404("Unknown dashboard section")
+    user = await request.auser()
+
+    # The ledger version changes on every write, so it keys both the browser's
+    # copy (ETag) and ours (cache); nothing needs explicit invalidation.
+    version = await ledger.aget_version(user.pk)
+    etag = f'"{section}-{user.pk}-{version}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    cache_key = f"dashboard-fragment:{user.pk}:{section}:{version}"
+    html = await cache.aget(cache_key)
+    if html is None:
+        template_name, debtor_filter = DASHBOARD_FRAGMENTS[section]
+        debtors = await _alist(
+            Debtor.objects
+            .filter(debtor_filter, created_by=user)
+            .annotate(
+                # archived debtors have no transactions left, only their archive's totals
+                total_debit=Coalesce(Sum('transactions__debit_amount'), 'transaction_archive__total_debit', ZERO),
+                total_credit=Coalesce(Sum('transactions__credit_amount'), 'transaction_archive__total_credit', ZERO),
+                remaining_debt=F('total_debit') - F('total_credit'),  # <-- not 'current_debt'
+            )
+            .order_by('debtor_id')
+        )
+        html = render_to_string(template_name, {'debtors': debtors, 'section': section})
+        await cache.aset(cache_key, html, settings.DASHBOARD_FRAGMENT_CACHE_SECONDS)
+
+    response = HttpResponse(html)
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+# =========================
+# Dashboard Series
+# =========================
+@login_required
+@never_cache
+async def dashboard_series(request):
+    """Monthly debits, credits, new debtors and recoveries for the dashboard chart."""
+    try:
+        months = min(int(request.GET.get('months', rollups.SERIES_MONTHS)), rollups.SERIES_MAX_MONTHS)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid months")
+    user = await request.auser()
+    data = await rollups.series(user, months=max(months, 1))
+    return JsonResponse(data, encoder=DjangoJSONEncoder)
+
+
+# =========================
+# Dashboard Live Updates (Server-Sent Events)
+# =========================
+@login_required
+@never_cache
+async def dashboard_events(request):
+    if not isinstance(request, ASGIRequest):
+        # A stream would hold a WSGI worker for its whole lifetime.
+        # 204 tells EventSource to stop reconnecting.
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    # Event ids are "<last transaction id>-<last audit event id>" the page has seen
+    after = request.headers.get('Last-Event-ID') or request.GET.get('after')
+    try:
+        last_id, last_recount = (int(part) for part in after.split('-')) if after is not None else (None, None)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid event id")
+    if last_id is None:
+        latest = await Transaction.objects.filter(debtor__created_by=user).aaggregate(last=Max('id'))
+        last_id = latest['last'] or 0
+        last_recount = await live.last_recount(user.pk) or 0
+
+    poll = settings.DASHBOARD_EVENTS_POLL_SECONDS
+    lifetime = settings.DASHBOARD_EVENTS_STREAM_SECONDS
+
+    async def event_stream():
+        nonlocal last_id, last_recount
+        seen = await live.seen_ids(user.pk, last_id)
+        # The stream ends after `lifetime` seconds; EventSource reconnects with Last-Event-ID.
+        yield f"retry: {int(poll * 1000)}\n\n"
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + lifetime
+        idle = 0
+        while loop.time() < deadline:
+            rows = await live.new_transactions(user.pk, last_id, seen)
+            if rows:
+                delta = live.empty_delta()
+                for row in rows:
+                    live.apply_transaction(delta, row)
+                    seen.add(row['id'])
+                last_id = max(last_id, rows[-1]['id'])
+                seen = {pk for pk in seen if pk > last_id - live.LOOKBACK_IDS}
+                yield f"id: {last_id}-{last_recount}\nevent: delta\ndata: {json.dumps(delta, cls=DjangoJSONEncoder)}\n\n"
+                idle = 0
+            recount = await live.last_recount(user.pk, last_recount)
+            if recount is not None:
+                # Only the transactions already passed on, so later deltas still add up
+                counted = Q(id__lte=last_id - live.LOOKBACK_IDS) | Q(id__in=seen)
+                totals = await live.figures(user.pk, counted)
+                del totals['last_tran_id']
+                last_recount = recount
+                yield f"id: {last_id}-{last_recount}\nevent: totals\ndata: {json.dumps(totals, cls=DjangoJSONEncoder)}\n\n"
+                idle = 0
+            if not rows and recount is None:
+                idle += poll
+                if idle >= 15:
+                    yield ": keep-alive\n\n"
+                    idle = 0
+            await asyncio.sleep(poll)
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['X-Accel-Buffering'] = 'no'  # don't let nginx buffer the stream
+    return response
 
 
 # =========================
@@ -200,6 +348,7 @@ def add_debtor(request):
                 credit_amount=0,
                 current_debt=debtor.initial_debt
             )
+            audit.record('debtor_created', actor=request.user, debtor=debtor, initial_debt=debtor.initial_debt)
 
             # send email
             # subject = 'Add new debtor'
@@ -235,9 +384,25 @@ def add_debtor(request):
 # =========================
 @login_required
 @never_cache
-def debtor_list(request):
-    debtors = Debtor.objects.filter(created_by=request.user, is_delete=False)
-    return render(request, 'debtor_list.html', {'debtors': debtors})
+async def debtor_list(request):
+    user = await request.auser()
+    # Same value as Debtor.current_debt, fetched in the list query instead of one query per row
+    latest_current_debt = (
+        Transaction.objects
+        .filter(debtor=OuterRef('pk'))
+        .order_by('-tran_date')
+        .values('current_debt')[:1]
+    )
+    debtors = await _alist(
+        Debtor.objects
+        .filter(created_by=user, is_delete=False)
+        .annotate(balance=Coalesce(
+            Subquery(latest_current_debt, output_field=DecimalField(max_digits=12, decimal_places=2)),
+            F('transaction_archive__balance'),
+            F('total_debt'),
+        ))
+    )
+    return await _arender(request, 'debtor_list.html', {'debtors': debtors})
 
 
 # =========================
@@ -250,12 +415,16 @@ def debtor_edit(request, debtor_id):
 
     # reverse name: use .transactions if you set related_name, else .transaction_set
     txs = debtor.transactions.all()  # or debtor.transactions.all()
-    has_activity = txs.count() > 1   # >1 means beyond the opening row
+    has_activity = txs.count() > 1 or archive.is_archived(debtor.pk)   # >1 means beyond the opening row
+
+    terms = InterestTerms.objects.filter(debtor=debtor).first() or InterestTerms(debtor=debtor)
 
     if request.method == 'POST':
         form = DebtorForm(request.POST, request.FILES, instance=debtor)
-        if form.is_valid():
+        interest_form = InterestTermsForm(request.POST, instance=terms, prefix='interest')
+        if form.is_valid() and interest_form.is_valid():
             old_initial = debtor.initial_debt
+            changed = {**audit.changes(form), **audit.changes(interest_form, prefix='interest_')}
             obj = form.save(commit=False)
 
             if has_activity:
@@ -276,15 +445,29 @@ def debtor_edit(request, debtor_id):
                     opening.save(update_fields=[
                         'tran_amount', 'debit_amount', 'credit_amount', 'current_debt'
                     ])
+                    if obj.initial_debt != old_initial:
+                        audit.record(
+                            'opening_reset', actor=request.user, debtor=obj,
+                            old=old_initial, new=obj.initial_debt, tran_id=opening.tran_id,
+                        )
+
+            # Only store terms once interest is actually set up
+            if terms.pk or interest_form.cleaned_data['annual_rate'] > 0:
+                interest_form.save()
 
+            if has_activity:
+                changed.pop('initial_debt', None)
+            if changed:
+                audit.record('debtor_edited', actor=request.user, debtor=obj, changes=changed)
             messages.success(request, "Debtor updated.")
             return redirect('debtor_list')
     else:
         form = DebtorForm(instance=debtor)
+        interest_form = InterestTermsForm(instance=terms, prefix='interest')
         if has_activity:
             form.fields['initial_debt'].disabled = True
 
-    return render(request, 'debtor_edit.html', {'form': form, 'debtor': debtor})
+    return render(request, 'debtor_edit.html', {'form': form, 'interest_form': interest_form, 'debtor': debtor})
 
 
 # =========================
@@ -293,8 +476,6 @@ def debtor_edit(request, debtor_id):
 @login_required
 @never_cache
 def transaction_search(request):
-    debtor_qs = Debtor.objects.filter(is_delete=False, created_by=request.user)
-
     if request.method == 'POST':
         form = TransactionSearchForm(request.POST)
         if form.is_valid():
@@ -304,7 +485,53 @@ def transaction_search(request):
     else:
         form = TransactionSearchForm()
 
-    return render(request, 'transaction_search.html', {'form': form, 'debtor': debtor_qs})
+    return render(request, 'transaction_search.html', {'form': form})
+
+
+# =========================
+# Transaction Full-Text Search
+# =========================
+@login_required
+@never_cache
+def transaction_text_search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    took_ms = None
+    if query:
+        started = perf_counter()
+        paginator = Paginator(search.transaction_search(request.user, query), search.SEARCH_PAGE_SIZE)
+        page_obj = paginator.get_page(request.GET.get('page'))
+        search.highlight_transactions(page_obj.object_list, query)
+        took_ms = round((perf_counter() - started) * 1000, 1)
+
+    return render(request, 'transaction_text_search.html', {
+        'query': query,
+        'page_obj': page_obj,
+        'took_ms': took_ms,
+    })
+
+
+# =========================
+# Debtor Autocomplete (JSON)
+# =========================
+@login_required
+@never_cache
+async def debtor_autocomplete(request):
+    term = request.GET.get('q', '').strip()
+    try:
+        limit = min(int(request.GET.get('limit', search.AUTOCOMPLETE_LIMIT)), search.AUTOCOMPLETE_MAX_LIMIT)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid limit")
+    if not term:
+        return JsonResponse({'results': []})
+
+    user = await request.auser()
+    started = perf_counter()
+    results = await _alist(search.debtor_autocomplete(
+        user, term, limit=max(limit, 1), include_deleted=request.GET.get('include_deleted') == '1',
+    ))
+    took_ms = round((perf_counter() - started) * 1000, 1)
+    return JsonResponse({'results': results, 'took_ms': took_ms})
 
 
 # =========================
@@ -312,7 +539,8 @@ def transaction_search(request):
 # =========================
 @login_required
 @never_cache
-@db_transaction.atomic
+@idempotent('add_transaction')
+@sharding.atomic
 def add_transaction(request):
     debtor_id = request.GET.get('debtor_id')
     tran_type = request.GET.get('tran_type')
@@ -343,11 +571,12 @@ def add_transaction(request):
                 # re-render preserving query params
                 return render(
                     request,
-                    'add_transaction',
+                    'add_transaction.html',
                     {
                         'form': form,
                         'debtor_id': debtor_id,
-                        'tran_type': tran_type
+                        'tran_type': tran_type,
+                        'idempotency_key': form_key(request),
                     }
                 )
 
@@ -368,7 +597,8 @@ def add_transaction(request):
                         {
                             'form': form,
                             'debtor_id': debtor_id,
-                            'tran_type': tran_type
+                            'tran_type': tran_type,
+                            'idempotency_key': form_key(request),
                         }
                     )
                 current_after = current_before - tran_amount
@@ -378,6 +608,22 @@ def add_transaction(request):
                     # is_debt_settle = True  # Debt is settled when current debt is zero
                     debtor.debtor_status = 'recovered'
 
+            # The new row continues the archived ledger, so bring it back first
+            try:
+                archive.restore(debtor)
+            except ValidationError as exc:
+                messages.error(request, exc.messages[0])
+                return render(
+                    request,
+                    'add_transaction.html',
+                    {
+                        'form': form,
+                        'debtor_id': debtor_id,
+                        'tran_type': tran_type,
+                        'idempotency_key': form_key(request),
+                    }
+                )
+
             # Create the transaction record
             Transaction.objects.create(
                 debtor=debtor,
@@ -394,6 +640,7 @@ def add_transaction(request):
             )
 
             debtor.save(update_fields=['debtor_status'])
+            succeeded(request)
             messages.success(request, f"{tran_type.title()} transaction added successfully.")
             return redirect('debtor_list')
     else:
@@ -406,19 +653,86 @@ def add_transaction(request):
             'form': form,
             'debtor_id': debtor_id,
             'tran_type': tran_type,
+            'idempotency_key': form_key(request),
         }
     )
 
 
+# =========================
+# Payment Plan
+# =========================
+@login_required
+@never_cache
+@idempotent('payment_plan')
+def payment_plan(request, debtor_id):
+    debtor = get_object_or_404(Debtor, id=debtor_id, created_by=request.user, is_delete=False)
+    plan = PaymentPlan.objects.filter(debtor=debtor, status=plans.ACTIVE).first()
+
+    if request.method == 'POST' and plan and 'cancel' in request.POST:
+        plans.cancel(plan)
+        succeeded(request)
+        messages.success(request, "Payment plan cancelled.")
+        return redirect('debtor_detail', debtor_id=debtor.id)
+
+    if request.method == 'POST':
+        form = PaymentPlanForm(request.POST, instance=plan)
+        if plan:
+            # rescheduling spreads what is left of the agreed total
+            form.fields['total_amount'].disabled = True
+        if form.is_valid():
+            data = form.cleaned_data
+            if plan:
+                plans.reschedule([plan], data['start_date'], data['installment_count'], data['frequency'])
+                messages.success(request, "Payment plan rescheduled.")
+            else:
+                plans.create_plans([dict(data, debtor=debtor)])
+                messages.success(request, "Payment plan created.")
+            succeeded(request)
+            return redirect('debtor_detail', debtor_id=debtor.id)
+    elif plan:
+        form = PaymentPlanForm(instance=plan)
+        form.fields['total_amount'].disabled = True
+    else:
+        form = PaymentPlanForm(initial={
+            'total_amount': debtor.current_debt,
+            'frequency': 'monthly',
+            'start_date': timezone.localdate() + timedelta(days=30),
+        })
+
+    installments = plan.installments.order_by('sequence') if plan else []
+    return render(request, 'payment_plan.html', {
+        'form': form, 'debtor': debtor, 'plan': plan, 'installments': installments,
+        'idempotency_key': form_key(request),
+    })
+
+
 # =========================
 # Debtor Detail
 # =========================
 @login_required
 @never_cache
-def debtor_detail(request, debtor_id):
-    debtor = get_object_or_404(Debtor, id=debtor_id, created_by=request.user)
-    transactions = Transaction.objects.filter(debtor=debtor)
-    return render(request, 'debtor_detail.html', {'debtor': debtor, 'transactions': transactions})
+async def debtor_detail(request, debtor_id):
+    user = await request.auser()
+    debtor = await aget_object_or_404(Debtor, id=debtor_id, created_by=user)
+    transactions, current_debt, installments, history = await asyncio.gather(
+        _alist(Transaction.objects.filter(debtor=debtor)),
+        debtor.transactions.order_by('-tran_date').values_list('current_debt', flat=True).afirst(),
+        _alist(Installment.objects.filter(debtor=debtor, plan__status=plans.ACTIVE).order_by('due_date', 'sequence')),
+        _alist(audit.for_debtor(debtor.pk)[:audit.HISTORY_LIMIT]),
+    )
+    if not transactions:
+        transactions = await archive.aarchived_transactions(debtor.pk)
+        if transactions:
+            current_debt = transactions[-1].current_debt
+    context = {
+        'debtor': debtor,
+        'transactions': transactions,
+        'current_debt': debtor.total_debt if current_debt is None else current_debt,
+        'installments': installments,
+        'history': history,
+        'today': timezone.localdate(),
+    }
+    return await _arender(request, 'debtor_detail.html', context)
 
 
 # =========================
@@ -448,6 +762,7 @@ def delete_debtor(request, id):
         debtor.is_delete = True
         debtor.delete_date = timezone.now()
         debtor.save(update_fields=['is_delete', 'delete_date'])
+        audit.record('debtor_deleted', actor=request.user, debtor=debtor)
         messages.success(request, "1 Debtor has been successfully deleted.")
     else:
         messages.error(request, "Debt is still pending. Cannot delete debtor.")
@@ -466,7 +781,10 @@ def recycle_debtor(request):
     expired_debtors = Debtor.objects.filter(delete_date__lt=threshold)
 
     if expired_debtors.exists():
+        expired = list(expired_debtors.only('id', 'debtor_id', 'name'))
         expired_debtors.delete()
+        for debtor in expired:
+            audit.record('debtor_purged', debtor=debtor, name=debtor.name)
 
     return render(request, 'recycle_debtor.html', {'debtors': debtors})
 
@@ -480,6 +798,7 @@ def restore_debtor(request, id):
     debtor_to_restore = Debtor.objects.get(id=id)
     debtor_to_restore.is_delete = False
     debtor_to_restore.save()
+    audit.record('debtor_restored', actor=request.user, debtor=debtor_to_restore)
     messages.success(request, "1 Debtor restored successfully.")
     return redirect('debtor_list')
 
@@ -496,6 +815,8 @@ def hard_delete_debtor(request, id):
 
     debtor = get_object_or_404(Debtor, id=id, created_by=request.user)
     if debtor.debtor_status == 'recovered':
+        # Copy what identifies the debtor before delete() clears the primary key
+        audit.record('debtor_hard_deleted', actor=request.user, debtor=debtor, name=debtor.name, mobile=debtor.mobile)
         debtor.delete()
         messages.success(request, "Debtor permanently deleted.")
     else:
@@ -507,14 +828,20 @@ def hard_delete_debtor(request, id):
 # Reports (Page Shell)
 # =========================
 @login_required
-def reports(request):
-    return render(request, 'reports.html')
+@use_replica
+async def reports(request):
+    return await _arender(request, 'reports.html', {})
 
 
 # =========================
 # Summary Report (User)
 # =========================
+@use_replica
+@export_cache.cached('summary_details', export_cache.CREDITOR, params=_as_of_params)
 def summary_details(request):
+    as_of = _as_of_date(request)
+    if as_of is None:
+        return HttpResponseBadRequest("Invalid as_of date")
     qs = Debtor.objects.filter(created_by=request.user)
 
     total_debtors = qs.count()
@@ -522,14 +849,11 @@ def summary_details(request):
     recovered_debtors = qs.filter(debtor_status='recovered').count()
     deleted_debtors = qs.filter(is_delete=True).count()
 
-    # calculating totals
-    totals = Transaction.objects.filter(debtor__created_by=request.user).aggregate(
-        total_debit_amount=Sum('debit_amount'),
-        total_credit_amount=Sum('credit_amount')
-    )
-    total_debit_amount = totals['total_debit_amount'] or 0
-    total_credit_amount = totals['total_credit_amount'] or 0
-    total_current_debt = total_debit_amount - total_credit_amount
+    # calculating totals (from the daily balance snapshots)
+    totals = balances.totals_as_of(as_of, creditor=request.user)
+    total_debit_amount = totals['total_debit']
+    total_credit_amount = totals['total_credit']
+    total_current_debt = totals['balance']
     total_recovered_debt = total_credit_amount
 
     # --- Create workbook ---
@@ -546,8 +870,8 @@ def summary_details(request):
     thin = Side(border_style="thin", color="CCCCCC")
     box = Border(left=thin, right=thin, top=thin, bottom=thin)
 
-    # Title
-    title = f"Debtors Summary ({timezone.localtime().strftime('%Y-%m-%d, %H:%M')})"
+    # Title (dated, not timed: the file is cached until the ledger changes)
+    title = f"Debtors Summary (amounts as of {as_of:%Y-%m-%d})"
     ws.merge_cells("A1:B1")
     ws["A1"] = title
     ws["A1"].font = title_font
@@ -595,7 +919,7 @@ def summary_details(request):
     ws.column_dimensions[get_column_letter(2)].width = 22  # Value
 
     # --- Prepare HTTP response ---
-    filename = f"dashboard-summary-{timezone.localtime().strftime('%Y%m%d-%H%M')}.xlsx"
+    filename = f"dashboard-summary-{as_of:%Y%m%d}.xlsx"
     response = HttpResponse(
         content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
@@ -608,6 +932,8 @@ def summary_details(request):
 # =========================
 # All Debtors Report (User)
 # =========================
+@use_replica
+@export_cache.cached('all_debtors_xls', export_cache.CREDITOR)
 def all_debtors_xls(request):
     # Annotate each debtor with the current_debt from the most recent transaction (if any)
     latest_current_debt = (
@@ -617,79 +943,48 @@ def all_debtors_xls(request):
         .values('current_debt')[:1]
     )
 
+    status_labels = dict(Debtor.STATUS_CHOICES)
     debtors = (
         Debtor.objects
         .filter(created_by=request.user)  # add .filter(is_delete=False) if you want to exclude deleted
-        .annotate(current_debt_calc=Subquery(
-            latest_current_debt,
-            output_field=DecimalField(max_digits=12, decimal_places=2)
+        .annotate(current_debt_calc=Coalesce(
+            Subquery(latest_current_debt, output_field=DecimalField(max_digits=12, decimal_places=2)),
+            F('transaction_archive__balance'),
+            F('total_debt'),
         ))
         .order_by('name')
+        .values_list(
+            'name', 'debtor_id', 'mobile', 'initial_debt', 'current_debt_calc',
+            'debt_date', 'debt_purpose', 'debtor_status',
+        )
     )
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Debtors"
-
-    # Styling
-    header_font = Font(bold=True)
-    center = Alignment(horizontal="center", vertical="center")
-    left = Alignment(horizontal="left", vertical="center")
-    fill = PatternFill("solid", fgColor="E8F4FF")
-    thin = Side(border_style="thin", color="CCCCCC")
-    box = Border(left=thin, right=thin, top=thin, bottom=thin)
+    # Write-only: rows go straight to the file, styled by name (see debtapp.xlsx)
+    wb = xlsx.ReportWorkbook()
+    ws = wb.create_sheet("Debtors")
 
     headers = ["Name", "Debtor_ID", "Mobile", "Starting Debt", "Current Debt", "Start Date", "Purpose", "Status"]
-
-    # Header row
-    for col_idx, title in enumerate(headers, start=1):
-        cell = ws.cell(row=1, column=col_idx, value=title)
-        cell.font = header_font
-        cell.alignment = center
-        cell.fill = fill
-        cell.border = box
-
-    # Data rows
-    row = 2
-    for d in debtors:
-        current_debt = d.current_debt_calc if d.current_debt_calc is not None else d.total_debt
-
-        ws.cell(row=row, column=1, value=d.name).alignment = left
-        ws.cell(row=row, column=2, value=d.debtor_id).alignment = center
-        ws.cell(row=row, column=3, value=d.mobile).alignment = center
-
-        c4 = ws.cell(row=row, column=4, value=float(d.initial_debt))
-        c5 = ws.cell(row=row, column=5, value=float(current_debt))
-        c4.number_format = '#,##0.00'
-        c5.number_format = '#,##0.00'
-        c4.alignment = center
-        c5.alignment = center
-
-        c6 = ws.cell(row=row, column=6, value=d.debt_date)  # DateField -> Excel date
-        c6.number_format = 'yyyy-mm-dd'
-        c6.alignment = center
-
-        ws.cell(row=row, column=7, value=d.debt_purpose).alignment = left
-        ws.cell(row=row, column=8, value=d.get_debtor_status_display()).alignment = center
-
-        # Borders
-        for col in range(1, len(headers) + 1):
-            ws.cell(row=row, column=col).border = box
-
-        row += 1
-
-    # Column widths (simple auto-fit heuristic)
-    for col in range(1, len(headers) + 1):
-        letter = get_column_letter(col)
-        max_len = 0
-        for r in range(1, row):
-            val = ws.cell(row=r, column=col).value
-            max_len = max(max_len, len(str(val)) if val is not None else 0)
-        ws.column_dimensions[letter].width = min(max(12, max_len + 2), 40)
-
-    # Response
-    ts = timezone.localtime().strftime('%Y%m%d-%H%M')
-    filename = f"debtors-detailed-{ts}.xlsx"
+    styles = ['report text', 'report center', 'report center', 'report money', 'report money',
+              'report date', 'report text', 'report center']
+
+    def rows():
+        for name, debtor_id, mobile, initial_debt, current_debt, debt_date, purpose, status in debtors.iterator(chunk_size=2000):
+            yield (name, debtor_id, mobile, float(initial_debt), float(current_debt), debt_date,
+                   purpose, status_labels.get(status, status))
+
+    # The widths must be set before the first row: a first read measures
+    # them, a second streams the rows, so no more than a chunk is in memory
+    widths = xlsx.ColumnWidths(headers)
+    for values in rows():
+        widths.add(values)
+    widths.apply(ws)
+
+    ws.append(wb.row(ws, headers, ['report header'] * len(headers)))
+    for values in rows():
+        ws.append(wb.row(ws, values, styles))
+
+    # Response (no date/time in filename: the file is cached until the ledger changes)
+    filename = "debtors-detailed.xlsx"
     response = HttpResponse(
         content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
@@ -709,105 +1004,237 @@ def debtor_transactions_xls(request):
 
     debtor = get_object_or_404(Debtor, debtor_id=debtor_id, created_by=request.user)
 
-    txns = (
-        Transaction.objects
-        .filter(debtor=debtor)
-        .select_related("recorded_by")
-        .order_by("tran_date", "id")
+    # Streamed in chunks; an archived ledger (compressed in one row) is read at once
+    txns = Transaction.objects.filter(debtor=debtor).order_by('tran_date', 'id')
+    txns = txns.iterator(chunk_size=2000) if txns.exists() else archive.transactions_for(debtor)
+    # Totals from the database (archived debtors: from their archive), not summed in floats
+    totals = (
+        Debtor.objects.filter(pk=debtor.pk)
+        .annotate(
+            total_debit=Coalesce(Sum('transactions__debit_amount'), 'transaction_archive__total_debit', ZERO),
+            total_credit=Coalesce(Sum('transactions__credit_amount'), 'transaction_archive__total_credit', ZERO),
+        )
+        .values('total_debit', 'total_credit')
+        .get()
     )
 
-    # Workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = f"{debtor.debtor_id}"
+    # Write-only workbook, styled by name (see debtapp.xlsx)
+    wb = xlsx.ReportWorkbook()
+    ws = wb.create_sheet(f"{debtor.debtor_id}")
 
-    # Styles
-    header_font = Font(bold=True)
-    title_font = Font(size=14, bold=True)
-    center = Alignment(horizontal="center", vertical="center")
-    left = Alignment(horizontal="left", vertical="center")
-    fill = PatternFill("solid", fgColor="E8F4FF")
-    thin = Side(border_style="thin", color="CCCCCC")
-    box = Border(left=thin, right=thin, top=thin, bottom=thin)
+    # Column widths (fixed, so they can be set before the rows)
+    widths = [14, 18, 10, 14, 14, 14, 16, 14, 40]
+    for i, w in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = w
 
     # Title (no timestamp)
-    ws.merge_cells("A1:I1")
-    ws["A1"] = f"Transactions for {debtor.name} ({debtor.debtor_id})"
-    ws["A1"].font = title_font
-    ws["A1"].alignment = center
+    ws.merged_cells.add("A1:I1")
+    ws.append([wb.cell(ws, f"Transactions for {debtor.name} ({debtor.debtor_id})", 'report title')])
+    ws.append([])
 
     # Headers
     headers = [
         "Txn ID", "Date", "Type", "Debit", "Credit",
         "Txn Amount", "Current Debt", "Medium", "Description"
     ]
-    for col, h in enumerate(headers, start=1):
-        c = ws.cell(row=3, column=col, value=h)
-        c.font = header_font
-        c.alignment = center
-        c.fill = fill
-        c.border = box
+    ws.append(wb.row(ws, headers, ['report header'] * len(headers)))
 
     # Data rows
-    row = 4
-    total_debit = 0.0
-    total_credit = 0.0
-
+    styles = ['report center'] * 3 + ['report money'] * 4 + ['report center', 'report text']
     for t in txns:
-        ws.cell(row=row, column=1, value=t.tran_id).alignment = center
+        ws.append(wb.row(ws, [
+            t.tran_id,
+            # Write date as a plain string -> avoids timezone/aware datetime issues in Excel
+            t.tran_date.strftime("%Y-%m-%d %H:%M"),
+            t.tran_type.capitalize(),
+            float(t.debit_amount),
+            float(t.credit_amount),
+            float(t.tran_amount),
+            float(t.current_debt),
+            t.get_tran_medium_display() if hasattr(t, "get_tran_medium_display") else t.tran_medium,
+            t.tran_desc,
+        ], styles))
 
-        # Write date as a plain string -> avoids timezone/aware datetime issues in Excel
-        date_str = t.tran_date.strftime("%Y-%m-%d %H:%M")
-        ws.cell(row=row, column=2, value=date_str).alignment = center
+    # Totals row
+    ws.append(wb.row(
+        ws,
+        [None, None, "Totals:", float(totals['total_debit']), float(totals['total_credit']), None, None, None, None],
+        ['report cell', 'report cell', 'report total label', 'report money', 'report money'] + ['report cell'] * 4,
+    ))
 
-        ws.cell(row=row, column=3, value=t.tran_type.capitalize()).alignment = center
+    # Response (no date/time in filename)
+    filename = f"transactions-{debtor.debtor_id}.xlsx"
+    response = HttpResponse(
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    wb.save(response)
+    return response
 
-        c_debit = ws.cell(row=row, column=4, value=float(t.debit_amount))
-        c_credit = ws.cell(row=row, column=5, value=float(t.credit_amount))
-        c_debit.number_format = "#,##0.00"; c_debit.alignment = center
-        c_credit.number_format = "#,##0.00"; c_credit.alignment = center
 
-        ws.cell(row=row, column=6, value=float(t.tran_amount)).number_format = "#,##0.00"
-        ws.cell(row=row, column=6).alignment = center
+# =========================
+# Aging Report (User)
+# =========================
+@login_required
+@never_cache
+@use_replica
+def aging_report(request):
+    as_of = _as_of_date(request)
+    if as_of is None:
+        return HttpResponseBadRequest("Invalid as_of date")
 
-        ws.cell(row=row, column=7, value=float(t.current_debt)).number_format = "#,##0.00"
-        ws.cell(row=row, column=7).alignment = center
+    started = perf_counter()
+    rows, totals = aging.aging_report(request.user, as_of)
+    took_ms = round((perf_counter() - started) * 1000, 1)
 
-        ws.cell(
-            row=row,
-            column=8,
-            value=(t.get_tran_medium_display() if hasattr(t, "get_tran_medium_display") else t.tran_medium)
-        ).alignment = center
+    return render(request, 'aging_report.html', {
+        'rows': rows,
+        'totals': totals,
+        'as_of': as_of,
+        'took_ms': took_ms,
+    })
 
-        ws.cell(row=row, column=9, value=t.tran_desc).alignment = left
 
-        # Borders for the row
-        for col in range(1, len(headers) + 1):
-            ws.cell(row=row, column=col).border = box
+@login_required
+@never_cache
+@use_replica
+def aging_report_xlsx(request):
+    as_of = _as_of_date(request)
+    if as_of is None:
+        return HttpResponseBadRequest("Invalid as_of date")
+    rows, totals = aging.aging_report(request.user, as_of)
 
-        total_debit += float(t.debit_amount)
-        total_credit += float(t.credit_amount)
-        row += 1
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Aging"
+    bucket_keys = [key for key, _ in aging.BUCKETS]
+    headers = ["Debtor_ID", "Name", "Mobile", "Oldest Unpaid", "Days"]
+    headers += [label for _, label in aging.BUCKETS] + ["Outstanding"]
+    _style_worksheet_header(ws, headers)
+
+    for row in rows:
+        ws.append(
+            [row['debtor_id'], row['name'], row['mobile'], row['oldest_unpaid'], row['days_outstanding']]
+            + [float(row[key]) for key in bucket_keys]
+            + [float(row['outstanding'])]
+        )
+    ws.append(
+        ["Total", "", "", "", ""]
+        + [float(totals[key]) for key in bucket_keys]
+        + [float(totals['outstanding'])]
+    )
 
-    # Totals row
-    ws.cell(row=row, column=3, value="Totals:").font = header_font
-    ws.cell(row=row, column=3).alignment = Alignment(horizontal="right", vertical="center")
-    ws.cell(row=row, column=4, value=total_debit).number_format = "#,##0.00"; ws.cell(row=row, column=4).alignment = center
-    ws.cell(row=row, column=5, value=total_credit).number_format = "#,##0.00"; ws.cell(row=row, column=5).alignment = center
-    for col in range(1, len(headers) + 1):
-        ws.cell(row=row, column=col).border = box
+    money_from = len(headers) - len(bucket_keys)
+    for cells in ws.iter_rows(min_row=2):
+        cells[3].number_format = 'yyyy-mm-dd'
+        for cell in cells[money_from:]:
+            cell.number_format = '#,##0.00'
+    for cell in ws[ws.max_row]:
+        cell.font = Font(bold=True)
 
-    # Column widths
-    widths = [14, 18, 10, 14, 14, 14, 16, 14, 40]
-    for i, w in enumerate(widths, start=1):
-        ws.column_dimensions[get_column_letter(i)].width = w
+    response = _create_excel_response(f"aging_{as_of:%Y%m%d}")
+    wb.save(response)
+    return response
 
-    # Response (no date/time in filename)
-    filename = f"transactions-{debtor.debtor_id}.xlsx"
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+
+# =========================
+# Installments Due (User)
+# =========================
+INSTALLMENT_REPORT_ROWS = 500
+
+
+@login_required
+@never_cache
+@use_replica
+def installments_report(request):
+    as_of = _as_of_date(request)
+    if as_of is None:
+        return HttpResponseBadRequest("Invalid as_of date")
+
+    until = as_of + timedelta(days=plans.DUE_SOON_DAYS - 1)
+    overdue = plans.overdue(as_of, creditor=request.user).select_related('debtor')
+    due_soon = plans.due_between(as_of, until, creditor=request.user).select_related('debtor')
+    return render(request, 'installments_report.html', {
+        'as_of': as_of,
+        'until': until,
+        'overdue': overdue[:INSTALLMENT_REPORT_ROWS],
+        'overdue_total': overdue.aggregate(
+            count=Count('id'), amount=Coalesce(Sum(F('amount') - F('paid_amount')), ZERO),
+        ),
+        'due_soon': due_soon[:INSTALLMENT_REPORT_ROWS],
+        'due_soon_total': due_soon.aggregate(
+            count=Count('id'), amount=Coalesce(Sum(F('amount') - F('paid_amount')), ZERO),
+        ),
+        'max_rows': INSTALLMENT_REPORT_ROWS,
+    })
+
+
+# =========================
+# Recovery Forecast (User)
+# =========================
+FORECAST_PAGE_ROWS = 200
+
+
+def _forecast_horizon(request):
+    """Horizon from ?weeks=, capped; None if malformed."""
+    try:
+        weeks = int(request.GET.get('weeks', forecast.HORIZON_WEEKS))
+    except ValueError:
+        return None
+    return min(max(weeks, 1), forecast.MAX_HORIZON_WEEKS)
+
+
+@login_required
+@never_cache
+@use_replica
+def forecast_report(request):
+    weeks = _forecast_horizon(request)
+    if weeks is None:
+        return HttpResponseBadRequest("Invalid weeks")
+
+    started = perf_counter()
+    result = forecast.forecast_book(request.user, horizon_weeks=weeks)
+    took_ms = round((perf_counter() - started) * 1000, 1)
+
+    return render(request, 'forecast_report.html', {
+        'result': result,
+        'debtors': result['debtors'][:FORECAST_PAGE_ROWS],
+        'truncated': len(result['debtors']) > FORECAST_PAGE_ROWS,
+        'weeks': weeks,
+        'took_ms': took_ms,
+    })
+
+
+@login_required
+@never_cache
+@use_replica
+def forecast_report_xlsx(request):
+    weeks = _forecast_horizon(request)
+    if weeks is None:
+        return HttpResponseBadRequest("Invalid weeks")
+    result = forecast.forecast_book(request.user, horizon_weeks=weeks)
+
+    # write-only: the debtor sheet can have one row per debtor of a large book
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Weekly Cash")
+    ws.append(["Week Starting", "Expected Cash"])
+    for week_start, amount in result['weeks']:
+        ws.append([week_start, amount])
+    ws.append(["Total", result['totals']['expected_cash']])
+
+    ws = wb.create_sheet("Debtors")
+    ws.append([
+        "Debtor_ID", "Name", "Mobile", "Balance", "Payments", "Avg Payment", "Interval (days)",
+        "Last Payment", "Next Payment", "Payments Left", "Payoff Date", "Status",
+    ])
+    for d in result['debtors']:
+        ws.append([
+            d['debtor_id'], d['name'], d['mobile'], d['balance'], d['payments'], d['avg_payment'],
+            d['interval_days'], d['last_payment'], d['next_payment'], d['payments_left'],
+            d['payoff_date'], d['status'],
+        ])
+
+    response = _create_excel_response(f"forecast_{result['as_of']:%Y%m%d}")
     wb.save(response)
     return response
 
@@ -815,46 +1242,57 @@ def debtor_transactions_xls(request):
 # =========================
 # Admin Dashboard
 # =========================
-def admin_dashboard(request):
-    # Fetch all users (admins and regular users)
-    # Total
-    users = CustomUser.objects.all()
-    debtors = Debtor.objects.all()
-    trans = Transaction.objects.all()
-
-    # Total Counts
-    total_user_count = CustomUser.objects.count()
-    total_debtor_count = Debtor.objects.count()
-    total_transaction_count = Transaction.objects.count()
-
-    # Debtors per user
-    user_with_debtor_count = (
-        CustomUser.objects.annotate(
-            debtor_count=Count("debtors", filter=Q(debtors__is_delete=False))
-        )
-        .values_list("username", "debtor_count").order_by("username")
+def _debtor_counts(active_only):
+    """{creditor id: number of debtors} on the active shard."""
+    debtors = Debtor.objects.filter(is_delete=False) if active_only else Debtor.objects.all()
+    return dict(debtors.order_by().values_list('created_by').annotate(count=Count('id')))
+
+
+def _admin_shard_summary():
+    debtors = list(
+        Debtor.objects
+        .select_related("created_by")
+        .annotate(txn_count=Count("transactions") + Coalesce("transaction_archive__row_count", 0))
     )
+    return {
+        'debtors': debtors,
+        'active_debtors': _debtor_counts(True),
+        'transactions': Transaction.objects.count() + (
+            TransactionArchive.objects.aggregate(rows=Sum('row_count'))['rows'] or 0
+        ),
+    }
+
 
-    # Transactions Per Debtor
-    debtor_with_txn = (
-        Debtor.objects.filter(is_delete=False)
-        .annotate(txn_count=Count("transactions"))
-        .values_list("debtor_id", "txn_count").order_by("debtor_id")
+@use_replica
+async def admin_dashboard(request):
+    # Users are on the directory database, everything else on the shards,
+    # which are read in parallel
+    total_user_count, users, shards = await asyncio.gather(
+        CustomUser.objects.acount(),
+        _alist(CustomUser.objects.all()),
+        sharding.afan_out(_admin_shard_summary),
     )
 
+    debtors, active_debtors, total_transaction_count = [], Counter(), 0
+    for alias, summary in shards:
+        for debtor in summary['debtors']:
+            debtor.shard = alias if sharding.enabled() else ''
+        debtors += summary['debtors']
+        active_debtors.update(summary['active_debtors'])
+        total_transaction_count += summary['transactions']
+    for user in users:
+        user.active_debtors = active_debtors[user.pk]
+
     context = {
         'users': users,
         'debtors': debtors,
-        'transactions': trans,
         # total Number counts
         'total_user_count': total_user_count,
-        'total_debtor_count': total_debtor_count,
+        'total_debtor_count': len(debtors),
         'total_transaction_count': total_transaction_count,
-        'user_with_debtor_count': user_with_debtor_count,
-        'debtor_with_txn': debtor_with_txn
     }
 
-    return render(request, 'admin1180/admin_dashboard.html', context)
+    return await _arender(request, 'admin1180/admin_dashboard.html', context)
 
 
 # =========================
@@ -869,12 +1307,13 @@ def admin_creditor_detail(request, pk):
     creditor = get_object_or_404(User, pk=pk)
 
     # list this user's active (non-deleted) debtors + txn counts
-    debtors = (
-        Debtor.objects
-        .filter(created_by=creditor, is_delete=False)
-        .annotate(txn_count=Count("transactions"))
-        .order_by("debtor_id")
-    )
+    with using_shard(sharding.shard_for(creditor)):
+        debtors = list(
+            Debtor.objects
+            .filter(created_by=creditor, is_delete=False)
+            .annotate(txn_count=Count("transactions") + Coalesce("transaction_archive__row_count", 0))
+            .order_by("debtor_id")
+        )
 
     return render(
         request,
@@ -890,18 +1329,20 @@ def admin_creditor_detail(request, pk):
 @never_cache
 def admin_debtor_detail(request, pk):
     # Admins can see any debtor; non-admins can only see their own
-    base_qs = Debtor.objects.select_related("created_by").filter(is_delete=False)
+    def base_qs():
+        return Debtor.objects.select_related("created_by").filter(is_delete=False)
 
     if request.user.is_staff or request.user.is_superuser:
-        debtor = get_object_or_404(base_qs, pk=pk)
+        # Debtor ids are per shard: the link says which, else take the first that has it
+        shard = sharding.requested(request) or sharding.find(lambda: base_qs().filter(pk=pk))
+        if shard is None:
+            raise Http404("No Debtor matches the given query.")
+        with using_shard(shard):
+            debtor = get_object_or_404(base_qs(), pk=pk)
+            transactions = archive.transactions_for(debtor)  # oldest first
     else:
-        debtor = get_object_or_404(base_qs, pk=pk, created_by=request.user)
-
-    transactions = (
-        Transaction.objects
-        .filter(debtor=debtor)
-        .order_by("tran_date")  # or "-tran_date" if you prefer recent first
-    )
+        debtor = get_object_or_404(base_qs(), pk=pk, created_by=request.user)
+        transactions = archive.transactions_for(debtor)  # oldest first
 
     return render(
         request,
@@ -950,7 +1391,9 @@ def reports_dashboard(request):
         'title': 'Reports Dashboard',
         'total_users': User.objects.count(),
         'total_debtors': Debtor.objects.filter(is_delete=False).count(),
-        'total_transactions': Transaction.objects.count(),
+        'total_transactions': Transaction.objects.count() + (
+            TransactionArchive.objects.aggregate(rows=Sum('row_count'))['rows'] or 0
+        ),
         'total_debt': total_debt,
         'debtors': Debtor.objects.filter(is_delete=False).order_by('name'),
     }
@@ -961,13 +1404,15 @@ def reports_dashboard(request):
 # =========================
 # Helpers for Admin Excel Exports
 # =========================
-def _create_excel_response(filename_prefix: str) -> HttpResponse:
-    """Create HttpResponse for Excel file download"""
-    timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+def _create_excel_response(filename_prefix: str, timestamped: bool = True) -> HttpResponse:
+    """Create HttpResponse for Excel file download (cached exports are not timestamped)"""
+    filename = filename_prefix
+    if timestamped:
+        filename += timezone.now().strftime('_%Y%m%d_%H%M%S')
     response = HttpResponse(
         content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     )
-    response['Content-Disposition'] = f'attachment; filename="{filename_prefix}_{timestamp}.xlsx"'
+    response['Content-Disposition'] = f'attachment; filename="{filename}.xlsx"'
     return response
 
 
@@ -1011,7 +1456,8 @@ def _convert_to_excel_format(value):
 # Admin Exports: All Users
 # =========================
 @staff_member_required
-@never_cache
+@use_replica
+@export_cache.cached('export_all_users')
 def export_all_users_xlsx(request):
     """Export all users to Excel file"""
     User = get_user_model()
@@ -1028,12 +1474,11 @@ def export_all_users_xlsx(request):
 
     _style_worksheet_header(worksheet, headers)
 
-    users_queryset = (
-        User.objects
-        .annotate(debtor_count=Count('debtors'))
-        .select_related()
-        .order_by('id')
-    )
+    users_queryset = User.objects.order_by('id')
+    # Debtors are counted on every shard; users are on the directory database
+    debtor_counts = Counter()
+    for _, counts in sharding.fan_out(_debtor_counts, False):
+        debtor_counts.update(counts)
 
     for user in users_queryset:
         row_data = [
@@ -1045,13 +1490,13 @@ def export_all_users_xlsx(request):
             getattr(user, 'address', '') or '',
             user.date_joined, user.last_login,
             user.is_active, user.is_staff, user.is_superuser,
-            user.debtor_count,
+            debtor_counts[user.id],
         ]
 
         excel_row = [_convert_to_excel_format(value) for value in row_data]
         worksheet.append(excel_row)
 
-    response = _create_excel_response("all_users")
+    response = _create_excel_response("all_users", timestamped=False)
     workbook.save(response)
     return response
 
@@ -1060,7 +1505,8 @@ def export_all_users_xlsx(request):
 # Admin Exports: All Debtors
 # =========================
 @staff_member_required
-@never_cache
+@use_replica
+@export_cache.cached('export_all_debtors')
 def export_all_debtors_xlsx(request):
     """Export all debtors to Excel file"""
     workbook = Workbook()
@@ -1076,14 +1522,17 @@ def export_all_debtors_xlsx(request):
 
     _style_worksheet_header(worksheet, headers)
 
-    debtors_queryset = (
-        Debtor.objects
-        .select_related('created_by')
-        .filter(is_delete=False)
-        .order_by('id')
-    )
+    def debtors_queryset():
+        return (
+            Debtor.objects
+            .select_related('created_by')
+            .filter(is_delete=False)
+            .order_by('id')
+            .iterator(chunk_size=2000)
+        )
 
-    for debtor in debtors_queryset:
+    # Shard after shard, all of them read in parallel
+    for debtor in sharding.merged(debtors_queryset):
         row_data = [
             debtor.debtor_id, debtor.name, debtor.mobile,
             debtor.address, debtor.debtor_status,
@@ -1098,7 +1547,7 @@ def export_all_debtors_xlsx(request):
         excel_row = [_convert_to_excel_format(value) for value in row_data]
         worksheet.append(excel_row)
 
-    response = _create_excel_response("all_debtors")
+    response = _create_excel_response("all_debtors", timestamped=False)
     workbook.save(response)
     return response
 
@@ -1107,7 +1556,8 @@ def export_all_debtors_xlsx(request):
 # Admin Exports: All Transactions
 # =========================
 @staff_member_required
-@never_cache
+@use_replica
+@export_cache.cached('export_all_transactions')
 def export_all_transactions_xlsx(request):
     """Export all transactions from all debtors"""
     workbook = Workbook()
@@ -1123,13 +1573,23 @@ def export_all_transactions_xlsx(request):
 
     _style_worksheet_header(worksheet, headers)
 
-    transactions_queryset = (
-        Transaction.objects
-        .select_related('debtor', 'recorded_by')
-        .order_by('-tran_date')
-    )
+    def transactions_queryset():
+        return (
+            Transaction.objects
+            .select_related('debtor', 'recorded_by')
+            .order_by('-tran_date')
+            .iterator(chunk_size=2000)
+        )
 
-    for transaction in transactions_queryset:
+    # The shards are read in parallel and merged newest first. Archived
+    # ledgers are older than the live rows around them, so they go last.
+    transactions = chain(
+        sharding.merged(transactions_queryset, key=attrgetter('tran_date'), reverse=True),
+        sharding.merged(archive.all_archived_transactions),
+    )
+    total_transactions = 0
+    for transaction in transactions:
+        total_transactions += 1
         row_data = [
             transaction.tran_id,
             transaction.debtor.debtor_id,
@@ -1151,44 +1611,47 @@ def export_all_transactions_xlsx(request):
 
     # Add summary
     last_row = worksheet.max_row + 2
-    worksheet[f'A{last_row}'] = f"Total Transactions: {transactions_queryset.count()}"
+    worksheet[f'A{last_row}'] = f"Total Transactions: {total_transactions}"
     worksheet[f'A{last_row}'].font = Font(bold=True)
-    worksheet[f'A{last_row + 1}'] = f"Report Generated: {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}"
 
-    response = _create_excel_response("all_transactions")
+    response = _create_excel_response("all_transactions", timestamped=False)
     workbook.save(response)
     return response
 
 
+# =========================
+# Admin Exports: CSV Dumps
+# =========================
+@staff_member_required
+@never_cache
+@use_replica
+def export_dump_csv(request, name, compress=False):
+    """Stream one of the CSV dumps (users, debtors, transactions, summaries), optionally gzipped"""
+    if name not in dumps.COLUMNS:
+        raise Http404("Unknown export")
+
+    chunks = dumps.streamed(dumps.dump(name, compress), asynchronous=isinstance(request, ASGIRequest))
+    response = StreamingHttpResponse(chunks, content_type='application/gzip' if compress else 'text/csv')
+    timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+    extension = 'csv.gz' if compress else 'csv'
+    response['Content-Disposition'] = f'attachment; filename="all_{name}_{timestamp}.{extension}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
-    # Debtors Summary Sheet
-    debtors_sheet = workbook.create_sheet("Debtors Summary")
-    debtors_headers = [
-        "Debtor Name", "Mobile", "Status", "Total Debt", "Created By", "Debt Date"
-    ]
-
-    _style_worksheet_header(debtors_sheet, debtors_headers)
-
-    debtors_summary = (
-        Debtor.objects
-        .select_related('created_by')
-        .filter(is_delete=False)
-        .order_by('-total_debt', 'name')
-    )
-
-    for debtor in debtors_summary:
-        row_data = [
-            debtor.name, debtor.mobile, debtor.debtor_status,
-            debtor.total_debt,
-            debtor.created_by.username if debtor.created_by else '',
-            debtor.debt_date,
-        ]
-
-        excel_row = [_convert_to_excel_format(value) for value in row_data]
-        debtors_sheet.append(excel_row)
 
-    response = _create_excel_response("summary_report")
-    workbook.save(response)
+# =========================
+# Admin Export: Full Backup
+# =========================
+@staff_member_required
+@never_cache
+@use_replica
+def export_full_backup(request):
+    """Stream every dump and summary as gzipped CSVs in one ZIP, built in parallel"""
+    chunks = dumps.streamed(backup.zip_chunks(), asynchronous=isinstance(request, ASGIRequest))
+    response = StreamingHttpResponse(chunks, content_type='application/zip')
+    timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+    response['Content-Disposition'] = f'attachment; filename="full_backup_{timestamp}.zip"'
+    response['X-Accel-Buffering'] = 'no'
     return response
 
 
@@ -1197,23 +1660,32 @@ def export_all_transactions_xlsx(request):
 # =========================
 @staff_member_required
 @never_cache
+@use_replica
 def export_debtor_transactions_xlsx(request):
     """Export transactions for a specific debtor"""
     debtor_id = request.GET.get('debtor_id')
 
     if not debtor_id:
         # Return list of debtors for selection
-        debtors = Debtor.objects.filter(is_delete=False).order_by('name')
+        debtors = list(sharding.merged(
+            lambda: Debtor.objects.filter(is_delete=False).order_by('name'), key=attrgetter('name'),
+        ))
         context = {
             'debtors': debtors,
             'title': 'Select Debtor for Transaction Export'
         }
         return render(request, 'admin/reports_dashboard.html', context)
 
-    try:
-        debtor = Debtor.objects.get(id=debtor_id, is_delete=False)
-    except Debtor.DoesNotExist:
-        return HttpResponse("Invalid debtor selected", status=400)
+    # Debtor ids are per shard: ?shard= says which, else take the first that has it
+    shard = sharding.requested(request) or sharding.find(
+        lambda: Debtor.objects.filter(id=debtor_id, is_delete=False)
+    )
+    with using_shard(shard):
+        try:
+            debtor = Debtor.objects.get(id=debtor_id, is_delete=False)
+        except Debtor.DoesNotExist:
+            return HttpResponse("Invalid debtor selected", status=400)
+        transactions = archive.transactions_for(debtor)[::-1]  # newest first
 
     workbook = Workbook()
     worksheet = workbook.active
@@ -1233,14 +1705,7 @@ def export_debtor_transactions_xlsx(request):
     worksheet['A1'].font = Font(bold=True, size=14)
     worksheet.merge_cells('A1:K1')
 
-    transactions_queryset = (
-        Transaction.objects
-        .filter(debtor=debtor)
-        .select_related('recorded_by', 'debtor')
-        .order_by('-tran_date')
-    )
-
-    for transaction in transactions_queryset:
+    for transaction in transactions:
         row_data = [
             transaction.tran_id, debtor.name, transaction.tran_type,
             transaction.debit_amount, transaction.credit_amount,
@@ -1257,7 +1722,7 @@ def export_debtor_transactions_xlsx(request):
     last_row = worksheet.max_row + 2
     worksheet[f'A{last_row}'] = "Summary:"
     worksheet[f'A{last_row}'].font = Font(bold=True)
-    worksheet[f'A{last_row + 1}'] = f"Total Transactions: {transactions_queryset.count()}"
+    worksheet[f'A{last_row + 1}'] = f"Total Transactions: {len(transactions)}"
     worksheet[f'A{last_row + 2}'] = f"Current Debt: {debtor.total_debt}"
     worksheet[f'A{last_row + 3}'] = f"Report Generated: {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}"
 
@@ -0,0 +1,69 @@
+"""
+Write-only workbooks for the creditor reports.
+
+Cells of a write-only workbook go straight to the file as rows are appended,
+instead of staying in memory as a styled Cell each. Styling uses the named
+styles below, registered once per workbook: a cell refers to one by name,
+rather than carrying its own Font, Border and Alignment objects. Column
+widths are written before the first row, so they are either fixed or
+measured with ColumnWidths in a first read of the rows.
+"""
+from openpyxl import Workbook
+from openpyxl.cell import Cell
+from openpyxl.styles import DEFAULT_FONT, Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+MONEY = '#,##0.00'
+
+_thin = Side(border_style="thin", color="CCCCCC")
+_box = Border(left=_thin, right=_thin, top=_thin, bottom=_thin)
+_center = Alignment(horizontal="center", vertical="center")
+_left = Alignment(horizontal="left", vertical="center")
+
+STYLES = {
+    'report title': dict(font=Font(size=14, bold=True), alignment=_center),
+    'report header': dict(font=Font(bold=True), alignment=_center, fill=PatternFill("solid", fgColor="E8F4FF"), border=_box),
+    'report text': dict(alignment=_left, border=_box),
+    'report center': dict(alignment=_center, border=_box),
+    'report money': dict(alignment=_center, border=_box, number_format=MONEY),
+    'report date': dict(alignment=_center, border=_box, number_format='yyyy-mm-dd'),
+    'report total label': dict(font=Font(bold=True), alignment=Alignment(horizontal="right", vertical="center"), border=_box),
+    'report cell': dict(border=_box),
+}
+
+
+class ReportWorkbook(Workbook):
+    """Write-only workbook with the report styles registered."""
+
+    def __init__(self):
+        super().__init__(write_only=True)
+        self._style_arrays = {}
+        for name, attributes in STYLES.items():
+            # A named style without a font would get one with no name or size
+            style = NamedStyle(name=name, **{'font': DEFAULT_FONT, **attributes})
+            self.add_named_style(style)
+            self._style_arrays[name] = style.as_tuple()
+
+    def cell(self, ws, value, style):
+        # What `cell.style = name` does, minus looking the name up per cell
+        return Cell(ws, row=1, column=1, value=value, style_array=self._style_arrays[style])
+
+    def row(self, ws, values, styles):
+        """A row of cells for ws.append(), `styles` giving each value's style name."""
+        return [self.cell(ws, value, style) for value, style in zip(values, styles)]
+
+
+class ColumnWidths:
+    """Column widths fitted to the longest value seen, measured row by row."""
+
+    def __init__(self, headers):
+        self.lengths = [len(str(header)) for header in headers]
+
+    def add(self, values):
+        for index, value in enumerate(values):
+            if value is not None:
+                self.lengths[index] = max(self.lengths[index], len(str(value)))
+
+    def apply(self, ws, minimum=12, maximum=40):
+        for index, length in enumerate(self.lengths, start=1):
+            ws.column_dimensions[get_column_letter(index)].width = min(max(minimum, length + 2), maximum)
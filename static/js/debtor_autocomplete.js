@@ -0,0 +1,38 @@
+// Debtor picker: fills a <datalist> from the autocomplete endpoint while typing.
+// Usage: <input list="some-id" data-autocomplete-url="..."> <datalist id="some-id"></datalist>
+;(function () {
+  document.querySelectorAll('input[data-autocomplete-url]').forEach(function (input) {
+    const list = document.getElementById(input.getAttribute('list'))
+    let timer = null
+    let controller = null
+
+    input.addEventListener('input', function () {
+      clearTimeout(timer)
+      const term = input.value.trim()
+      if (!term) {
+        list.innerHTML = ''
+        return
+      }
+      timer = setTimeout(function () {
+        if (controller) controller.abort()
+        controller = new AbortController()
+        const url = new URL(input.dataset.autocompleteUrl, window.location.origin)
+        url.searchParams.set('q', term)
+        fetch(url, { credentials: 'same-origin', signal: controller.signal })
+          .then(function (response) {
+            return response.json()
+          })
+          .then(function (data) {
+            list.innerHTML = ''
+            data.results.forEach(function (debtor) {
+              const option = document.createElement('option')
+              option.value = debtor.debtor_id
+              option.label = debtor.name + ' (' + debtor.mobile + ')'
+              list.appendChild(option)
+            })
+          })
+          .catch(function () {})
+      }, 150)
+    })
+  })
+})()